@@ -24,10 +24,20 @@ class DjangoOscarEsConfig(OscarDashboardConfig):
         # pylint: disable=unused-import
         from . import signal_receivers
 
+        self.configure_backend()
         autodiscover_modules("es_formatters")
+        autodiscover_modules("es_rank_features")
         self.register_documents()
         self.patch_dashboard_config_urls()
 
+    def configure_backend(self):
+        from .settings import FAKE_BACKEND
+
+        if FAKE_BACKEND:
+            from .fake_backend import use_fake_backend
+
+            use_fake_backend()
+
     def register_documents(self):
         from .settings import get_product_document
 
@@ -0,0 +1,402 @@
+import platform
+import random
+import statistics
+import time
+
+from decimal import Decimal
+
+from elasticsearch_dsl.faceted_search import RangeFacet, TermsFacet
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.text import slugify
+
+from oscar.core.loading import get_class, get_model
+
+from .models import (
+    ProductElasticsearchSettings,
+    ProductFacet,
+    ProductFacetRangeOption,
+)
+from .settings import get_product_document
+
+AttributeOption = get_model("catalogue", "AttributeOption")
+AttributeOptionGroup = get_model("catalogue", "AttributeOptionGroup")
+Category = get_model("catalogue", "Category")
+Partner = get_model("partner", "Partner")
+Product = get_model("catalogue", "Product")
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+ProductCategory = get_model("catalogue", "ProductCategory")
+ProductClass = get_model("catalogue", "ProductClass")
+StockRecord = get_model("partner", "StockRecord")
+
+refresh_product_elasticsearch_settings = get_class(
+    "django_oscar_es.cache", "refresh_product_elasticsearch_settings"
+)
+
+
+class SyntheticCatalogue:
+    """
+    Generates a reproducible, synthetic Oscar catalogue. Products, attribute values,
+    stockrecords and facets are created with bulk_create, the product class,
+    attributes, option groups, categories and partner are saved one by one. As the
+    latter do fire signals, autosync is disabled while generating, so nothing is
+    indexed (and no mapping is synced) for the generated catalogue.
+    """
+
+    def __init__(
+        self,
+        products=1000,
+        variants=3,
+        parent_ratio=0.2,
+        attributes=8,
+        options_per_attribute=12,
+        root_categories=5,
+        categories_per_root=10,
+        facets=6,
+        seed=42,
+        prefix="bench",
+    ):
+        self.num_products = products
+        self.num_variants = variants
+        self.parent_ratio = parent_ratio
+        self.num_attributes = attributes
+        self.options_per_attribute = options_per_attribute
+        self.num_root_categories = root_categories
+        self.categories_per_root = categories_per_root
+        self.num_facets = facets
+        self.prefix = prefix
+        self.random = random.Random(seed)
+
+        self.product_class = None
+        self.attributes = []
+        self.options = {}
+        self.categories = []
+        self.products = []
+        self.facets = []
+
+    def generate(self):
+        with override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False):
+            self.product_class = ProductClass.objects.create(
+                name=f"{self.prefix} class", slug=f"{self.prefix}-class"
+            )
+            self.create_attributes()
+            self.create_categories()
+            self.create_products()
+            self.create_attribute_values()
+            self.create_stockrecords()
+            self.create_facets()
+        return self
+
+    def create_attributes(self):
+        types = [
+            ProductAttribute.OPTION,
+            ProductAttribute.TEXT,
+            ProductAttribute.INTEGER,
+            ProductAttribute.FLOAT,
+            ProductAttribute.BOOLEAN,
+        ]
+        for index in range(self.num_attributes):
+            attribute_type = types[index % len(types)]
+            option_group = None
+            if attribute_type == ProductAttribute.OPTION:
+                option_group = AttributeOptionGroup.objects.create(
+                    name=f"{self.prefix} options {index}"
+                )
+                self.options[index] = AttributeOption.objects.bulk_create(
+                    [
+                        AttributeOption(group=option_group, option=f"option-{i}")
+                        for i in range(self.options_per_attribute)
+                    ]
+                )
+            self.attributes.append(
+                ProductAttribute.objects.create(
+                    product_class=self.product_class,
+                    name=f"{self.prefix} attribute {index}",
+                    code=f"{self.prefix}_attr_{index}",
+                    type=attribute_type,
+                    option_group=option_group,
+                )
+            )
+
+    def create_categories(self):
+        for root_index in range(self.num_root_categories):
+            root = Category.add_root(name=f"{self.prefix} root {root_index}")
+            self.categories.append(root)
+            for child_index in range(self.categories_per_root):
+                self.categories.append(
+                    root.add_child(name=f"{self.prefix} {root_index}-{child_index}")
+                )
+
+    def create_products(self):
+        num_parents = int(self.num_products * self.parent_ratio)
+        parents = []
+        for index in range(self.num_products):
+            title = f"{self.prefix} product {index} {self.random.choice(WORDS)}"
+            parents.append(
+                Product(
+                    structure=(
+                        Product.PARENT if index < num_parents else Product.STANDALONE
+                    ),
+                    product_class=self.product_class,
+                    title=title,
+                    slug=slugify(title),
+                    upc=f"{self.prefix}-{index}",
+                    description=" ".join(self.random.choices(WORDS, k=40)),
+                    rating=round(self.random.uniform(0, 5), 1),
+                )
+            )
+        parents = Product.objects.bulk_create(parents)
+
+        children = []
+        for parent in parents[:num_parents]:
+            for variant in range(self.num_variants):
+                children.append(
+                    Product(
+                        structure=Product.CHILD,
+                        parent=parent,
+                        title=f"{parent.title} variant {variant}",
+                        slug=f"{parent.slug}-{variant}",
+                        upc=f"{parent.upc}-{variant}",
+                    )
+                )
+        self.products = parents + Product.objects.bulk_create(children)
+
+        ProductCategory.objects.bulk_create(
+            [
+                ProductCategory(
+                    product=product, category=self.random.choice(self.categories)
+                )
+                for product in parents
+            ]
+        )
+
+    def create_attribute_values(self):
+        values = []
+        for product in self.products:
+            for index, attribute in enumerate(self.attributes):
+                value = ProductAttributeValue(product=product, attribute=attribute)
+                if attribute.type == ProductAttribute.OPTION:
+                    value.value_option = self.random.choice(self.options[index])
+                elif attribute.type == ProductAttribute.TEXT:
+                    value.value_text = self.random.choice(WORDS)
+                elif attribute.type == ProductAttribute.INTEGER:
+                    value.value_integer = self.random.randint(0, 100)
+                elif attribute.type == ProductAttribute.FLOAT:
+                    value.value_float = self.random.uniform(0, 100)
+                elif attribute.type == ProductAttribute.BOOLEAN:
+                    value.value_boolean = self.random.random() > 0.5
+                values.append(value)
+        ProductAttributeValue.objects.bulk_create(values, batch_size=1000)
+
+    def create_stockrecords(self):
+        partner = Partner.objects.create(name=f"{self.prefix} partner")
+        StockRecord.objects.bulk_create(
+            [
+                StockRecord(
+                    partner=partner,
+                    product=product,
+                    partner_sku=f"{self.prefix}-sku-{product.pk}",
+                    price_currency="EUR",
+                    price=Decimal(self.random.randint(100, 50000)) / 100,
+                    num_in_stock=self.random.randint(0, 50),
+                )
+                for product in self.products
+                if not product.is_parent
+            ],
+            batch_size=1000,
+        )
+
+    def create_facets(self):
+        settings = ProductElasticsearchSettings.load()
+        fields = [f"attributes.{attribute.code}" for attribute in self.attributes]
+        facets = [
+            ProductFacet(
+                settings=settings,
+                field=field,
+                facet_type=ProductFacet.FACET_TYPE_TERM,
+                order=order,
+            )
+            for order, field in enumerate(fields[: max(self.num_facets - 1, 0)])
+        ]
+        price_facet = ProductFacet(
+            settings=settings,
+            field="price",
+            facet_type=ProductFacet.FACET_TYPE_RANGE,
+            order=len(facets),
+        )
+        self.facets = ProductFacet.objects.bulk_create(facets + [price_facet])
+        ProductFacetRangeOption.objects.bulk_create(
+            [
+                ProductFacetRangeOption(
+                    facet=self.facets[-1],
+                    label=f"{start} - {start + 100}",
+                    range_type=ProductFacetRangeOption.RANGE_TYPE_INTEGER,
+                    from_value=str(start),
+                    to_value=str(start + 100),
+                )
+                for start in range(0, 500, 100)
+            ]
+        )
+        # The facets were created with bulk_create, so the signals didn't clear the cache.
+        refresh_product_elasticsearch_settings()
+
+    def get_dsl_facets(self):
+        dsl_facets = {}
+        for facet in ProductFacet.objects.prefetch_related("range_options"):
+            if facet.facet_type == ProductFacet.FACET_TYPE_RANGE:
+                dsl_facets[facet.field] = RangeFacet(
+                    field=facet.field,
+                    ranges=[
+                        (
+                            option.label,
+                            (option.get_from_value(), option.get_to_value()),
+                        )
+                        for option in facet.range_options.all()
+                    ],
+                )
+            else:
+                dsl_facets[facet.field] = TermsFacet(field=facet.field, size=facet.size)
+        return dsl_facets
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "runs": len(timings),
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000,
+        "min_ms": timings[0] * 1000,
+        "max_ms": timings[-1] * 1000,
+    }
+
+
+def time_calls(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+class CatalogueBenchmark:
+    """
+    Runs the benchmarks against a generated catalogue. All Elasticsearch traffic is
+    expected to go to an in-process stub (see django_oscar_es.stub_transport).
+    """
+
+    def __init__(self, catalogue, repeat=20):
+        self.catalogue = catalogue
+        self.repeat = repeat
+
+    def run(self):
+        return {
+            "meta": {
+                "timestamp": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "repeat": self.repeat,
+                "products": len(self.catalogue.products),
+                "attributes": len(self.catalogue.attributes),
+                "categories": len(self.catalogue.categories),
+                "facets": len(self.catalogue.facets),
+            },
+            "results": {
+                "document_prepare": self.bench_document_prepare(),
+                "document_bulk_index": self.bench_document_bulk_index(),
+                "load_db_facets": self.bench_load_db_facets(),
+                "form_construction": self.bench_form_construction(),
+                "dsl_build": self.bench_dsl_build(),
+            },
+        }
+
+    def bench_document_prepare(self):
+        document = get_product_document()()
+        started = time.perf_counter()
+        count = 0
+        for instance in document.get_queryset().iterator(chunk_size=500):
+            document.prepare(instance)
+            count += 1
+        duration = time.perf_counter() - started
+        return {
+            "documents": count,
+            "seconds": duration,
+            "documents_per_second": count / duration if duration else None,
+        }
+
+    def bench_document_bulk_index(self):
+        document = get_product_document()()
+        started = time.perf_counter()
+        document.update(document.get_queryset().iterator(chunk_size=500))
+        duration = time.perf_counter() - started
+        count = len(self.catalogue.products)
+        return {
+            "documents": count,
+            "seconds": duration,
+            "documents_per_second": count / duration if duration else None,
+        }
+
+    def get_form_class(self):
+        return get_class("django_oscar_es.forms", "ProductFacetedSearchForm")
+
+    def bench_load_db_facets(self):
+        form_class = self.get_form_class()
+        category = self.catalogue.categories[0]
+        form = form_class(data={}, category=category)
+        return time_calls(form.load_db_facets, self.repeat)
+
+    def bench_form_construction(self):
+        form_class = self.get_form_class()
+        category = self.catalogue.categories[0]
+        return {
+            "without_category": time_calls(lambda: form_class(data={}), self.repeat),
+            "with_category": time_calls(
+                lambda: form_class(data={}, category=category), self.repeat
+            ),
+        }
+
+    def bench_dsl_build(self):
+        faceted_search_class = get_class(
+            "django_oscar_es.faceted_search", "CatalogueFacetedSearch"
+        )
+        dsl_facets = self.catalogue.get_dsl_facets()
+        term_fields = [
+            facet.field
+            for facet in self.catalogue.facets
+            if facet.facet_type == ProductFacet.FACET_TYPE_TERM
+        ]
+        filters = {field: ["option-1"] for field in term_fields[:2]}
+
+        def build():
+            faceted_search = faceted_search_class(
+                dsl_facets, query="product", filters=filters
+            )
+            return faceted_search.build_search().to_dict()
+
+        return time_calls(build, self.repeat)
+
+
+WORDS = [
+    "cotton",
+    "shirt",
+    "blue",
+    "red",
+    "green",
+    "wool",
+    "jacket",
+    "summer",
+    "winter",
+    "classic",
+    "slim",
+    "regular",
+    "organic",
+    "linen",
+    "denim",
+    "leather",
+    "canvas",
+    "sneaker",
+    "boot",
+    "scarf",
+]
@@ -0,0 +1,243 @@
+import logging
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import ApiError, Elasticsearch, TransportError
+from elasticsearch.helpers import expand_action
+from elasticsearch_dsl.connections import connections
+
+from django.conf import settings as django_settings
+
+from . import metrics
+from .settings import (
+    BULK_COMPRESS,
+    BULK_INITIAL_BACKOFF,
+    BULK_INITIAL_BATCH_BYTES,
+    BULK_MAX_BACKOFF,
+    BULK_MAX_BATCH_BYTES,
+    BULK_MAX_IN_FLIGHT,
+    BULK_MAX_RETRIES,
+    BULK_MIN_BATCH_BYTES,
+    BULK_TARGET_LATENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+bulk_batch_bytes = metrics.metrics_registry.gauge(
+    "bulk_batch_bytes", "Current target size of an adaptive bulk request in bytes."
+)
+
+_compressed_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_bulk_client(using="default"):
+    """
+    Returns the client to send bulk requests with. With BULK_COMPRESS a separate
+    client with gzip compressed request bodies is created from the same
+    ELASTICSEARCH_DSL configuration.
+    """
+    if not BULK_COMPRESS:
+        return connections.get_connection(using)
+
+    with _clients_lock:
+        if using not in _compressed_clients:
+            config = dict(django_settings.ELASTICSEARCH_DSL[using])
+            config["http_compress"] = True
+            _compressed_clients[using] = Elasticsearch(**config)
+        return _compressed_clients[using]
+
+
+class BatchSizer:
+    """
+    Sizes bulk requests with additive increase / multiplicative decrease: the batch
+    grows while requests complete within the target latency, and is halved on
+    rejections or slow responses.
+    """
+
+    def __init__(
+        self,
+        initial=BULK_INITIAL_BATCH_BYTES,
+        minimum=BULK_MIN_BATCH_BYTES,
+        maximum=BULK_MAX_BATCH_BYTES,
+        target_latency=BULK_TARGET_LATENCY,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.batch_bytes = max(minimum, min(initial, maximum))
+        self.lock = threading.Lock()
+        bulk_batch_bytes.set(self.batch_bytes)
+
+    def record(self, latency, rejected):
+        with self.lock:
+            if rejected or latency > self.target_latency:
+                self.batch_bytes = max(self.minimum, self.batch_bytes // 2)
+            else:
+                self.batch_bytes = min(self.maximum, self.batch_bytes + self.minimum)
+            bulk_batch_bytes.set(self.batch_bytes)
+
+
+class AdaptiveBulkIndexer:
+    """
+    Sends actions through the bulk api in batches sized by bytes, with at most
+    `max_in_flight` concurrent requests. Items rejected with a 429, and whole
+    requests that are rejected (429 / 503) or fail to connect, are retried after a
+    backoff with full jitter.
+    """
+
+    retry_statuses = (429, 503)
+
+    def __init__(
+        self,
+        client,
+        sizer=None,
+        max_in_flight=BULK_MAX_IN_FLIGHT,
+        max_retries=BULK_MAX_RETRIES,
+        initial_backoff=BULK_INITIAL_BACKOFF,
+        max_backoff=BULK_MAX_BACKOFF,
+    ):
+        self.client = client
+        self.sizer = sizer or BatchSizer()
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.serializer = client.transport.serializers.get_serializer(
+            "application/json"
+        )
+
+    def encode(self, data):
+        line = self.serializer.dumps(data)
+        return line.encode("utf-8") if isinstance(line, str) else line
+
+    def serialize(self, action):
+        """
+        Returns the encoded lines of the action, so batches are sized by the bytes
+        that are actually sent.
+        """
+        action, data = expand_action(action)
+        lines = [self.encode(action)]
+        if data is not None:
+            lines.append(self.encode(data))
+        return lines
+
+    def iter_batches(self, actions):
+        batch, size = [], 0
+        for action in actions:
+            lines = self.serialize(action)
+            line_size = sum(len(line) + 1 for line in lines)
+            if batch and size + line_size > self.sizer.batch_bytes:
+                yield batch
+                batch, size = [], 0
+            batch.append(lines)
+            size += line_size
+        if batch:
+            yield batch
+
+    def get_backoff(self, attempt):
+        return random.uniform(
+            0, min(self.max_backoff, self.initial_backoff * 2**attempt)
+        )
+
+    def is_retryable(self, exc):
+        if isinstance(exc, ApiError):
+            return exc.meta.status in self.retry_statuses
+        # Connection errors and timeouts.
+        return isinstance(exc, TransportError)
+
+    def wait(self, attempt, reason):
+        backoff = self.get_backoff(attempt)
+        logger.info("%s, retrying in %.1f seconds", reason, backoff)
+        time.sleep(backoff)
+
+    def send(self, batch):
+        """
+        Sends a batch and returns (number of successful items, errors).
+        """
+        success, errors = 0, []
+        for attempt in range(self.max_retries + 1):
+            metrics.bulk_requests.inc()
+            metrics.bulk_size.observe(len(batch))
+            started = time.perf_counter()
+            try:
+                response = self.client.bulk(
+                    operations=[line for lines in batch for line in lines]
+                )
+            except (ApiError, TransportError) as e:
+                latency = time.perf_counter() - started
+                metrics.bulk_latency_seconds.observe(latency)
+                if not self.is_retryable(e) or attempt == self.max_retries:
+                    raise
+                self.sizer.record(latency, rejected=True)
+                metrics.bulk_retries.inc(len(batch))
+                self.wait(attempt, f"The bulk request failed ({e})")
+                continue
+
+            latency = time.perf_counter() - started
+            metrics.bulk_latency_seconds.observe(latency)
+
+            rejected = []
+            for lines, item in zip(batch, response["items"]):
+                [(op_type, result)] = item.items()
+                if result.get("status", 200) < 300:
+                    success += 1
+                elif result.get("status") == 429:
+                    metrics.bulk_rejections.inc(op_type=op_type)
+                    rejected.append((lines, item))
+                else:
+                    metrics.bulk_failures.inc(op_type=op_type)
+                    errors.append(item)
+
+            self.sizer.record(latency, bool(rejected))
+            if not rejected:
+                break
+
+            if attempt == self.max_retries:
+                for _, item in rejected:
+                    [op_type] = item.keys()
+                    metrics.bulk_failures.inc(op_type=op_type)
+                    errors.append(item)
+                break
+
+            metrics.bulk_retries.inc(len(rejected))
+            self.wait(attempt, f"{len(rejected)} bulk items were rejected")
+            batch = [lines for lines, _ in rejected]
+
+        return success, errors
+
+    def run(self, actions):
+        """
+        Indexes all actions and returns (number of successful items, errors), like
+        elasticsearch.helpers.bulk with raise_on_error=False.
+        """
+        success, errors = 0, []
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        failed = threading.Event()
+        futures = []
+
+        def release(future):
+            if future.exception() is not None:
+                failed.set()
+            slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            for batch in self.iter_batches(actions):
+                # Don't serialize more batches than can be sent at once.
+                slots.acquire()  # pylint: disable=consider-using-with
+                if failed.is_set():
+                    # A batch failed for good, stop sending the rest.
+                    slots.release()
+                    break
+                future = executor.submit(self.send, batch)
+                future.add_done_callback(release)
+                futures.append(future)
+
+        for future in futures:
+            batch_success, batch_errors = future.result()
+            success += batch_success
+            errors.extend(batch_errors)
+        return success, errors
@@ -1,13 +1,59 @@
+import time
+
 from django.core.cache import cache
 
 from .models import ProductElasticsearchSettings
+from .utils import on_commit_once
 
 PRODUCT_ELASTICSEARCH_SETTINGS_CACHE_KEY = "product_elasticsearch_settings"
+PRODUCT_ELASTICSEARCH_SETTINGS_VERSION_CACHE_KEY = (
+    "product_elasticsearch_settings_version"
+)
+
+
+def get_product_elasticsearch_settings_version():
+    version = cache.get(PRODUCT_ELASTICSEARCH_SETTINGS_VERSION_CACHE_KEY)
+    if version is None:
+        # Seeded with the current time rather than 1, so a version that was evicted
+        # doesn't start over and serve settings that are still cached for an old
+        # version.
+        cache.add(
+            PRODUCT_ELASTICSEARCH_SETTINGS_VERSION_CACHE_KEY,
+            int(time.time() * 1000),
+            timeout=None,
+        )
+        version = cache.get(PRODUCT_ELASTICSEARCH_SETTINGS_VERSION_CACHE_KEY)
+    return version
 
 
 def get_product_elasticsearch_settings():
-    settings = cache.get(PRODUCT_ELASTICSEARCH_SETTINGS_CACHE_KEY)
+    cache_key = "%s:%s" % (
+        PRODUCT_ELASTICSEARCH_SETTINGS_CACHE_KEY,
+        get_product_elasticsearch_settings_version(),
+    )
+    settings = cache.get(cache_key)
     if settings is None:
         settings = ProductElasticsearchSettings.load()
-        cache.set(PRODUCT_ELASTICSEARCH_SETTINGS_CACHE_KEY, settings)
+        cache.set(cache_key, settings)
     return settings
+
+
+def refresh_product_elasticsearch_settings():
+    """
+    Bumps the version of the cached settings and rebuilds them right away.
+    """
+    try:
+        cache.incr(PRODUCT_ELASTICSEARCH_SETTINGS_VERSION_CACHE_KEY)
+    except ValueError:
+        # The version doesn't exist (anymore), so there's nothing cached to bump.
+        pass
+    return get_product_elasticsearch_settings()
+
+
+def invalidate_product_elasticsearch_settings():
+    """
+    Refreshes the cached settings once, when the current transaction commits. No
+    matter how many facets or search fields are saved in a transaction, the
+    settings are only rebuilt once.
+    """
+    on_commit_once(refresh_product_elasticsearch_settings)
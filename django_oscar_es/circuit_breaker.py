@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+
+from collections import deque
+
+from elasticsearch import ApiError, TransportError
+
+from . import metrics
+from .settings import (
+    CIRCUIT_BREAKER_ERROR_RATE,
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES,
+    CIRCUIT_BREAKER_MIN_CALLS,
+    CIRCUIT_BREAKER_OPEN_DURATION,
+    CIRCUIT_BREAKER_SLOW_CALL_DURATION,
+    CIRCUIT_BREAKER_SLOW_RATE,
+    CIRCUIT_BREAKER_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half-open"
+OPEN = "open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Keeps track of the outcome and duration of the calls within a sliding window.
+    When the rate of failed or slow calls gets too high, the breaker opens and
+    calls fail right away with CircuitOpenError. After `open_duration` seconds it's
+    half-open, and lets `half_open_probes` calls through: the breaker closes when a
+    probe succeeds in time, and opens again otherwise.
+
+    The state is kept per process.
+    """
+
+    # Exceptions that count as a failed call, and can be served degraded.
+    failure_exceptions = (TransportError, ApiError)
+
+    def __init__(
+        self,
+        name,
+        window=CIRCUIT_BREAKER_WINDOW,
+        min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+        error_rate=CIRCUIT_BREAKER_ERROR_RATE,
+        slow_rate=CIRCUIT_BREAKER_SLOW_RATE,
+        slow_call_duration=CIRCUIT_BREAKER_SLOW_CALL_DURATION,
+        open_duration=CIRCUIT_BREAKER_OPEN_DURATION,
+        half_open_probes=CIRCUIT_BREAKER_HALF_OPEN_PROBES,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_call_duration = slow_call_duration
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+        # Returns the current time in seconds, replaceable in tests.
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        # (time, failed, slow) of the calls within the window.
+        self.calls = deque()
+        self.opened_at = None
+        self.probes = 0
+        self._state = CLOSED
+        metrics.circuit_breaker_state.set(0, breaker=name)
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._get_state(self.clock())
+
+    def _get_state(self, now):
+        if self._state == OPEN and now - self.opened_at >= self.open_duration:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state):
+        if state != self._state:
+            logger.warning("Circuit breaker %s is %s", self.name, state)
+        self._state = state
+        self.probes = 0
+        if state == OPEN:
+            self.opened_at = self.clock()
+        elif state == CLOSED:
+            self.calls.clear()
+        metrics.circuit_breaker_state.set(STATE_VALUES[state], breaker=self.name)
+
+    def is_failure(self, exc):
+        if isinstance(exc, ApiError):
+            # Bad requests are a bug, not a sign of an unhealthy cluster.
+            return exc.meta.status >= 500 or exc.meta.status == 429
+        return isinstance(exc, self.failure_exceptions)
+
+    def before_call(self):
+        """
+        Returns whether the call is a probe, raises CircuitOpenError when the call
+        is not allowed.
+        """
+        with self.lock:
+            state = self._get_state(self.clock())
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self.probes < self.half_open_probes:
+                self.probes += 1
+                return True
+        raise CircuitOpenError(f"Circuit breaker {self.name} is open")
+
+    def record(self, duration, failed, probe=False):
+        now = self.clock()
+        slow = duration >= self.slow_call_duration
+        with self.lock:
+            if probe:
+                self._set_state(OPEN if failed or slow else CLOSED)
+                return
+
+            self.calls.append((now, failed, slow))
+            while self.calls and now - self.calls[0][0] > self.window:
+                self.calls.popleft()
+
+            if self._state != CLOSED or len(self.calls) < self.min_calls:
+                return
+            num_failed = sum(1 for _, call_failed, _ in self.calls if call_failed)
+            num_slow = sum(1 for _, _, call_slow in self.calls if call_slow)
+            if (
+                num_failed / len(self.calls) >= self.error_rate
+                or num_slow / len(self.calls) >= self.slow_rate
+            ):
+                self._set_state(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        probe = self.before_call()
+        started = self.clock()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            if self.is_failure(exc):
+                self.record(self.clock() - started, True, probe)
+            elif probe:
+                # Let another probe decide.
+                with self.lock:
+                    self.probes = max(self.probes - 1, 0)
+            raise
+        self.record(self.clock() - started, False, probe)
+        return result
+
+    def reset(self):
+        with self.lock:
+            self._set_state(CLOSED)
+
+
+search_circuit_breaker = CircuitBreaker("search")
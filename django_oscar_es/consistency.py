@@ -0,0 +1,167 @@
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections as db_connections
+from django.db import models
+from django.utils.dateparse import parse_datetime
+
+from .scanning import point_in_time, scan_point_in_time
+from .settings import ADAPTIVE_BULK, PARTIAL_UPDATE_CHUNK_SIZE, get_product_document
+from .utils import chunked
+
+logger = logging.getLogger(__name__)
+
+
+class ConsistencyReport:
+    def __init__(self):
+        # In the database but not in the index.
+        self.missing = []
+        # In both, but the fingerprint of the document is outdated.
+        self.stale = []
+        # In the index but not in the database.
+        self.orphaned = []
+        self.checked = 0
+
+    def __bool__(self):
+        return bool(self.missing or self.stale or self.orphaned)
+
+    def merge(self, other):
+        self.missing.extend(other.missing)
+        self.stale.extend(other.stale)
+        self.orphaned.extend(other.orphaned)
+        self.checked += other.checked
+
+
+class ConsistencyChecker:
+    """
+    Compares a cheap fingerprint (id, date_updated and stock_updated) of every
+    product in the database with the indexed documents. The products are split in
+    primary key ranges which are checked in parallel, the index is read from a
+    single point in time with search_after.
+    """
+
+    def __init__(self, chunk_size=5000, workers=4, using="default"):
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.using = using
+        self.document = get_product_document()()
+
+    def get_queryset(self):
+        return self.document.django.model.objects.all()
+
+    def get_ranges(self):
+        """
+        Returns (exclusive lower bound, inclusive upper bound) primary key ranges of
+        `chunk_size` products. The first and last range are unbounded, so documents
+        outside of the primary keys in the database are checked as well.
+        """
+        pks = self.get_queryset().order_by("pk").values_list("pk", flat=True)
+        bounds = [
+            pk
+            for position, pk in enumerate(pks.iterator(), start=1)
+            if position % self.chunk_size == 0
+        ]
+        lower_bounds = [None] + bounds
+        upper_bounds = bounds + [None]
+        return list(zip(lower_bounds, upper_bounds))
+
+    def filter_range(self, queryset, lower, upper):
+        if lower is not None:
+            queryset = queryset.filter(pk__gt=lower)
+        if upper is not None:
+            queryset = queryset.filter(pk__lte=upper)
+        return queryset
+
+    def get_database_fingerprints(self, lower, upper):
+        Product = self.document.django.model
+        queryset = self.filter_range(self.get_queryset(), lower, upper).annotate(
+            own_stock_updated=models.Max("stockrecords__date_updated"),
+            children_stock_updated=models.Max("children__stockrecords__date_updated"),
+        )
+        fingerprints = {}
+        for pk, structure, date_updated, own, children in queryset.values_list(
+            "pk",
+            "structure",
+            "date_updated",
+            "own_stock_updated",
+            "children_stock_updated",
+        ):
+            stock_updated = children if structure == Product.PARENT else own
+            fingerprints[pk] = (date_updated, stock_updated)
+        return fingerprints
+
+    def get_index_fingerprints(self, pit_id, lower, upper):
+        id_range = {}
+        if lower is not None:
+            id_range["gt"] = lower
+        if upper is not None:
+            id_range["lte"] = upper
+        query = {"range": {"id": id_range}} if id_range else None
+
+        fingerprints = {}
+        for hit in scan_point_in_time(
+            pit_id,
+            sort=[{"id": "asc"}],
+            query=query,
+            source=["date_updated", "stock_updated"],
+            using=self.using,
+        ):
+            source = hit.get("_source", {})
+            fingerprints[hit["sort"][0]] = (
+                self.parse_date(source.get("date_updated")),
+                self.parse_date(source.get("stock_updated")),
+            )
+        return fingerprints
+
+    def parse_date(self, value):
+        return parse_datetime(value) if value else None
+
+    def check_range(self, pit_id, lower, upper):
+        try:
+            database = self.get_database_fingerprints(lower, upper)
+            index = self.get_index_fingerprints(pit_id, lower, upper)
+        finally:
+            # Runs in a worker thread, which has its own database connection.
+            db_connections.close_all()
+
+        report = ConsistencyReport()
+        report.checked = len(database)
+        for pk, fingerprint in database.items():
+            if pk not in index:
+                report.missing.append(pk)
+            elif index[pk] != fingerprint:
+                report.stale.append(pk)
+        report.orphaned = [pk for pk in index if pk not in database]
+        return report
+
+    def run(self, callback=None):
+        report = ConsistencyReport()
+        ranges = self.get_ranges()
+        with point_in_time(self.document._index._name, using=self.using) as pit_id:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for range_report in executor.map(
+                    lambda bounds: self.check_range(pit_id, *bounds), ranges
+                ):
+                    report.merge(range_report)
+                    if callback:
+                        callback(report, len(ranges))
+        return report
+
+    def repair(self, report):
+        """
+        Indexes the missing and stale products and deletes the orphaned documents.
+        """
+        reindex_ids = sorted(report.missing + report.stale)
+        for chunk in chunked(reindex_ids, PARTIAL_UPDATE_CHUNK_SIZE):
+            self.document.update(
+                self.document.get_queryset().filter(pk__in=chunk),
+                adaptive=ADAPTIVE_BULK,
+            )
+        for chunk in chunked(sorted(report.orphaned), PARTIAL_UPDATE_CHUNK_SIZE):
+            self.document.delete_by_ids(chunk)
+        logger.info(
+            "Reindexed %s and deleted %s documents",
+            len(reindex_ids),
+            len(report.orphaned),
+        )
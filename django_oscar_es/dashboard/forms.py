@@ -22,9 +22,9 @@ class ProductSearchFieldForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields["field"].choices = [
-            ("", "")
-        ] + ProductSearchField.get_field_choices()
+        self.fields["field"].choices = [("", "")] + list(
+            ProductSearchField.get_field_choices()
+        )
 
 
 ProductSearchFieldFormSet = inlineformset_factory(
@@ -72,6 +72,8 @@ class ProductFacetedSearchForm(forms.ModelForm):
             "facet_type",
             "size",
             "formatter",
+            "lazy",
+            "approximate",
             "enabled_categories",
             "disabled_categories",
             "order",
@@ -82,7 +84,9 @@ class ProductFacetedSearchForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields["field"].choices = [("", "")] + ProductFacet.get_field_choices()
+        self.fields["field"].choices = [("", "")] + list(
+            ProductFacet.get_field_choices()
+        )
         self.fields["formatter"].choices = ProductFacet.get_formatter_choices()
 
         # Only root categories are allowed to be chosen, otherwise the queries to get the allowed facets
@@ -112,6 +116,19 @@ ProductFacetedSearchFormSet = inlineformset_factory(
 )
 
 
+class FacetCostPreviewForm(forms.Form):
+    category = forms.ModelChoiceField(
+        queryset=Category.objects.all(),
+        required=False,
+        empty_label="All products",
+        help_text="A representative category to run the preview on.",
+    )
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("prefix", "preview")
+        super().__init__(*args, **kwargs)
+
+
 class ProductFacetRangeOptionForm(forms.ModelForm):
     class Meta:
         model = ProductFacetRangeOption
@@ -1,16 +1,24 @@
+import logging
+
+from elasticsearch import ApiError, TransportError
+
 from django.db import transaction
 from django.contrib import messages
 from django.views.generic import TemplateView
 from django.shortcuts import redirect
 
+from ..facet_costs import FacetCostPreview
 from ..models import ProductElasticsearchSettings
 
 from .forms import (
+    FacetCostPreviewForm,
     ProductSearchFieldFormSet,
     ProductFacetedSearchFormSet,
     ProductFacetRangeOptionFormSet,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class ProductElasticsearchSettingsView(TemplateView):
     template_name = "django_oscar_es/dashboard/product_elasticsearch_settings.html"
@@ -25,8 +33,47 @@ class ProductElasticsearchSettingsView(TemplateView):
         if "facets_formset" not in ctx:
             ctx["facets_formset"] = ProductFacetedSearchFormSet(instance=settings)
 
+        if "preview_form" not in ctx:
+            ctx["preview_form"] = FacetCostPreviewForm()
+
         return ctx
 
+    def get_pending_facets(self, facets_formset):
+        """
+        Returns the (unsaved) facets of a valid formset with their range options,
+        as they would be saved.
+        """
+        pending = []
+        for form in facets_formset.forms:
+            if form.cleaned_data.get("DELETE") or not form.cleaned_data:
+                continue
+            range_options = [
+                option_form.instance
+                for option_form in form.nested.forms
+                if option_form.cleaned_data
+                and not option_form.cleaned_data.get("DELETE")
+            ]
+            pending.append((form.instance, range_options))
+        return pending
+
+    def preview(self, search_fields_formset, facets_formset):
+        preview_form = FacetCostPreviewForm(self.request.POST)
+        context = self.get_context_data(
+            search_fields_formset=search_fields_formset,
+            facets_formset=facets_formset,
+            preview_form=preview_form,
+        )
+        if preview_form.is_valid():
+            preview = FacetCostPreview(category=preview_form.cleaned_data["category"])
+            try:
+                context["facet_costs"] = preview.run(
+                    self.get_pending_facets(facets_formset)
+                )
+            except (ApiError, TransportError):
+                logger.exception("Previewing the facet costs failed")
+                messages.error(self.request, "Previewing the facet costs failed.")
+        return self.render_to_response(context)
+
     def post(self, request, *args, **kwargs):
         settings = ProductElasticsearchSettings.load()
 
@@ -41,6 +88,10 @@ class ProductElasticsearchSettingsView(TemplateView):
 
         forms_valid = search_fields_formset.is_valid() and facets_formset.is_valid()
 
+        if forms_valid and "preview" in request.POST:
+            # Nothing is saved, the pending configuration is only profiled.
+            return self.preview(search_fields_formset, facets_formset)
+
         if forms_valid:
             with transaction.atomic():
                 search_fields_formset.save()
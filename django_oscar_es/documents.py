@@ -1,18 +1,436 @@
+import hashlib
+import json
+import logging
+import time
+
+from elasticsearch.helpers import BulkIndexError
+from elasticsearch_dsl import Q
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
 from django_elasticsearch_dsl import fields
 from django_elasticsearch_dsl.documents import Document
 
-from oscar.core.loading import get_model, get_class
+from oscar.core.loading import get_class, get_model, is_model_registered
 
-from .es_fields import ProductAttributesField
-from .settings import get_product_index
+from . import metrics
+from .bulk import AdaptiveBulkIndexer, get_bulk_client
+from .es_fields import ProductAttributesField, RankFeaturesField
+from .indexing import (
+    is_indexing_suspended,
+    is_new_index,
+    record_suspended_update,
+    schedule_percolation,
+)
+from .rank_feature_registry import rank_feature_registry
+from .routing import get_product_routing, get_routing, get_routing_prefetch_related
+from .settings import (
+    CONTENT_HASH_LOOKUP_SIZE,
+    PREPARE_FIELD_METRICS,
+    SAVED_SEARCHES,
+    SKIP_UNCHANGED_DOCUMENTS,
+    get_product_index,
+)
+from .utils import chunked
 
 Product = get_model("catalogue", "Product")
+StockRecord = get_model("partner", "StockRecord")
 Selector = get_class("partner.strategy", "Selector")
 product_index = get_product_index()
 
+logger = logging.getLogger(__name__)
+
 
 class BaseProductDocument(Document):
+    # The fields that only depend on the stockrecords of a product, these are
+    # updated with partial updates when a stockrecord changes.
+    stock_fields = ["price", "num_in_stock", "is_available", "stock_updated"]
+
     attributes = ProductAttributesField()
+    # Filled by the providers in the rank_feature_registry.
+    rank_features = RankFeaturesField()
+    # A hash of all other prepared fields, used to skip sending unchanged documents.
+    content_hash = fields.KeywordField(index=False)
+
+    # Optionally a dict(-like) of {document id: content hash} that is used instead
+    # of looking up the hashes of the indexed documents, eg; for repeated syncs from
+    # a single process. It's updated after every successful bulk call.
+    content_hash_table = None
+    _pending_content_hashes = None
+    # Send index and delete actions to this index (eg; a new generation that is
+    # being built) instead of the document's index (alias).
+    target_index = None
+    _pending_percolation = None
+    # Time every prepare_<field> method separately, see PREPARE_FIELD_METRICS.
+    prepare_field_metrics = PREPARE_FIELD_METRICS
+
+    def prepare_fields(self, instance, prep_funcs):
+        """
+        Returns {name: prepared value} for the given (name, prep_func) pairs.
+        """
+        if not self.prepare_field_metrics:
+            return {name: prep_func(instance) for name, prep_func in prep_funcs}
+        data = {}
+        for name, prep_func in prep_funcs:
+            with metrics.prepare_field_seconds.time(field=name):
+                data[name] = prep_func(instance)
+        return data
+
+    def prepare(self, instance):
+        started = time.perf_counter()
+        data = self.prepare_fields(
+            instance,
+            [
+                (name, prep_func)
+                for name, _, prep_func in self._prepared_fields
+                if name != "content_hash"
+            ],
+        )
+        data["content_hash"] = self.get_content_hash(data)
+        metrics.prepare_document_seconds.observe(time.perf_counter() - started)
+        metrics.documents_prepared.inc()
+
+        date_updated = getattr(instance, "date_updated", None)
+        if date_updated:
+            lag = (timezone.now() - date_updated).total_seconds()
+            metrics.index_lag_seconds.observe(max(lag, 0))
+        return data
+
+    def prepare_partial(self, instance, fields):
+        prep_funcs = {name: prep_func for name, _, prep_func in self._prepared_fields}
+        data = self.prepare_fields(
+            instance, [(name, prep_funcs[name]) for name in fields]
+        )
+        # The indexed document no longer matches its hash after a partial update.
+        data["content_hash"] = None
+        return data
+
+    def prepare_rank_features(self, instance):
+        features = {}
+        for name, provider in rank_feature_registry.get_providers():
+            value = provider(instance)
+            # Rank features have to be strictly positive.
+            if value is not None and value > 0:
+                features[name] = float(value)
+        return features
+
+    def prepare_content_hash(self, instance):
+        # Computed from the other fields in prepare.
+        return None
+
+    def get_content_hash(self, data):
+        serialized = json.dumps(
+            {name: value for name, value in data.items() if name != "content_hash"},
+            cls=DjangoJSONEncoder,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+    def get_stored_content_hashes(self, actions):
+        """
+        Returns {document id: content hash} for the given index actions, either from
+        the content_hash_table or with a single mget that only fetches the hashes.
+        """
+        if self.content_hash_table is not None:
+            return {
+                str(action["_id"]): self.content_hash_table.get(str(action["_id"]))
+                for action in actions
+            }
+
+        docs = []
+        for action in actions:
+            doc = {
+                "_index": action["_index"],
+                "_id": str(action["_id"]),
+                "_source": ["content_hash"],
+            }
+            if "_routing" in action:
+                doc["routing"] = action["_routing"]
+            docs.append(doc)
+
+        response = self._get_connection().mget(docs=docs)
+        return {
+            doc["_id"]: doc["_source"].get("content_hash")
+            for doc in response["docs"]
+            if doc.get("found")
+        }
+
+    def _get_actions(self, object_list, action):
+        actions = super()._get_actions(object_list, action)
+        if action == "delete" and self.content_hash_table is not None:
+            for action_data in actions:
+                self.content_hash_table.pop(str(action_data["_id"]), None)
+                yield action_data
+        elif action == "index" and self.should_skip_unchanged():
+            for chunk in chunked(actions, CONTENT_HASH_LOOKUP_SIZE):
+                yield from self._skip_unchanged(chunk)
+        else:
+            yield from actions
+
+    def should_skip_unchanged(self):
+        """
+        Nothing can be unchanged in a new generation or in an index that was just
+        created, so the hashes aren't looked up for those.
+        """
+        if not SKIP_UNCHANGED_DOCUMENTS or self.target_index:
+            return False
+        return not is_new_index(self._index._name)
+
+    def _skip_unchanged(self, actions):
+        stored_hashes = self.get_stored_content_hashes(actions)
+        if self._pending_content_hashes is None:
+            self._pending_content_hashes = {}
+
+        for action_data in actions:
+            doc_id = str(action_data["_id"])
+            content_hash = action_data["_source"]["content_hash"]
+            if stored_hashes.get(doc_id) == content_hash:
+                metrics.documents_skipped.inc()
+                continue
+            self._pending_content_hashes[doc_id] = content_hash
+            yield action_data
+
+    def _commit_content_hashes(self, errors=()):
+        pending, self._pending_content_hashes = self._pending_content_hashes, None
+        if self.content_hash_table is None or not pending:
+            return
+        for error in errors:
+            for item in error.values():
+                pending.pop(str(item.get("_id")), None)
+        self.content_hash_table.update(pending)
+
+    def _track_percolation(self, action):
+        """
+        Keeps the ids of the documents that are (partially) updated in the live
+        index, these are matched against the saved searches after the bulk call.
+        """
+        if not SAVED_SEARCHES or self.target_index:
+            return
+        if action.get("_op_type", "index") in ("index", "update"):
+            if self._pending_percolation is None:
+                self._pending_percolation = set()
+            self._pending_percolation.add(str(action["_id"]))
+
+    def _after_bulk(self, errors=()):
+        self._commit_content_hashes(errors)
+        pending, self._pending_percolation = self._pending_percolation, None
+        if pending:
+            for error in errors:
+                for item in error.values():
+                    pending.discard(str(item.get("_id")))
+            schedule_percolation(pending)
+
+    def _discard_pending(self):
+        self._pending_content_hashes = None
+        self._pending_percolation = None
+
+    def annotate_stock_updated(self, queryset):
+        """
+        Annotates when the own and the children's stockrecords were last updated,
+        so `stock_updated` doesn't need a query per (parent) product.
+        """
+        return queryset.annotate(
+            own_stock_updated=models.Max("stockrecords__date_updated"),
+            children_stock_updated=models.Max("children__stockrecords__date_updated"),
+        )
+
+    def get_partial_queryset(self):
+        return self.annotate_stock_updated(
+            self.django.model.objects.select_related("parent").prefetch_related(
+                "stockrecords", *get_routing_prefetch_related()
+            )
+        )
+
+    def update(self, thing, refresh=None, action="index", parallel=False, **kwargs):
+        if is_indexing_suspended():
+            object_list = [thing] if isinstance(thing, models.Model) else thing
+            record_suspended_update(
+                [instance.pk for instance in object_list], delete=action == "delete"
+            )
+            return None
+        if action == "delete" and get_routing() is not None:
+            # When a product is deleted its categories are deleted along with it,
+            # so its routing value (and shard) can't be determined anymore.
+            object_list = [thing] if isinstance(thing, models.Model) else thing
+            if refresh is None:
+                refresh = self.django.auto_refresh
+            self.delete_by_ids(
+                [instance.pk for instance in object_list], refresh=bool(refresh)
+            )
+            return None
+        return super().update(
+            thing, refresh=refresh, action=action, parallel=parallel, **kwargs
+        )
+
+    def get_routing(self, instance):
+        return get_product_routing(instance)
+
+    def _prepare_action(self, object_instance, action):
+        action_data = super()._prepare_action(object_instance, action)
+        if self.target_index:
+            action_data["_index"] = self.target_index
+        routing = self.get_routing(object_instance)
+        if routing is not None:
+            action_data["_routing"] = routing
+        return action_data
+
+    def delete_stale_routed_documents(self, object_list):
+        """
+        Deletes copies of the given products that were indexed with a different
+        routing value than they have now (eg; after moving a product to another root
+        category), as those live on another shard and wouldn't be overwritten.
+        """
+        clauses = []
+        for instance in object_list:
+            routing = self.get_routing(instance)
+            clause = Q("ids", values=[str(self.generate_id(instance))])
+            if routing is None:
+                clause &= Q("exists", field="_routing")
+            else:
+                clause &= ~Q("term", _routing=routing)
+            clauses.append(clause)
+
+        if clauses:
+            self._get_connection().delete_by_query(
+                index=self._index._name,
+                query=Q("bool", should=clauses, minimum_should_match=1).to_dict(),
+                conflicts="proceed",
+                refresh=True,
+            )
+
+    def delete_by_ids(self, ids, refresh=False):
+        """
+        Deletes the documents with the given ids regardless of their routing.
+        """
+        if ids:
+            self._get_connection().delete_by_query(
+                index=self.target_index or self._index._name,
+                query={"ids": {"values": [str(pk) for pk in ids]}},
+                conflicts="proceed",
+                refresh=refresh,
+            )
+
+    def _get_partial_actions(self, object_list, fields, index=None):
+        for instance in object_list:
+            if self.should_index_object(instance):
+                action = {
+                    "_op_type": "update",
+                    "_index": index or self._index._name,
+                    "_id": self.generate_id(instance),
+                    "doc": self.prepare_partial(instance, fields),
+                }
+                routing = self.get_routing(instance)
+                if routing is not None:
+                    action["_routing"] = routing
+                yield action
+
+    def partial_update(self, thing, fields, refresh=None, index=None, **kwargs):
+        """
+        Sends `update` actions containing only the given fields through the bulk api.
+        Documents that don't exist in the index yet are fully indexed instead, unless
+        an explicit `index` (eg; a new generation) is passed.
+        """
+        if refresh is not None:
+            kwargs["refresh"] = refresh
+        elif self.django.auto_refresh:
+            kwargs["refresh"] = self.django.auto_refresh
+
+        object_list = [thing] if isinstance(thing, models.Model) else thing
+        _, errors = self._bulk(
+            self._get_partial_actions(object_list, fields, index=index),
+            raise_on_error=False,
+            **kwargs,
+        )
+
+        missing_ids = []
+        for error in errors:
+            item = error.get("update", {})
+            if item.get("status") == 404:
+                missing_ids.append(item["_id"])
+            else:
+                logger.error("Partial update failed: %s", error)
+
+        if missing_ids and index is None:
+            self.update(self.get_queryset().filter(pk__in=missing_ids), **kwargs)
+        elif missing_ids:
+            logger.warning(
+                "%s documents are missing from %s: %s",
+                len(missing_ids),
+                index,
+                ", ".join(missing_ids[:20]),
+            )
+
+    def bulk(self, actions, adaptive=False, **kwargs):
+        """
+        With `adaptive` the actions are sent with the AdaptiveBulkIndexer, which is
+        meant for large indexing runs only: its concurrent batches can reorder the
+        operations on a document.
+        """
+        counter = {"count": 0}
+
+        def counted(actions):
+            for action in actions:
+                counter["count"] += 1
+                metrics.bulk_actions.inc(op_type=action.get("_op_type", "index"))
+                self._track_percolation(action)
+                yield action
+
+        if adaptive:
+            return self.adaptive_bulk(counted(actions), **kwargs)
+
+        metrics.bulk_requests.inc()
+        started = time.perf_counter()
+        try:
+            response = super().bulk(counted(actions), **kwargs)
+        except BulkIndexError as e:
+            metrics.record_bulk_errors(e.errors)
+            self._discard_pending()
+            raise
+        finally:
+            metrics.bulk_latency_seconds.observe(time.perf_counter() - started)
+            metrics.bulk_size.observe(counter["count"])
+
+        errors = []
+        if isinstance(response, tuple) and isinstance(response[1], list):
+            errors = response[1]
+            metrics.record_bulk_errors(errors)
+        self._after_bulk(errors)
+        return response
+
+    def adaptive_bulk(self, actions, raise_on_error=True, refresh=None, **kwargs):
+        """
+        Indexes the actions with the AdaptiveBulkIndexer and returns the same as
+        elasticsearch.helpers.bulk.
+        """
+        indexer = AdaptiveBulkIndexer(get_bulk_client(self._get_using()))
+        success, errors = indexer.run(actions)
+        if refresh:
+            self._get_connection().indices.refresh(
+                index=self.target_index or self._index._name
+            )
+
+        if errors and raise_on_error:
+            self._discard_pending()
+            raise BulkIndexError(f"{len(errors)} document(s) failed to index.", errors)
+        self._after_bulk(errors)
+        return success, errors
+
+    def parallel_bulk(self, actions, adaptive=False, **kwargs):
+        def tracked(actions):
+            for action in actions:
+                self._track_percolation(action)
+                yield action
+
+        try:
+            response = super().parallel_bulk(tracked(actions), **kwargs)
+        except BulkIndexError:
+            self._discard_pending()
+            raise
+        self._after_bulk()
+        return response
 
     def prepare_attributes(self, instance):
         result = {}
@@ -42,13 +460,23 @@ class ProductDocument(BaseProductDocument):
         model = Product
 
     def get_queryset(self):
-        return (
+        select_related = ["parent", "product_class"]
+        if is_model_registered("analytics", "ProductRecord"):
+            # For the popularity rank feature.
+            select_related.append("stats")
+        return self.annotate_stock_updated(
             super()
             .get_queryset()
-            .select_related("parent", "product_class")
-            .prefetch_related("attribute_values", "attribute_values__attribute")
+            .select_related(*select_related)
+            .prefetch_related(
+                "attribute_values",
+                "attribute_values__attribute",
+                "stockrecords",
+                *get_routing_prefetch_related(),
+            )
         )
 
+    id = fields.IntegerField(attr="id")
     title = fields.TextField(
         attr="title",
         analyzer="title_analyzer",
@@ -92,6 +520,13 @@ class ProductDocument(BaseProductDocument):
             return instance.parent.id
         return None
 
+    # The id of the parent for child products and the product's own id otherwise,
+    # used to collapse variants into a single result.
+    group_id = fields.IntegerField()
+
+    def prepare_group_id(self, instance):
+        return instance.parent_id or instance.id
+
     parent_upc = fields.KeywordField()
 
     def prepare_parent_upc(self, instance):
@@ -119,6 +554,26 @@ class ProductDocument(BaseProductDocument):
         purchase_info = self.__purchase_info(instance)
         return purchase_info.availability.is_available_to_buy
 
+    # The last time a stockrecord of the product (or its children) changed, used to
+    # detect stale stock in the index.
+    stock_updated = fields.DateField()
+
+    def prepare_stock_updated(self, instance):
+        # Annotated by get_queryset and get_partial_queryset, not on instances that
+        # are indexed on save.
+        if hasattr(instance, "own_stock_updated"):
+            if instance.is_parent:
+                return instance.children_stock_updated
+            return instance.own_stock_updated
+        if instance.is_parent:
+            return StockRecord.objects.filter(product__parent=instance).aggregate(
+                stock_updated=models.Max("date_updated")
+            )["stock_updated"]
+        return max(
+            (stockrecord.date_updated for stockrecord in instance.stockrecords.all()),
+            default=None,
+        )
+
     def __purchase_info(self, instance):
         strategy = Selector().strategy()
         if instance.is_parent:
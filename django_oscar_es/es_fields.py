@@ -1,3 +1,7 @@
+from elasticsearch_dsl.field import RankFeatures
+
+from django.db import DatabaseError
+
 from django_elasticsearch_dsl import fields
 
 from oscar.core.loading import get_model
@@ -13,7 +17,13 @@ class ProductAttributesField(fields.ObjectField):
     def get_attributes_properties(self):
         properties = {}
 
-        for attribute in ProductAttribute.objects.all():
+        try:
+            attributes = list(ProductAttribute.objects.all())
+        except DatabaseError:
+            # The tables don't exist yet, eg; before migrating (or in a test run).
+            return properties
+
+        for attribute in attributes:
             es_type = self.attribute_type_to_es_type(attribute)
             attribute_code = attribute.code
 
@@ -45,3 +55,10 @@ class ProductAttributesField(fields.ObjectField):
         elif attribute.type == attribute.FLOAT:
             return fields.Float()
         return fields.Keyword()
+
+
+class RankFeaturesField(fields.DEDField, RankFeatures):
+    """
+    A rank_features field, holds a positive number per feature (eg; popularity)
+    that can be used to boost the relevance with rank_feature queries.
+    """
@@ -0,0 +1,32 @@
+from oscar.core.loading import get_model, is_model_registered
+
+from .rank_feature_registry import register_rank_feature
+
+
+@register_rank_feature("rating")
+def rating(product):
+    return product.rating
+
+
+if is_model_registered("analytics", "ProductRecord"):
+    ProductRecord = get_model("analytics", "ProductRecord")
+
+    @register_rank_feature("popularity")
+    def popularity(product):
+        try:
+            return product.stats.num_purchases
+        except ProductRecord.DoesNotExist:
+            return None
+
+
+def margin(product):
+    """
+    Price minus cost price of the best stockrecord. Not registered by default, as
+    the cost price would be derivable from the index.
+    """
+    margins = [
+        stockrecord.price - stockrecord.cost_price
+        for stockrecord in product.stockrecords.all()
+        if stockrecord.price is not None and stockrecord.cost_price is not None
+    ]
+    return float(max(margins)) if margins else None
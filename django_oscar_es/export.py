@@ -0,0 +1,157 @@
+import csv
+import json
+import queue
+import threading
+
+from .scanning import point_in_time, scan_point_in_time
+from .settings import get_product_document
+
+_DONE = object()
+
+
+def get_path(source, path):
+    """
+    Returns the value at a dotted path (eg; "attributes.color") of a document.
+    """
+    value = source
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+class ProductExporter:
+    """
+    Streams the product documents from the index, read by `slices` parallel
+    readers from a single point in time. At most `buffer_size` documents are held
+    in memory at once, regardless of the size of the index.
+    """
+
+    def __init__(
+        self,
+        fields=None,
+        query=None,
+        slices=4,
+        size=1000,
+        buffer_size=5000,
+        using="default",
+    ):
+        self.fields = fields
+        self.query = query
+        self.slices = max(1, slices)
+        self.size = size
+        self.buffer_size = buffer_size
+        self.using = using
+
+    def get_index_name(self):
+        return get_product_document()._index._name
+
+    def read_slice(self, pit_id, slice_id, buffer, stop):
+        try:
+            for hit in scan_point_in_time(
+                pit_id,
+                sort=["_shard_doc"],
+                query=self.query,
+                source=self.fields or True,
+                size=self.size,
+                slice_id=slice_id,
+                max_slices=self.slices,
+                using=self.using,
+            ):
+                if not self.put(buffer, stop, hit["_source"]):
+                    return
+        except Exception as e:  # pylint: disable=broad-except
+            self.put(buffer, stop, e)
+        finally:
+            self.put(buffer, stop, _DONE)
+
+    def put(self, buffer, stop, item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        buffer = queue.Queue(maxsize=self.buffer_size)
+        stop = threading.Event()
+        with point_in_time(self.get_index_name(), using=self.using) as pit_id:
+            readers = [
+                threading.Thread(
+                    target=self.read_slice,
+                    args=(pit_id, slice_id, buffer, stop),
+                    daemon=True,
+                )
+                for slice_id in range(self.slices)
+            ]
+            for reader in readers:
+                reader.start()
+
+            try:
+                running = len(readers)
+                while running:
+                    item = buffer.get()
+                    if item is _DONE:
+                        running -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                stop.set()
+                for reader in readers:
+                    reader.join()
+
+
+class JsonLinesWriter:
+    def __init__(self, stream, fields=None):
+        self.stream = stream
+        self.fields = fields
+
+    def write(self, source):
+        if self.fields:
+            source = {field: get_path(source, field) for field in self.fields}
+        self.stream.write(json.dumps(source, separators=(",", ":")))
+        self.stream.write("\n")
+
+
+class CsvWriter:
+    """
+    Writes a column per field, lists and objects are written as JSON.
+    """
+
+    def __init__(self, stream, fields):
+        self.fields = fields
+        self.writer = csv.writer(stream)
+        self.writer.writerow(fields)
+
+    def write(self, source):
+        row = []
+        for field in self.fields:
+            value = get_path(source, field)
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, separators=(",", ":"))
+            row.append("" if value is None else value)
+        self.writer.writerow(row)
+
+
+WRITERS = {
+    "jsonl": JsonLinesWriter,
+    "csv": CsvWriter,
+}
+
+
+def export_products(stream, output_format="jsonl", fields=None, **kwargs):
+    """
+    Writes all (matching) product documents to the stream and returns the number
+    of documents written.
+    """
+    writer = WRITERS[output_format](stream, fields)
+    count = 0
+    for source in ProductExporter(fields=fields, **kwargs):
+        writer.write(source)
+        count += 1
+    return count
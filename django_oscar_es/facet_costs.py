@@ -0,0 +1,150 @@
+import json
+
+from elasticsearch_dsl import A
+from elasticsearch_dsl.connections import connections
+
+from .routing import get_category_routing
+from .settings import (
+    APPROXIMATE_FACETS_SHARD_SIZE,
+    FACET_CARDINALITY_WARNING,
+    FACET_COST_WARNING_MS,
+    FACET_RESPONSE_SIZE_WARNING,
+    get_product_document,
+)
+
+
+class FacetCost:
+    def __init__(self, facet):
+        self.facet = facet
+        # Time spent in the aggregation, summed over the shards.
+        self.time_ms = 0.0
+        # The number of distinct values of the field (term facets only).
+        self.cardinality = None
+        # The number of buckets returned.
+        self.buckets = 0
+        # The size of the aggregation in the response, in bytes.
+        self.response_size = 0
+
+    @property
+    def name(self):
+        return self.facet.label or self.facet.field
+
+    @property
+    def warnings(self):
+        warnings = []
+        if self.time_ms > FACET_COST_WARNING_MS:
+            warnings.append("time")
+        if (self.cardinality or 0) > FACET_CARDINALITY_WARNING:
+            warnings.append("cardinality")
+        if self.response_size > FACET_RESPONSE_SIZE_WARNING:
+            warnings.append("response_size")
+        return warnings
+
+
+class FacetCostPreview:
+    """
+    Runs the aggregations of a (pending, unsaved) facet configuration with the
+    profile API, on the products of a representative category, to show what each
+    facet adds to a search before it's saved.
+    """
+
+    def __init__(self, category=None, using="default"):
+        self.category = category
+        self.using = using
+        self.document = get_product_document()
+
+    def get_client(self):
+        return connections.get_connection(self.using)
+
+    def get_query(self):
+        filters = [{"term": {"is_public": True}}]
+        if self.category is not None:
+            category_ids = self.category.get_descendants_and_self().values_list(
+                "pk", flat=True
+            )
+            filters.append(
+                {
+                    "nested": {
+                        "path": "categories",
+                        "query": {"terms": {"categories.id": list(category_ids)}},
+                    }
+                }
+            )
+        return {"bool": {"filter": filters}}
+
+    def get_aggregation(self, facet, range_options=()):
+        if facet.facet_type == facet.FACET_TYPE_RANGE:
+            ranges = []
+            for range_option in range_options:
+                bounds = {"key": range_option.label}
+                if range_option.get_from_value() is not None:
+                    bounds["from"] = range_option.get_from_value()
+                if range_option.get_to_value() is not None:
+                    bounds["to"] = range_option.get_to_value()
+                ranges.append(bounds)
+            aggregation = A("range", field=facet.field, ranges=ranges)
+        else:
+            aggregation = A("terms", field=facet.field, size=facet.size)
+
+        if facet.approximate:
+            return A(
+                "sampler",
+                shard_size=APPROXIMATE_FACETS_SHARD_SIZE,
+                aggs={"sampled": aggregation},
+            )
+        return aggregation
+
+    def search(self, aggs, profile=False):
+        kwargs = {}
+        routing = get_category_routing(self.category) if self.category else None
+        if routing:
+            kwargs["routing"] = routing
+        return self.get_client().search(
+            index=self.document._index._name,
+            query=self.get_query(),
+            aggs=aggs,
+            size=0,
+            profile=profile,
+            **kwargs,
+        )
+
+    def get_aggregation_times(self, response):
+        times = {}
+        for shard in response["profile"]["shards"]:
+            for aggregation in shard.get("aggregations", []):
+                name = aggregation["description"]
+                times[name] = times.get(name, 0) + aggregation["time_in_nanos"]
+        return {name: nanos / 1e6 for name, nanos in times.items()}
+
+    def run(self, facets):
+        """
+        Accepts (facet, range options) pairs and returns a FacetCost per facet.
+        """
+        costs = {}
+        aggs = {}
+        cardinality_aggs = {}
+        for index, (facet, range_options) in enumerate(facets):
+            name = f"facet_{index}"
+            costs[name] = FacetCost(facet)
+            aggs[name] = self.get_aggregation(facet, range_options).to_dict()
+            if facet.facet_type == facet.FACET_TYPE_TERM:
+                cardinality_aggs[name] = {"cardinality": {"field": facet.field}}
+
+        if not aggs:
+            return []
+
+        response = self.search(aggs, profile=True)
+        times = self.get_aggregation_times(response)
+        for name, cost in costs.items():
+            data = response["aggregations"][name]
+            cost.time_ms = times.get(name, 0.0)
+            cost.response_size = len(json.dumps(data))
+            cost.buckets = len(data.get("sampled", data).get("buckets", []))
+
+        if cardinality_aggs:
+            # Counted separately, so it doesn't add to the profiled times.
+            response = self.search(cardinality_aggs)
+            for name in cardinality_aggs:
+                costs[name].cardinality = response["aggregations"][name]["value"]
+
+        return list(costs.values())
@@ -1,10 +1,21 @@
-from elasticsearch_dsl import Q
+import copy
+
+from elasticsearch_dsl import A, Q
+from elasticsearch_dsl.utils import AttrDict
 
 from django_es_kit.faceted_search import DynamicFacetedSearch
 
 from oscar.core.loading import get_class
 
-from .settings import get_product_document
+from .settings import (
+    APPROXIMATE_FACETS,
+    APPROXIMATE_FACETS_SHARD_SIZE,
+    COLLAPSE_VARIANTS,
+    RANK_FEATURE_BOOSTS,
+    SEARCH_REQUEST_TIMEOUT,
+    TRACK_TOTAL_HITS,
+    get_product_document,
+)
 
 ProductDocument = get_product_document()
 get_product_elasticsearch_settings = get_class(
@@ -12,16 +23,207 @@ get_product_elasticsearch_settings = get_class(
 )
 
 
+class SampledFacet:
+    """
+    Wraps a facet to aggregate its values on a sample of at most `shard_size`
+    documents per shard. When the results are larger than the sample, the counts
+    are scaled up to the number of results and marked as approximate.
+    """
+
+    def __init__(self, facet, shard_size=APPROXIMATE_FACETS_SHARD_SIZE):
+        self.facet = facet
+        self.shard_size = shard_size
+        self.total = None
+        self.sampled = None
+
+    def __getattr__(self, name):
+        return getattr(self.facet, name)
+
+    @property
+    def is_approximate(self):
+        return bool(self.total and self.sampled and self.total > self.sampled)
+
+    def get_aggregation(self):
+        return A(
+            "sampler",
+            shard_size=self.shard_size,
+            aggs={"sampled": self.facet.get_aggregation()},
+        )
+
+    def get_values(self, data, filter_values):
+        values = self.facet.get_values(data.sampled, filter_values)
+        if not self.is_approximate:
+            return values
+        factor = self.total / self.sampled
+        return [
+            (key, int(round(count * factor)), selected)
+            for key, count, selected in values
+        ]
+
+
 class CatalogueFacetedSearch(DynamicFacetedSearch):
     doc_types = [ProductDocument]
     default_filter_queries = [
         Q("term", is_public=True),
     ]
+    # Variants of the same parent are collapsed into their best matching variant.
+    collapse_variants = COLLAPSE_VARIANTS
+    collapse_field = "group_id"
+    # Count the values of every facet on a sample, otherwise only those of the
+    # facets marked as approximate.
+    approximate_facets = APPROXIMATE_FACETS
+    # Count the results exactly up to this number (or all of them with True).
+    track_total_hits = TRACK_TOTAL_HITS
+    # {feature name: boost or rank_feature query parameters}
+    rank_feature_boosts = RANK_FEATURE_BOOSTS
+    # Timeout of the search request in seconds, None uses the timeout of the client.
+    request_timeout = SEARCH_REQUEST_TIMEOUT
+    # A CircuitBreaker the search is executed through.
+    circuit_breaker = None
 
     def __init__(self, facets, query=None, filters={}, sort=()):
+        # Custom routing value(s), limits the query to the shard(s) they route to.
+        self.routing = None
+        # The total hits ({"value": ..., "relation": "eq" / "gte"}) of the last
+        # response.
+        self.total_hits = None
         super().__init__(facets, query, filters, sort)
         self.load_search_fields()
 
+    def search(self):
+        s = super().search()
+        s = s.extra(track_total_hits=self.track_total_hits)
+        if self.routing:
+            s = s.params(routing=self.routing)
+        if self.request_timeout:
+            s = s.params(request_timeout=self.request_timeout)
+        if self.collapse_variants:
+            s = s.extra(
+                collapse={
+                    "field": self.collapse_field,
+                    "inner_hits": {"name": "best_variant", "size": 1},
+                }
+            )
+        return s
+
+    def query(self, search, query):
+        search = super().query(search, query)
+        should = self.get_rank_feature_queries()
+        if should:
+            # Without a must clause a should-only bool requires a feature to match,
+            # the rank features may only boost.
+            current = search.query._proxied or Q("match_all")
+            search.query._proxied = Q("bool", must=[current], should=should)
+        return search
+
+    def get_rank_feature_queries(self):
+        queries = []
+        for name, params in self.rank_feature_boosts.items():
+            if not isinstance(params, dict):
+                params = {"boost": params}
+            queries.append(Q("rank_feature", field=f"rank_features.{name}", **params))
+        return queries
+
+    def get_approximate_facet_fields(self):
+        if self.approximate_facets:
+            return set(self.facets)
+        product_es_settings = get_product_elasticsearch_settings()
+        return {
+            db_facet.field
+            for db_facet in product_es_settings.facets.all()
+            if db_facet.approximate
+        }
+
+    def has_filters(self):
+        """
+        Returns whether any facet value is selected.
+        """
+        return bool(self._filters)
+
+    def get_approximate_facet_names(self):
+        """
+        The facets of which the counts of the last response are approximate.
+        """
+        return [
+            name
+            for name, facet in self.facets.items()
+            if isinstance(facet, SampledFacet) and facet.is_approximate
+        ]
+
+    def execute(self):
+        if self.circuit_breaker is not None:
+            response = self.circuit_breaker.call(super().execute)
+        else:
+            response = super().execute()
+        self.total_hits = response.hits.total
+        if self.collapse_variants:
+            # The total hits count every variant, the results are the groups.
+            self.total_hits = self.get_group_total(response)
+        for name, facet in self.facets.items():
+            if isinstance(facet, SampledFacet):
+                filtered = getattr(response.aggregations, "_filter_" + name)
+                facet.total = filtered.doc_count
+                facet.sampled = filtered[name].doc_count
+        return response
+
+    def aggregate(self, search):
+        approximate = self.get_approximate_facet_fields()
+        facets = {}
+        for name, facet in self.facets.items():
+            if self.collapse_variants:
+                facet = self.get_group_counting_facet(facet)
+            if name in approximate and not isinstance(facet, SampledFacet):
+                facet = SampledFacet(facet)
+            facets[name] = facet
+        self.facets = facets
+        if self.collapse_variants:
+            # Counts the groups matching all selected facet values, like the results
+            # (which are filtered by the post filter).
+            group_filter = Q("match_all")
+            for facet_filter in self._filters.values():
+                group_filter &= facet_filter
+            search.aggs.bucket(
+                "_filter_group_count", "filter", filter=group_filter
+            ).metric("group_count", "cardinality", field=self.collapse_field)
+        super().aggregate(search)
+
+    def get_group_counting_facet(self, facet):
+        """
+        Returns a copy of the facet counting the distinct groups per value instead
+        of the documents. The facets can be shared between searches, so they're not
+        changed in place.
+        """
+        inner = facet.facet if isinstance(facet, SampledFacet) else facet
+        if getattr(inner, "_metric", None) is not None:
+            return facet
+        inner = copy.copy(inner)
+        inner._metric = A("cardinality", field=self.collapse_field)
+        if isinstance(facet, SampledFacet):
+            return SampledFacet(inner, shard_size=facet.shard_size)
+        return inner
+
+    def get_group_count(self, response):
+        """
+        Returns the (approximate) number of collapsed results, as the total hits of
+        a collapsed search still count every variant.
+        """
+        if "_filter_group_count" in response.aggregations:
+            return response.aggregations._filter_group_count.group_count.value
+        return response.hits.total.value
+
+    def get_group_total(self, response):
+        """
+        The number of groups in the format of the total hits, capped at
+        track_total_hits like the total hits are.
+        """
+        value = self.get_group_count(response)
+        relation = "eq"
+        track_total_hits = self.track_total_hits
+        if track_total_hits is not True and track_total_hits:
+            if value > track_total_hits:
+                value, relation = track_total_hits, "gte"
+        return AttrDict({"value": value, "relation": relation})
+
     def load_search_fields(self):
         product_es_settings = get_product_elasticsearch_settings()
         search_fields = [
@@ -0,0 +1,1404 @@
+import copy
+import fnmatch
+import math
+import re
+import threading
+import time
+import uuid
+import zlib
+
+from collections import OrderedDict
+from urllib.parse import unquote
+
+from django.conf import settings as django_settings
+
+from elasticsearch_dsl.connections import connections
+
+from .stub_transport import StubNode, iter_bulk_operations
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class InMemoryStore:
+    """
+    Process wide storage for the in-memory backend, shared by every client that
+    uses the InMemoryNode.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.indices = OrderedDict()
+        self.aliases = {}
+        # Snapshots of the documents per point in time id.
+        self.points_in_time = {}
+        # The results of the (already completed) background tasks per task id.
+        self.tasks = {}
+
+    def reset(self):
+        with self.lock:
+            self.indices.clear()
+            self.aliases.clear()
+            self.points_in_time.clear()
+            self.tasks.clear()
+
+    def create_index(self, name, body=None):
+        body = body or {}
+        self.indices[name] = {
+            "settings": body.get("settings", {}),
+            "mappings": body.get("mappings", {"properties": {}}),
+            "docs": OrderedDict(),
+        }
+        for alias in body.get("aliases", {}):
+            self.aliases.setdefault(alias, set()).add(name)
+
+    def resolve(self, expression):
+        if not expression or expression in ("_all", "*"):
+            return list(self.indices)
+
+        names = []
+        for part in expression.split(","):
+            if self.aliases.get(part):
+                candidates = sorted(self.aliases[part])
+            elif "*" in part:
+                candidates = [
+                    name for name in self.indices if fnmatch.fnmatchcase(name, part)
+                ]
+            else:
+                candidates = [part] if part in self.indices else []
+            names.extend(name for name in candidates if name not in names)
+        return names
+
+
+store = InMemoryStore()
+
+
+def deep_merge(target, source):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            deep_merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+def get_values(source, field):
+    """
+    Returns all values for a (dotted) field in the given source, flattening lists.
+    Multi-fields like `title.keyword` resolve to the value of their parent field.
+    """
+    values = [source]
+    for segment in field.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if segment in value:
+                    child = value[segment]
+                    if isinstance(child, list):
+                        next_values.extend(child)
+                    elif child is not None:
+                        next_values.append(child)
+            elif value is not source:
+                # A scalar with a sub field, eg; title.keyword
+                next_values.append(value)
+        values = next_values
+    return [value for value in values if not isinstance(value, dict)]
+
+
+def tokenize(value):
+    return TOKEN_RE.findall(str(value).lower())
+
+
+def coerce(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        if value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def values_equal(left, right):
+    left, right = coerce(left), coerce(right)
+    if isinstance(left, str) and isinstance(right, str):
+        return left == right or left.lower() == right.lower()
+    return left == right
+
+
+def compare(left, right):
+    left, right = coerce(left), coerce(right)
+    if type(left) is not type(right):
+        left, right = str(left), str(right)
+    return (left > right) - (left < right)
+
+
+def in_range(value, conditions):
+    for operator, bound in conditions.items():
+        if bound is None or operator not in ("gt", "gte", "lt", "lte"):
+            continue
+        result = compare(value, bound)
+        if operator == "gt" and not result > 0:
+            return False
+        if operator == "gte" and not result >= 0:
+            return False
+        if operator == "lt" and not result < 0:
+            return False
+        if operator == "lte" and not result <= 0:
+            return False
+    return True
+
+
+class QueryEvaluator:
+    """
+    Evaluates the subset of the query DSL this package generates. `score` returns
+    None when the document doesn't match, otherwise a (naive) relevance score.
+    """
+
+    def score(self, query, source):
+        if not query:
+            return 1.0
+        [(query_type, body)] = query.items()
+        method = getattr(self, f"query_{query_type}", None)
+        if method is None:
+            raise UnsupportedQuery(f"Unsupported query type '{query_type}'")
+        return method(body, source)
+
+    def matches(self, query, source):
+        return self.score(query, source) is not None
+
+    def query_match_all(self, body, source):
+        return body.get("boost", 1.0)
+
+    def query_match_none(self, body, source):
+        return None
+
+    def query_bool(self, body, source):
+        def as_list(clauses):
+            if clauses is None:
+                return []
+            return clauses if isinstance(clauses, list) else [clauses]
+
+        score = 0.0
+        for clause in as_list(body.get("must")):
+            clause_score = self.score(clause, source)
+            if clause_score is None:
+                return None
+            score += clause_score
+        for clause in as_list(body.get("filter")):
+            if not self.matches(clause, source):
+                return None
+        for clause in as_list(body.get("must_not")):
+            if self.matches(clause, source):
+                return None
+
+        should = as_list(body.get("should"))
+        if should:
+            matched = 0
+            for clause in should:
+                clause_score = self.score(clause, source)
+                if clause_score is not None:
+                    matched += 1
+                    score += clause_score
+            default_minimum = 0 if body.get("must") or body.get("filter") else 1
+            minimum = int(body.get("minimum_should_match", default_minimum))
+            if matched < minimum:
+                return None
+
+        return score * body.get("boost", 1.0) or 1.0
+
+    def query_term(self, body, source):
+        [(field, value)] = body.items()
+        if isinstance(value, dict):
+            value = value.get("value")
+        if any(values_equal(v, value) for v in get_values(source, field)):
+            return 1.0
+        return None
+
+    def query_terms(self, body, source):
+        body = {k: v for k, v in body.items() if k != "boost"}
+        [(field, terms)] = body.items()
+        values = get_values(source, field)
+        if any(values_equal(v, term) for v in values for term in terms):
+            return 1.0
+        return None
+
+    def query_ids(self, body, source):
+        if str(source.get("__id")) in {str(value) for value in body["values"]}:
+            return 1.0
+        return None
+
+    def query_exists(self, body, source):
+        return 1.0 if get_values(source, body["field"]) else None
+
+    def query_range(self, body, source):
+        [(field, conditions)] = body.items()
+        if any(in_range(value, conditions) for value in get_values(source, field)):
+            return 1.0
+        return None
+
+    def query_nested(self, body, source):
+        path = body["path"]
+        best = None
+        for nested_object in get_nested_objects(source, path):
+            nested_source = build_nested_source(path, nested_object)
+            nested_score = self.score(body["query"], nested_source)
+            if nested_score is not None:
+                best = max(best or 0.0, nested_score)
+        return best
+
+    def query_rank_feature(self, body, source):
+        values = [coerce(value) for value in get_values(source, body["field"])]
+        values = [value for value in values if isinstance(value, float) and value > 0]
+        if not values:
+            return None
+        value = values[0]
+        if "log" in body:
+            score = math.log(body["log"].get("scaling_factor", 1) + value)
+        elif "sigmoid" in body:
+            pivot = body["sigmoid"]["pivot"] ** body["sigmoid"]["exponent"]
+            value = value ** body["sigmoid"]["exponent"]
+            score = value / (value + pivot)
+        elif "linear" in body:
+            score = value
+        else:
+            pivot = (body.get("saturation") or {}).get("pivot", 1.0)
+            score = value / (value + pivot)
+        return score * body.get("boost", 1.0)
+
+    def query_percolate(self, body, source):
+        if "documents" in body:
+            documents = body["documents"]
+        elif "document" in body:
+            documents = [body["document"]]
+        else:
+            raise UnsupportedQuery("Only percolating given documents is supported")
+        stored_query = source.get(body["field"])
+        if not isinstance(stored_query, dict):
+            return None
+        slots = [
+            slot
+            for slot, document in enumerate(documents)
+            if self.matches(stored_query, document)
+        ]
+        if not slots:
+            return None
+        # Returned as the _percolator_document_slot field of the hit.
+        source["__percolator_document_slot"] = slots
+        return float(len(slots))
+
+    def query_match(self, body, source):
+        [(field, options)] = body.items()
+        if not isinstance(options, dict):
+            options = {"query": options}
+        return self.text_score(
+            options["query"],
+            [(field, 1.0)],
+            source,
+            options.get("operator", "or"),
+        )
+
+    def query_multi_match(self, body, source):
+        fields = []
+        for field in body.get("fields") or ["*"]:
+            name, _, boost = field.partition("^")
+            fields.append((name, float(boost) if boost else 1.0))
+        return self.text_score(
+            body["query"], fields, source, body.get("operator", "or")
+        )
+
+    def text_score(self, query, fields, source, operator="or"):
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return None
+
+        score = 0.0
+        matched_tokens = set()
+        for field, boost in fields:
+            if field == "*":
+                values = [v for v in iter_scalars(source) if isinstance(v, str)]
+            else:
+                values = get_values(source, field)
+            field_tokens = [token for value in values for token in tokenize(value)]
+            for query_token in query_tokens:
+                # Substring matching roughly mimics the ngram analyzer of the title.
+                hits = sum(1 for token in field_tokens if query_token in token)
+                if hits:
+                    matched_tokens.add(query_token)
+                    score += boost * hits
+
+        if operator.lower() == "and" and len(matched_tokens) < len(set(query_tokens)):
+            return None
+        return score or None
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+class MissingPointInTime(Exception):
+    pass
+
+
+def rename_attribute_option(source, params):
+    """
+    Equivalent of propagation.RENAME_ATTRIBUTE_OPTION_SCRIPT.
+    """
+    source["content_hash"] = None
+    attributes = source.get("attributes")
+    value = None if attributes is None else attributes.get(params["code"])
+    if isinstance(value, list):
+        attributes[params["code"]] = [
+            params["new_value"] if item == params["old_value"] else item
+            for item in value
+        ]
+    elif value is not None and value == params["old_value"]:
+        attributes[params["code"]] = params["new_value"]
+
+
+def update_category(source, params):
+    """
+    Equivalent of propagation.UPDATE_CATEGORY_SCRIPT.
+    """
+    source["content_hash"] = None
+    for category in source.get("categories") or []:
+        if category.get("id") == params["id"]:
+            category.update(copy.deepcopy(params["values"]))
+
+
+def get_nested_objects(source, path):
+    objects = [source]
+    for segment in path.split("."):
+        next_objects = []
+        for value in objects:
+            child = value.get(segment) if isinstance(value, dict) else None
+            if isinstance(child, list):
+                next_objects.extend(child)
+            elif child is not None:
+                next_objects.append(child)
+        objects = next_objects
+    return [value for value in objects if isinstance(value, dict)]
+
+
+def build_nested_source(path, nested_object):
+    nested_source = nested_object
+    for segment in reversed(path.split(".")):
+        nested_source = {segment: nested_source}
+    return nested_source
+
+
+def iter_scalars(value):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if not key.startswith("__"):
+                yield from iter_scalars(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from iter_scalars(child)
+    elif value is not None:
+        yield value
+
+
+class AggregationEvaluator:
+    def __init__(self, query_evaluator):
+        self.query_evaluator = query_evaluator
+
+    def run(self, aggs, sources, timings=None):
+        """
+        Returns the results of the aggregations, the time spent per aggregation (in
+        nanoseconds) is added to `timings` when it's passed.
+        """
+        results = {}
+        for name, definition in (aggs or {}).items():
+            started = time.perf_counter_ns()
+            definition = dict(definition)
+            sub_aggs = definition.pop("aggs", None) or definition.pop(
+                "aggregations", None
+            )
+            definition.pop("meta", None)
+            [(agg_type, body)] = definition.items()
+            method = getattr(self, f"agg_{agg_type}", None)
+            if method is None:
+                raise UnsupportedQuery(f"Unsupported aggregation type '{agg_type}'")
+            results[name] = method(body, sources, sub_aggs)
+            if timings is not None:
+                timings[name] = (agg_type, time.perf_counter_ns() - started)
+        return results
+
+    def bucket(self, sources, sub_aggs, **extra):
+        bucket = dict(extra, doc_count=len(sources))
+        bucket.update(self.run(sub_aggs, sources))
+        return bucket
+
+    def agg_filter(self, body, sources, sub_aggs):
+        matching = [s for s in sources if self.query_evaluator.matches(body, s)]
+        return self.bucket(matching, sub_aggs)
+
+    def agg_filters(self, body, sources, sub_aggs):
+        return {
+            "buckets": {
+                name: self.bucket(
+                    [s for s in sources if self.query_evaluator.matches(query, s)],
+                    sub_aggs,
+                )
+                for name, query in body["filters"].items()
+            }
+        }
+
+    def agg_global(self, body, sources, sub_aggs):
+        return self.bucket(sources, sub_aggs)
+
+    def agg_sampler(self, body, sources, sub_aggs):
+        return self.bucket(sources[: body.get("shard_size", 100)], sub_aggs)
+
+    def agg_nested(self, body, sources, sub_aggs):
+        path = body["path"]
+        nested_sources = [
+            build_nested_source(path, nested_object)
+            for source in sources
+            for nested_object in get_nested_objects(source, path)
+        ]
+        return self.bucket(nested_sources, sub_aggs)
+
+    def agg_terms(self, body, sources, sub_aggs):
+        field = body["field"]
+        buckets = OrderedDict()
+        for source in sources:
+            seen = set()
+            for value in get_values(source, field):
+                key = value
+                if isinstance(value, float) and value.is_integer():
+                    key = int(value)
+                marker = (type(key).__name__, key)
+                if marker in seen:
+                    continue
+                seen.add(marker)
+                buckets.setdefault(marker, (key, []))[1].append(source)
+
+        entries = list(buckets.values())
+        order = body.get("order") or {"_count": "desc"}
+        if isinstance(order, list):
+            order = order[0]
+        [(order_by, direction)] = order.items()
+        reverse = direction == "desc"
+        if order_by == "_key":
+            entries.sort(key=lambda entry: coerce(entry[0]), reverse=reverse)
+        else:
+            entries.sort(key=lambda entry: str(entry[0]))
+            entries.sort(key=lambda entry: len(entry[1]), reverse=reverse)
+
+        min_doc_count = body.get("min_doc_count", 1)
+        size = body.get("size", 10)
+        result_buckets = []
+        for key, bucket_sources in entries:
+            if len(bucket_sources) < min_doc_count:
+                continue
+            extra = {"key": key}
+            if isinstance(key, bool):
+                extra = {"key": int(key), "key_as_string": str(key).lower()}
+            result_buckets.append(self.bucket(bucket_sources, sub_aggs, **extra))
+
+        return {
+            "doc_count_error_upper_bound": 0,
+            "sum_other_doc_count": sum(
+                bucket["doc_count"] for bucket in result_buckets[size:]
+            ),
+            "buckets": result_buckets[:size],
+        }
+
+    def agg_range(self, body, sources, sub_aggs):
+        field = body["field"]
+        buckets = []
+        for range_option in body["ranges"]:
+            conditions = {"gte": range_option.get("from"), "lt": range_option.get("to")}
+            key = range_option.get("key") or "%s-%s" % (
+                "*" if range_option.get("from") is None else range_option["from"],
+                "*" if range_option.get("to") is None else range_option["to"],
+            )
+            extra = {"key": key}
+            for bound in ("from", "to"):
+                if range_option.get(bound) is not None:
+                    extra[bound] = range_option[bound]
+            buckets.append(
+                self.bucket(
+                    [
+                        source
+                        for source in sources
+                        if any(
+                            in_range(value, conditions)
+                            for value in get_values(source, field)
+                        )
+                    ],
+                    sub_aggs,
+                    **extra,
+                )
+            )
+        if body.get("keyed"):
+            return {"buckets": {bucket.pop("key"): bucket for bucket in buckets}}
+        return {"buckets": buckets}
+
+    def agg_cardinality(self, body, sources, sub_aggs):
+        values = set()
+        for source in sources:
+            values.update(str(value) for value in get_values(source, body["field"]))
+        return {"value": len(values)}
+
+    def agg_value_count(self, body, sources, sub_aggs):
+        return {
+            "value": sum(len(get_values(source, body["field"])) for source in sources)
+        }
+
+    def _numeric_values(self, body, sources):
+        return [
+            float(value)
+            for source in sources
+            for value in get_values(source, body["field"])
+            if isinstance(coerce(value), float)
+        ]
+
+    def agg_min(self, body, sources, sub_aggs):
+        values = self._numeric_values(body, sources)
+        return {"value": min(values) if values else None}
+
+    def agg_max(self, body, sources, sub_aggs):
+        values = self._numeric_values(body, sources)
+        return {"value": max(values) if values else None}
+
+    def agg_sum(self, body, sources, sub_aggs):
+        return {"value": sum(self._numeric_values(body, sources))}
+
+    def agg_avg(self, body, sources, sub_aggs):
+        values = self._numeric_values(body, sources)
+        return {"value": sum(values) / len(values) if values else None}
+
+
+def filter_source(source, source_filter):
+    if source_filter is None or source_filter is True:
+        return source
+    if source_filter is False:
+        return None
+    if isinstance(source_filter, str):
+        source_filter = source_filter.split(",")
+    if isinstance(source_filter, list):
+        source_filter = {"includes": source_filter}
+
+    includes = source_filter.get("includes") or source_filter.get("include") or []
+    excludes = source_filter.get("excludes") or source_filter.get("exclude") or []
+    result = {}
+    for key, value in source.items():
+        if includes and not any(fnmatch.fnmatchcase(key, p) for p in includes):
+            continue
+        if any(fnmatch.fnmatchcase(key, p) for p in excludes):
+            continue
+        result[key] = value
+    return result
+
+
+def coerce_sortable(value):
+    value = coerce(value)
+    if isinstance(value, bool):
+        return (0, int(value))
+    if isinstance(value, float):
+        return (0, value)
+    return (1, str(value))
+
+
+def sort_value(source, field, descending):
+    values = [coerce_sortable(value) for value in get_values(source, field)]
+    if not values:
+        return None
+    return max(values) if descending else min(values)
+
+
+def is_after(values, search_after, specs):
+    """
+    Returns whether the sort values of a hit come after the `search_after` values.
+    """
+    for value, bound, (_, descending) in zip(values, search_after, specs):
+        if value is None or bound is None:
+            if value is None and bound is None:
+                continue
+            # Missing values are sorted last.
+            return value is None
+        left, right = coerce_sortable(value), coerce_sortable(bound)
+        if left != right:
+            return left < right if descending else left > right
+    return False
+
+
+def in_slice(source, slice_spec):
+    checksum = zlib.crc32(str(source["__id"]).encode("utf-8"))
+    return checksum % slice_spec["max"] == slice_spec["id"]
+
+
+class InMemoryNode(StubNode):
+    """
+    An in-process Elasticsearch replacement that keeps all documents in memory and
+    implements the subset of the query DSL this package generates: bool, term,
+    terms, range, exists, ids, nested, match, multi_match, rank_feature and
+    percolate queries, filter, nested, sampler, terms, range, cardinality and
+    simple metric aggregations, collapsing, sorting with search_after, slices,
+    aggregation profiles, points in time, delete/update by query (with the scripts
+    of this package), reindexing, aliases and (completed) tasks. It's meant for fast
+    tests and local development, relevance scoring is naive.
+    """
+
+    store = store
+
+    routes = StubNode.routes + [
+        (
+            "POST",
+            r"^/(?P<index>[^/_][^/]*)/_delete_by_query$",
+            "delete_by_query",
+        ),
+        (
+            "POST",
+            r"^/(?P<index>[^/_][^/]*)/_update_by_query$",
+            "update_by_query",
+        ),
+        ("POST", r"^/_reindex$", "reindex"),
+        ("GET", r"^/_tasks/(?P<task_id>[^/]+)$", "get_task"),
+        ("POST", r"^/_aliases$", "update_aliases"),
+        (
+            "HEAD",
+            r"^/(?:(?P<index>[^/_][^/]*)/)?_alias/(?P<name>[^/]+)$",
+            "exists_alias",
+        ),
+        (
+            "GET",
+            r"^/(?:(?P<index>[^/_][^/]*)/)?_alias(?:/(?P<name>[^/]+))?$",
+            "get_alias",
+        ),
+        ("GET", r"^/(?P<index>[^/_][^/]*)/_settings$", "get_settings"),
+        ("PUT", r"^/(?P<index>[^/_][^/]*)/_settings$", "put_settings"),
+    ]
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.query_evaluator = QueryEvaluator()
+        self.aggregation_evaluator = AggregationEvaluator(self.query_evaluator)
+
+    def error(self, status, error_type, reason):
+        return status, {
+            "error": {"type": error_type, "reason": reason},
+            "status": status,
+        }
+
+    def handle_index_exists(self, params, payload, index):
+        with self.store.lock:
+            return (200 if self.store.resolve(index) else 404), None
+
+    def handle_create_index(self, params, payload, index):
+        with self.store.lock:
+            if index in self.store.indices:
+                return self.error(
+                    400,
+                    "resource_already_exists_exception",
+                    f"index [{index}] already exists",
+                )
+            self.store.create_index(index, payload)
+        return 200, {"acknowledged": True, "shards_acknowledged": True, "index": index}
+
+    def handle_delete_index(self, params, payload, index):
+        with self.store.lock:
+            names = self.store.resolve(index)
+            if not names:
+                return self.error(404, "index_not_found_exception", "no such index")
+            for name in names:
+                del self.store.indices[name]
+                for members in self.store.aliases.values():
+                    members.discard(name)
+        return 200, {"acknowledged": True}
+
+    def handle_get_mapping(self, params, payload, index):
+        with self.store.lock:
+            return 200, {
+                name: {"mappings": copy.deepcopy(self.store.indices[name]["mappings"])}
+                for name in self.store.resolve(index)
+            }
+
+    def handle_put_mapping(self, params, payload, index):
+        with self.store.lock:
+            for name in self.store.resolve(index):
+                deep_merge(self.store.indices[name]["mappings"], payload or {})
+        return 200, {"acknowledged": True}
+
+    def handle_refresh(self, params, payload, index):
+        return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+    def get_write_index(self, index):
+        names = self.store.resolve(index)
+        if len(names) == 1:
+            return names[0]
+        if not names:
+            # Elasticsearch auto creates indices on write.
+            self.store.create_index(index)
+            return index
+        raise UnsupportedQuery(f"Can't write to multiple indices: {names}")
+
+    def write(self, action, meta, source):
+        index = self.get_write_index(meta["_index"])
+        docs = self.store.indices[index]["docs"]
+        doc_id = str(meta.get("_id"))
+        result = {"_index": index, "_id": doc_id}
+
+        if action in ("index", "create"):
+            if action == "create" and doc_id in docs:
+                return dict(
+                    result,
+                    status=409,
+                    error={"type": "version_conflict_engine_exception"},
+                )
+            created = doc_id not in docs
+            docs[doc_id] = copy.deepcopy(source)
+            return dict(
+                result,
+                status=201 if created else 200,
+                result="created" if created else "updated",
+            )
+
+        if action == "update":
+            if doc_id not in docs:
+                if source.get("doc_as_upsert"):
+                    docs[doc_id] = copy.deepcopy(source.get("doc", {}))
+                    return dict(result, status=201, result="created")
+                if "upsert" in source:
+                    docs[doc_id] = copy.deepcopy(source["upsert"])
+                    return dict(result, status=201, result="created")
+                return dict(
+                    result,
+                    status=404,
+                    error={
+                        "type": "document_missing_exception",
+                        "reason": f"[{doc_id}]: document missing",
+                    },
+                )
+            if "doc" not in source:
+                return dict(
+                    result,
+                    status=400,
+                    error={
+                        "type": "illegal_argument_exception",
+                        "reason": "Only partial doc updates are supported",
+                    },
+                )
+            deep_merge(docs[doc_id], source["doc"])
+            return dict(result, status=200, result="updated")
+
+        if action == "delete":
+            if docs.pop(doc_id, None) is None:
+                return dict(result, status=404, result="not_found")
+            return dict(result, status=200, result="deleted")
+
+        raise UnsupportedQuery(f"Unsupported bulk action '{action}'")
+
+    def handle_bulk(self, params, payload, index=None):
+        items = []
+        with self.store.lock:
+            for action, meta, source in iter_bulk_operations(payload or [], index):
+                items.append({action: self.write(action, meta, source)})
+        errors = any("error" in next(iter(item.values())) for item in items)
+        return 200, {"took": 0, "errors": errors, "items": items}
+
+    def handle_index_document(self, params, payload, index, doc_id):
+        with self.store.lock:
+            item = self.write("index", {"_index": index, "_id": doc_id}, payload)
+        return item.pop("status"), item
+
+    def handle_update_document(self, params, payload, index, doc_id):
+        with self.store.lock:
+            item = self.write("update", {"_index": index, "_id": doc_id}, payload)
+        status = item.pop("status")
+        if "error" in item:
+            return status, {"error": item["error"], "status": status}
+        return status, item
+
+    def handle_delete_document(self, params, payload, index, doc_id):
+        with self.store.lock:
+            item = self.write("delete", {"_index": index, "_id": doc_id}, None)
+        return item.pop("status"), item
+
+    def get_document(self, index, doc_id, source_filter=None):
+        for name in self.store.resolve(index):
+            source = self.store.indices[name]["docs"].get(str(doc_id))
+            if source is not None:
+                return {
+                    "_index": name,
+                    "_id": str(doc_id),
+                    "_version": 1,
+                    "found": True,
+                    "_source": filter_source(copy.deepcopy(source), source_filter),
+                }
+        return {"_index": index, "_id": str(doc_id), "found": False}
+
+    def handle_get_document(self, params, payload, index, doc_id):
+        with self.store.lock:
+            document = self.get_document(
+                index, doc_id, self.get_source_filter(params, None)
+            )
+        return (200 if document["found"] else 404), document
+
+    def handle_mget(self, params, payload, index=None):
+        payload = payload or {}
+        docs = payload.get("docs") or [{"_id": _id} for _id in payload.get("ids", [])]
+        with self.store.lock:
+            return 200, {
+                "docs": [
+                    self.get_document(
+                        doc.get("_index", index),
+                        doc["_id"],
+                        doc.get("_source", self.get_source_filter(params, None)),
+                    )
+                    for doc in docs
+                ]
+            }
+
+    def get_source_filter(self, params, payload):
+        if payload and "_source" in payload:
+            return payload["_source"]
+        if "_source" in params:
+            value = params["_source"]
+            if value in ("true", "false"):
+                return value == "true"
+            return value.split(",")
+        if "_source_includes" in params:
+            return params["_source_includes"].split(",")
+        return None
+
+    def get_sources(self, index):
+        sources = []
+        for name in self.store.resolve(index):
+            for doc_id, source in self.store.indices[name]["docs"].items():
+                sources.append(
+                    dict(source, __id=doc_id, __index=name, __seq=len(sources))
+                )
+        return sources
+
+    def get_search_sources(self, payload, index):
+        if payload.get("pit"):
+            pit_id = payload["pit"]["id"]
+            if pit_id not in self.store.points_in_time:
+                raise MissingPointInTime(f"No search context found for id [{pit_id}]")
+            return [dict(source) for source in self.store.points_in_time[pit_id]]
+        return self.get_sources(index)
+
+    def get_sort_specs(self, sort, tiebreaker=False):
+        """
+        Returns (field, descending) pairs. With `tiebreaker` (searches of a point in
+        time) ties are broken on _shard_doc, like Elasticsearch does.
+        """
+        if isinstance(sort, (str, dict)):
+            sort = [sort]
+        specs = []
+        for spec in sort:
+            if isinstance(spec, str):
+                field, order = spec, "desc" if spec == "_score" else "asc"
+            else:
+                [(field, options)] = spec.items()
+                order = options if isinstance(options, str) else options["order"]
+            specs.append((field, order == "desc"))
+        if tiebreaker and not any(f in ("_doc", "_shard_doc") for f, _ in specs):
+            specs.append(("_shard_doc", False))
+        return specs
+
+    def get_sort_values(self, score, source, specs):
+        values = []
+        for field, descending in specs:
+            if field == "_score":
+                values.append(score)
+            elif field in ("_doc", "_shard_doc"):
+                values.append(source["__seq"])
+            else:
+                field_values = get_values(source, field)
+                if not field_values:
+                    values.append(None)
+                    continue
+                pick = max if descending else min
+                values.append(pick(field_values, key=coerce_sortable))
+        return values
+
+    def sort_hits(self, hits, sort, tiebreaker=False):
+        # Python's sort is stable, so sorting by the keys in reverse order results in
+        # a multi key sort.
+        for field, descending in reversed(self.get_sort_specs(sort, tiebreaker)):
+            if field == "_score":
+                hits.sort(key=lambda hit: hit[0], reverse=descending)
+            elif field in ("_doc", "_shard_doc"):
+                hits.sort(key=lambda hit: hit[1]["__seq"], reverse=descending)
+            else:
+                present, missing = [], []
+                for hit in hits:
+                    value = sort_value(hit[1], field, descending)
+                    (missing if value is None else present).append((value, hit))
+                present.sort(key=lambda entry: entry[0], reverse=descending)
+                # Missing values are sorted last, like Elasticsearch does by default.
+                hits[:] = [hit for _, hit in present] + [hit for _, hit in missing]
+        return hits
+
+    def execute_search(self, params, payload, index, timings=None):
+        payload = payload or {}
+        sources = self.get_search_sources(payload, index)
+        if payload.get("slice"):
+            sources = [s for s in sources if in_slice(s, payload["slice"])]
+
+        scored = []
+        for source in sources:
+            score = self.query_evaluator.score(payload.get("query"), source)
+            if score is not None:
+                scored.append((score, source))
+
+        aggregations = None
+        if payload.get("aggs") or payload.get("aggregations"):
+            aggregations = self.aggregation_evaluator.run(
+                payload.get("aggs") or payload.get("aggregations"),
+                [source for _, source in scored],
+                timings,
+            )
+
+        if payload.get("post_filter"):
+            scored = [
+                (score, source)
+                for score, source in scored
+                if self.query_evaluator.matches(payload["post_filter"], source)
+            ]
+
+        sort = payload.get("sort") or ["_score"]
+        tiebreaker = bool(payload.get("pit"))
+        scored = self.sort_hits(scored, sort, tiebreaker)
+        if payload.get("sort") or payload.get("search_after") or tiebreaker:
+            specs = self.get_sort_specs(sort, tiebreaker)
+            for score, source in scored:
+                source["__sort"] = self.get_sort_values(score, source, specs)
+        return scored, aggregations
+
+    def collapse_hits(self, scored, collapse):
+        """
+        Keeps the best hit per value of the collapse field, the hits of every
+        group are kept for the inner hits.
+        """
+        groups = OrderedDict()
+        for score, source in scored:
+            values = get_values(source, collapse["field"])
+            key = values[0] if values else None
+            groups.setdefault(key, []).append((score, source))
+        collapsed = []
+        for key, group in groups.items():
+            score, source = group[0]
+            source["__collapse"] = (key, group)
+            collapsed.append((score, source))
+        return collapsed
+
+    def format_inner_hits(self, group, inner_hits):
+        if isinstance(inner_hits, dict):
+            inner_hits = [inner_hits]
+        formatted = {}
+        for options in inner_hits:
+            hits = self.sort_hits(list(group), options.get("sort") or ["_score"])
+            start = int(options.get("from", 0))
+            size = int(options.get("size", 3))
+            source_filter = options.get("_source")
+            formatted[options.get("name", "inner_hits")] = {
+                "hits": {
+                    "total": {"value": len(hits), "relation": "eq"},
+                    "max_score": max((score for score, _ in hits), default=None),
+                    "hits": [
+                        self.format_hit(score, source, source_filter, nested=True)
+                        for score, source in hits[start : start + size]
+                    ],
+                }
+            }
+        return formatted
+
+    def format_hit(self, score, source, source_filter, collapse=None, nested=False):
+        clean_source = {k: v for k, v in source.items() if not k.startswith("__")}
+        hit = {
+            "_index": source["__index"],
+            "_id": source["__id"],
+            "_score": score,
+        }
+        filtered = filter_source(clean_source, source_filter)
+        if filtered is not None:
+            hit["_source"] = filtered
+        if "__sort" in source and not nested:
+            hit["sort"] = source["__sort"]
+        if "__percolator_document_slot" in source:
+            hit["fields"] = {
+                "_percolator_document_slot": source["__percolator_document_slot"]
+            }
+        if collapse and "__collapse" in source and not nested:
+            key, group = source["__collapse"]
+            hit.setdefault("fields", {})[collapse["field"]] = [key]
+            if collapse.get("inner_hits"):
+                hit["inner_hits"] = self.format_inner_hits(
+                    group, collapse["inner_hits"]
+                )
+        return hit
+
+    def handle_search(self, params, payload, index=None):
+        payload = dict(payload or {})
+        for key in ("from", "size"):
+            if key in params:
+                payload.setdefault(key, int(params[key]))
+
+        try:
+            with self.store.lock:
+                if index and not self.store.resolve(index):
+                    return self.error(
+                        404, "index_not_found_exception", f"no such index [{index}]"
+                    )
+                timings = {} if payload.get("profile") else None
+                scored, aggregations = self.execute_search(
+                    params, payload, index, timings
+                )
+        except UnsupportedQuery as e:
+            return self.error(400, "parsing_exception", str(e))
+        except MissingPointInTime as e:
+            return self.error(404, "search_context_missing_exception", str(e))
+
+        total = len(scored)
+        relation = "eq"
+        track_total_hits = payload.get("track_total_hits", 10000)
+        if track_total_hits is not True and track_total_hits is not False:
+            if total > int(track_total_hits):
+                total, relation = int(track_total_hits), "gte"
+
+        if payload.get("search_after") is not None:
+            specs = self.get_sort_specs(
+                payload.get("sort") or ["_score"], bool(payload.get("pit"))
+            )
+            scored = [
+                (score, source)
+                for score, source in scored
+                if is_after(source["__sort"], payload["search_after"], specs)
+            ]
+        collapse = payload.get("collapse")
+        if collapse:
+            scored = self.collapse_hits(scored, collapse)
+
+        start = int(payload.get("from", 0))
+        size = int(payload.get("size", 10))
+        source_filter = self.get_source_filter(params, payload)
+        hits = [
+            self.format_hit(score, source, source_filter, collapse)
+            for score, source in scored[start : start + size]
+        ]
+        response = {
+            "took": 0,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": total, "relation": relation},
+                "max_score": max((hit["_score"] for hit in hits), default=None),
+                "hits": hits,
+            },
+        }
+        if aggregations is not None:
+            response["aggregations"] = aggregations
+        if timings is not None:
+            response["profile"] = self.get_profile(timings)
+        if payload.get("pit"):
+            response["pit_id"] = payload["pit"]["id"]
+        return 200, response
+
+    def get_profile(self, timings):
+        """
+        A profile with a single shard, that only holds the time spent in each
+        (top level) aggregation.
+        """
+        return {
+            "shards": [
+                {
+                    "id": "[in-memory][0]",
+                    "searches": [],
+                    "aggregations": [
+                        {
+                            "type": agg_type,
+                            "description": name,
+                            "time_in_nanos": nanos,
+                            "breakdown": {},
+                        }
+                        for name, (agg_type, nanos) in timings.items()
+                    ],
+                }
+            ]
+        }
+
+    def handle_count(self, params, payload, index=None):
+        try:
+            with self.store.lock:
+                scored, _ = self.execute_search(
+                    params, {"query": (payload or {}).get("query")}, index
+                )
+        except UnsupportedQuery as e:
+            return self.error(400, "parsing_exception", str(e))
+        return 200, {"count": len(scored)}
+
+    def handle_open_point_in_time(self, params, payload, index):
+        with self.store.lock:
+            if not self.store.resolve(index):
+                return self.error(
+                    404, "index_not_found_exception", f"no such index [{index}]"
+                )
+            pit_id = uuid.uuid4().hex
+            self.store.points_in_time[pit_id] = copy.deepcopy(self.get_sources(index))
+        return 200, {"id": pit_id}
+
+    def handle_close_point_in_time(self, params, payload):
+        with self.store.lock:
+            freed = self.store.points_in_time.pop((payload or {}).get("id"), None)
+        return 200, {"succeeded": True, "num_freed": 0 if freed is None else 1}
+
+    def get_script(self, script):
+        """
+        Returns a python function (source, params) equivalent to the painless script,
+        as only the scripts of this package are supported.
+        """
+        from .propagation import (
+            RENAME_ATTRIBUTE_OPTION_SCRIPT,
+            UPDATE_CATEGORY_SCRIPT,
+        )
+
+        scripts = {
+            RENAME_ATTRIBUTE_OPTION_SCRIPT: rename_attribute_option,
+            UPDATE_CATEGORY_SCRIPT: update_category,
+        }
+        if isinstance(script, str):
+            script = {"source": script}
+        function = scripts.get(script.get("source"))
+        if function is None:
+            raise UnsupportedQuery("Only the scripts of django_oscar_es are supported")
+        return lambda source: function(source, script.get("params") or {})
+
+    def get_matching_sources(self, index, payload):
+        query = (payload or {}).get("query")
+        return [
+            source
+            for source in self.get_sources(index)
+            if self.query_evaluator.matches(query, source)
+        ]
+
+    def task_response(self, params, action, result):
+        """
+        Operations run synchronously, without wait_for_completion the result is
+        stored as a completed task.
+        """
+        if params.get("wait_for_completion") != "false":
+            return 200, result
+        number = len(self.store.tasks) + 1
+        task_id = f"in-memory:{number}"
+        status = {
+            key: result[key]
+            for key in (
+                "total",
+                "created",
+                "updated",
+                "deleted",
+                "batches",
+                "version_conflicts",
+                "noops",
+            )
+        }
+        self.store.tasks[task_id] = {
+            "completed": True,
+            "task": {
+                "node": "in-memory",
+                "id": number,
+                "action": action,
+                "status": status,
+            },
+            "response": result,
+        }
+        return 200, {"task": task_id}
+
+    def by_query_result(self, total, **counts):
+        result = {
+            "took": 0,
+            "timed_out": False,
+            "total": total,
+            "created": 0,
+            "updated": 0,
+            "deleted": 0,
+            "batches": 1 if total else 0,
+            "version_conflicts": 0,
+            "noops": 0,
+            "failures": [],
+        }
+        result.update(counts)
+        return result
+
+    def handle_delete_by_query(self, params, payload, index):
+        try:
+            with self.store.lock:
+                if not self.store.resolve(index):
+                    return self.error(
+                        404, "index_not_found_exception", f"no such index [{index}]"
+                    )
+                matching = self.get_matching_sources(index, payload)
+                for source in matching:
+                    del self.store.indices[source["__index"]]["docs"][source["__id"]]
+                result = self.by_query_result(len(matching), deleted=len(matching))
+                return self.task_response(
+                    params, "indices:data/write/delete/byquery", result
+                )
+        except UnsupportedQuery as e:
+            return self.error(400, "parsing_exception", str(e))
+
+    def handle_update_by_query(self, params, payload, index):
+        try:
+            with self.store.lock:
+                if not self.store.resolve(index):
+                    return self.error(
+                        404, "index_not_found_exception", f"no such index [{index}]"
+                    )
+                script = (payload or {}).get("script")
+                run_script = self.get_script(script) if script else None
+                matching = self.get_matching_sources(index, payload)
+                for source in matching:
+                    docs = self.store.indices[source["__index"]]["docs"]
+                    if run_script:
+                        run_script(docs[source["__id"]])
+                result = self.by_query_result(len(matching), updated=len(matching))
+                return self.task_response(
+                    params, "indices:data/write/update/byquery", result
+                )
+        except UnsupportedQuery as e:
+            return self.error(400, "parsing_exception", str(e))
+
+    def handle_reindex(self, params, payload, index=None):
+        payload = payload or {}
+        source_index = payload["source"]["index"]
+        dest_index = payload["dest"]["index"]
+        try:
+            with self.store.lock:
+                if not self.store.resolve(source_index):
+                    return self.error(
+                        404,
+                        "index_not_found_exception",
+                        f"no such index [{source_index}]",
+                    )
+                created = updated = 0
+                sources = self.get_matching_sources(source_index, payload["source"])
+                for source in sources:
+                    item = self.write(
+                        "index",
+                        {"_index": dest_index, "_id": source["__id"]},
+                        {k: v for k, v in source.items() if not k.startswith("__")},
+                    )
+                    if item["result"] == "created":
+                        created += 1
+                    else:
+                        updated += 1
+                result = self.by_query_result(
+                    created + updated, created=created, updated=updated
+                )
+                return self.task_response(params, "indices:data/write/reindex", result)
+        except UnsupportedQuery as e:
+            return self.error(400, "parsing_exception", str(e))
+
+    def handle_get_task(self, params, payload, task_id):
+        task_id = unquote(task_id)
+        with self.store.lock:
+            task = self.store.tasks.get(task_id)
+        if task is None:
+            return self.error(
+                404, "resource_not_found_exception", f"task [{task_id}] isn't running"
+            )
+        return 200, copy.deepcopy(task)
+
+    def handle_update_aliases(self, params, payload):
+        with self.store.lock:
+            actions = (payload or {}).get("actions", [])
+            for action in actions:
+                [(action_type, options)] = action.items()
+                names = self.store.resolve(options["index"])
+                if not names:
+                    return self.error(
+                        404,
+                        "index_not_found_exception",
+                        f"no such index [{options['index']}]",
+                    )
+                if action_type not in ("add", "remove"):
+                    return self.error(
+                        400,
+                        "illegal_argument_exception",
+                        f"Unsupported alias action [{action_type}]",
+                    )
+            for action in actions:
+                [(action_type, options)] = action.items()
+                names = self.store.resolve(options["index"])
+                members = self.store.aliases.setdefault(options["alias"], set())
+                if action_type == "add":
+                    members.update(names)
+                else:
+                    members.difference_update(names)
+        return 200, {"acknowledged": True, "errors": False}
+
+    def get_aliases(self, index, name):
+        aliases = {}
+        for alias, members in self.store.aliases.items():
+            if name and not any(
+                fnmatch.fnmatchcase(alias, part) for part in name.split(",")
+            ):
+                continue
+            for member in members:
+                if not index or member in self.store.resolve(index):
+                    aliases.setdefault(member, {"aliases": {}})["aliases"][alias] = {}
+        return aliases
+
+    def handle_exists_alias(self, params, payload, name, index=None):
+        with self.store.lock:
+            return (200 if self.get_aliases(index, name) else 404), None
+
+    def handle_get_alias(self, params, payload, index=None, name=None):
+        with self.store.lock:
+            aliases = self.get_aliases(index, name)
+        if name and not aliases:
+            return 404, {"error": f"alias [{name}] missing", "status": 404}
+        return 200, aliases
+
+    def handle_get_settings(self, params, payload, index):
+        with self.store.lock:
+            names = self.store.resolve(index)
+            if not names:
+                return self.error(
+                    404, "index_not_found_exception", f"no such index [{index}]"
+                )
+            return 200, {
+                name: {"settings": copy.deepcopy(self.store.indices[name]["settings"])}
+                for name in names
+            }
+
+    def handle_put_settings(self, params, payload, index):
+        with self.store.lock:
+            names = self.store.resolve(index)
+            if not names:
+                return self.error(
+                    404, "index_not_found_exception", f"no such index [{index}]"
+                )
+            for name in names:
+                deep_merge(self.store.indices[name]["settings"], payload or {})
+        return 200, {"acknowledged": True}
+
+    def handle_default(self, method, path, params, payload):
+        return self.error(
+            400,
+            "unsupported_operation_exception",
+            f"The in-memory backend doesn't support {method} {path}",
+        )
+
+
+def use_fake_backend(alias="default", node_class=InMemoryNode):
+    """
+    Points the elasticsearch-dsl connection (and the ELASTICSEARCH_DSL setting that
+    django-elasticsearch-dsl configures itself with) at the in-memory backend.
+    """
+    es_settings = getattr(django_settings, "ELASTICSEARCH_DSL", None) or {}
+    alias_settings = es_settings.setdefault(alias, {})
+    alias_settings.setdefault("hosts", "http://in-memory:9200")
+    alias_settings["node_class"] = node_class
+    django_settings.ELASTICSEARCH_DSL = es_settings
+    connections.configure(**es_settings)
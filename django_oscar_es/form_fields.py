@@ -39,6 +39,32 @@ class DbRangeFacetField(RangeFacetField):
         self.formatter = db_facet.get_formatter()
 
 
+class LazyDbFacetField(forms.MultipleChoiceField, FilterField):
+    """
+    A term facet of which the values aren't aggregated with the search, these are
+    fetched separately when the facet is expanded. Only filters the results.
+    """
+
+    widget = forms.CheckboxSelectMultiple
+
+    def __init__(self, es_field, db_facet, selected=(), **kwargs):
+        kwargs.setdefault("required", False)
+        super().__init__(**kwargs)
+        self.es_field = es_field
+        self.db_facet = db_facet
+        self.label = db_facet.label or db_facet.field
+        # Only the selected values are known up front.
+        self.choices = [(value, value) for value in selected]
+
+    def valid_value(self, value):
+        return True
+
+    def get_es_filter_query(self, cleaned_data):
+        if cleaned_data:
+            return Q("terms", **{self.es_field: cleaned_data})
+        return None
+
+
 class PriceInputWidget(forms.MultiWidget):
     def __init__(self, attrs=None):
         widgets = [
@@ -10,6 +10,7 @@ from .form_fields import (
     PriceInputField,
     DbFacetField,
     DbRangeFacetField,
+    LazyDbFacetField,
 )
 from .models import ProductFacet
 
@@ -22,13 +23,42 @@ get_product_elasticsearch_settings = get_class(
 class BaseProductFacetedSearchForm(FacetedSearchForm):
     def __init__(self, *args, **kwargs):
         self.category = kwargs.pop("category", None)
+        # Only aggregate this facet (eg; to fetch the values of a lazy facet), the
+        # other term facets only filter the results.
+        self.facet = kwargs.pop("facet", None)
         super().__init__(*args, **kwargs)
         self.load_db_facets()
 
+    def is_lazy_facet(self, db_facet):
+        if self.facet is not None:
+            return db_facet.pk != self.facet.pk
+        return db_facet.lazy
+
+    def get_lazy_facet_fields(self):
+        return [
+            self[name]
+            for name, field in self.fields.items()
+            if isinstance(field, LazyDbFacetField)
+        ]
+
     def load_db_facets(self):
         db_facets = ProductFacet.get_facets_for_category(self.category)
         for db_facet in db_facets:
-            if db_facet.facet_type == ProductFacet.FACET_TYPE_TERM:
+            if (
+                db_facet.facet_type == ProductFacet.FACET_TYPE_TERM
+                and self.is_lazy_facet(db_facet)
+            ):
+                selected = (
+                    self.data.getlist(db_facet.field)
+                    if hasattr(self.data, "getlist")
+                    else []
+                )
+                self.fields[db_facet.field] = LazyDbFacetField(
+                    es_field=db_facet.field,
+                    db_facet=db_facet,
+                    selected=selected,
+                )
+            elif db_facet.facet_type == ProductFacet.FACET_TYPE_TERM:
                 self.fields[db_facet.field] = DbFacetField(
                     es_field=db_facet.field,
                     field_type=str,
@@ -0,0 +1,225 @@
+import logging
+
+from datetime import datetime
+
+from elasticsearch_dsl.connections import connections
+
+from django.db.models import Q
+
+from .indexing import mark_new_index
+from .scanning import point_in_time, scan_point_in_time
+from .settings import ADAPTIVE_BULK, get_product_document, get_product_index
+from .tasks import wait_for_task
+from .utils import chunked
+
+logger = logging.getLogger(__name__)
+
+
+class IndexGenerationError(Exception):
+    pass
+
+
+class IndexGenerations:
+    """
+    Manages "generations" of the product index. The product index name is used as
+    an alias pointing to a concrete, timestamped index (the same naming scheme as
+    django-elasticsearch-dsl's `search_index --use-alias`), which allows building
+    a new generation next to the live one and swapping it in atomically.
+    """
+
+    def __init__(self, index=None, using="default"):
+        self.index = index or get_product_index()
+        self.alias = self.index._name
+        self.using = using
+
+    @property
+    def client(self):
+        return connections.get_connection(self.using)
+
+    def get_live_indices(self):
+        if not self.client.indices.exists_alias(name=self.alias):
+            if self.client.indices.exists(index=self.alias):
+                raise IndexGenerationError(
+                    f"'{self.alias}' is a concrete index and not an alias. Rebuild it "
+                    "once with `search_index --rebuild --use-alias` first."
+                )
+            return []
+        return sorted(self.client.indices.get_alias(name=self.alias).keys())
+
+    def get_live_index(self):
+        live_indices = self.get_live_indices()
+        if len(live_indices) > 1:
+            raise IndexGenerationError(
+                f"The alias '{self.alias}' points to multiple indices: {live_indices}"
+            )
+        return live_indices[0] if live_indices else None
+
+    def get_new_index_name(self):
+        return f"{self.alias}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+    def create(self, name=None, bulk_settings=True):
+        """
+        Creates a new generation from the current index definition (analysis,
+        settings and the mapping of the product document). With `bulk_settings`
+        refreshes and replicas are disabled until `finalize` is called.
+        """
+        name = name or self.get_new_index_name()
+        new_index = self.index.clone(name=name)
+        new_index.create(using=self.using)
+        mark_new_index(name)
+        if bulk_settings:
+            self.client.indices.put_settings(
+                index=name,
+                settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}},
+            )
+        logger.info("Created index %s", name)
+        return name
+
+    def finalize(self, name):
+        index_settings = self.index.to_dict().get("settings", {})
+        self.client.indices.put_settings(
+            index=name,
+            settings={
+                "index": {
+                    "refresh_interval": index_settings.get("refresh_interval", "1s"),
+                    "number_of_replicas": index_settings.get("number_of_replicas", 0),
+                }
+            },
+        )
+        self.client.indices.refresh(index=name)
+
+    def swap(self, name, delete_old=False):
+        old_indices = self.get_live_indices()
+        actions = [{"add": {"index": name, "alias": self.alias}}]
+        actions += [
+            {"remove": {"index": old_index, "alias": self.alias}}
+            for old_index in old_indices
+            if old_index != name
+        ]
+        self.client.indices.update_aliases(actions=actions)
+        logger.info("Alias %s now points to %s", self.alias, name)
+
+        if delete_old:
+            for old_index in old_indices:
+                if old_index != name:
+                    self.client.indices.delete(index=old_index)
+                    logger.info("Deleted index %s", old_index)
+        return old_indices
+
+    def reindex(
+        self,
+        source,
+        dest,
+        slices="auto",
+        requests_per_second=-1,
+        poll_interval=5,
+        callback=None,
+    ):
+        """
+        Copies all documents from `source` to `dest` with Elasticsearch's _reindex,
+        using sliced parallelism, and waits for the task to complete.
+        """
+        response = self.client.reindex(
+            source={"index": source},
+            dest={"index": dest},
+            slices=slices,
+            requests_per_second=requests_per_second,
+            conflicts="proceed",
+            wait_for_completion=False,
+        )
+        progress = wait_for_task(
+            self.client, response["task"], poll_interval=poll_interval, callback=callback
+        )
+        if progress["error"] or progress["failures"]:
+            raise IndexGenerationError(
+                "Reindexing %s into %s failed: %s"
+                % (source, dest, progress["error"] or progress["failures"][:5])
+            )
+        return progress
+
+
+def refresh_fields_from_db(index_name, fields, chunk_size=500, callback=None):
+    """
+    Re-prepares only the given fields of every product from the database and sends
+    them as partial updates to the given index.
+    """
+    document = get_product_document()()
+    queryset = document.get_queryset().order_by("pk")
+    total = queryset.count()
+    done = 0
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        document.partial_update(
+            chunk, fields=fields, index=index_name, adaptive=ADAPTIVE_BULK
+        )
+        last_pk = chunk[-1].pk
+        done += len(chunk)
+        if callback:
+            callback(done, total)
+    return done
+
+
+def index_changed_since(index_name, since, chunk_size=500, callback=None):
+    """
+    Indexes the products that changed since `since` (the product itself, or one of
+    its own or its children's stockrecords) into the given index. Realtime updates
+    go to the index behind the alias, so this catches up a new generation with the
+    changes made while it was being built.
+    """
+    document = get_product_document()()
+    document.target_index = index_name
+    changed_ids = (
+        document.django.model.objects.filter(
+            Q(date_updated__gte=since)
+            | Q(stockrecords__date_updated__gte=since)
+            | Q(children__stockrecords__date_updated__gte=since)
+        )
+        .values_list("pk", flat=True)
+        .distinct()
+        .order_by("pk")
+    )
+    changed_ids = list(changed_ids)
+    done = 0
+    for start in range(0, len(changed_ids), chunk_size):
+        chunk_ids = changed_ids[start : start + chunk_size]
+        chunk = list(document.get_queryset().filter(pk__in=chunk_ids).order_by("pk"))
+        if chunk:
+            document.update(chunk, refresh=False, adaptive=ADAPTIVE_BULK)
+        done += len(chunk_ids)
+        if callback:
+            callback(done, len(changed_ids))
+    return done
+
+
+def delete_missing_products(index_name, chunk_size=500, using="default"):
+    """
+    Deletes the documents of products that no longer exist in the database from
+    the given index. Realtime deletes go to the index behind the alias, so this
+    removes the products deleted while a new generation was being built.
+    """
+    document = get_product_document()()
+    document.target_index = index_name
+    Product = document.django.model
+    client = connections.get_connection(using)
+    # Documents written since the last refresh aren't visible to a point in time.
+    client.indices.refresh(index=index_name)
+
+    deleted = 0
+    with point_in_time(index_name, using=using) as pit_id:
+        hits = scan_point_in_time(
+            pit_id, sort=[{"id": "asc"}], source=False, size=chunk_size, using=using
+        )
+        for chunk in chunked(hits, chunk_size):
+            ids = [hit["sort"][0] for hit in chunk]
+            existing = set(
+                Product.objects.filter(pk__in=ids).values_list("pk", flat=True)
+            )
+            missing = [pk for pk in ids if pk not in existing]
+            document.delete_by_ids(missing)
+            deleted += len(missing)
+    if deleted:
+        logger.info("Deleted %s removed products from %s", deleted, index_name)
+    return deleted
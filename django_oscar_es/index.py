@@ -1,9 +1,22 @@
 from elasticsearch_dsl import Index, analyzer, tokenizer, token_filter
 
-product_index = Index("products").settings(
-    number_of_shards=1,
+from .indexing import mark_new_index
+from .settings import NUMBER_OF_REPLICAS, NUMBER_OF_SHARDS
+
+
+class ProductIndex(Index):
+    def create(self, using=None, **kwargs):
+        response = super().create(using=using, **kwargs)
+        # Documents populated into a fresh index don't have to be compared with
+        # their indexed version.
+        mark_new_index(self._name)
+        return response
+
+
+product_index = ProductIndex("products").settings(
+    number_of_shards=NUMBER_OF_SHARDS,
     max_ngram_diff=15,
-    number_of_replicas=0,
+    number_of_replicas=NUMBER_OF_REPLICAS,
     analysis={
         "analyzer": {
             "title_analyzer": {
@@ -0,0 +1,191 @@
+import threading
+
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import metrics
+from .routing import get_routing
+from .settings import ADAPTIVE_BULK, PARTIAL_UPDATE_CHUNK_SIZE, get_product_document
+from .utils import chunked, on_commit_once
+
+_state = threading.local()
+# Indices created by this process, these can't hold any (unchanged) documents yet.
+_new_indices = set()
+
+
+def _get_pending(name):
+    if not hasattr(_state, name):
+        setattr(_state, name, set())
+    return getattr(_state, name)
+
+
+def _get_pending_stock_updates():
+    return _get_pending("pending_stock_updates")
+
+
+def is_autosync_enabled():
+    return getattr(settings, "ELASTICSEARCH_DSL_AUTOSYNC", True)
+
+
+def schedule_stock_update(product_ids):
+    """
+    Collects the given product ids and sends partial stock updates for all of them
+    at once when the current transaction commits.
+    """
+    if is_indexing_suspended():
+        record_suspended_update(product_ids)
+        return
+    pending = _get_pending_stock_updates()
+    pending.update(product_ids)
+    metrics.indexing_queue_depth.set(len(pending), queue="stock")
+    on_commit_once(flush_stock_updates)
+
+
+def flush_stock_updates():
+    pending = _get_pending_stock_updates()
+    product_ids = sorted(pending)
+    pending.clear()
+    metrics.indexing_queue_depth.set(0, queue="stock")
+    if product_ids:
+        update_stock(product_ids)
+
+
+def update_stock(product_ids):
+    document = get_product_document()()
+    queryset = document.get_partial_queryset().filter(pk__in=product_ids)
+    for chunk in chunked(queryset.iterator(), PARTIAL_UPDATE_CHUNK_SIZE):
+        document.partial_update(chunk, fields=document.stock_fields)
+
+
+def schedule_routing_update(product_ids):
+    """
+    Collects products whose routing value may have changed (eg; because their
+    categories changed), these are moved to the right shard when the current
+    transaction commits.
+    """
+    if get_routing() is None:
+        return
+    _get_pending("pending_routing_updates").update(product_ids)
+    on_commit_once(flush_routing_updates)
+
+
+def flush_routing_updates():
+    pending = _get_pending("pending_routing_updates")
+    product_ids = sorted(pending)
+    pending.clear()
+    if not product_ids:
+        return
+
+    document = get_product_document()()
+    # Children are routed like their parent, so these have to move as well.
+    queryset = document.get_queryset().filter(
+        Q(pk__in=product_ids) | Q(parent_id__in=product_ids)
+    )
+    for chunk in chunked(queryset.iterator(), PARTIAL_UPDATE_CHUNK_SIZE):
+        document.delete_stale_routed_documents(chunk)
+        document.update(chunk)
+
+
+def is_indexing_suspended():
+    return getattr(_state, "suspended", 0) > 0
+
+
+def record_suspended_update(product_ids, delete=False):
+    updates = _get_pending("suspended_updates")
+    deletes = _get_pending("suspended_deletes")
+    if delete:
+        updates.difference_update(product_ids)
+        deletes.update(product_ids)
+    else:
+        deletes.difference_update(product_ids)
+        updates.update(product_ids)
+    metrics.indexing_queue_depth.set(len(updates) + len(deletes), queue="suspended")
+
+
+def flush_suspended_updates():
+    if is_indexing_suspended():
+        # A new suspend_indexing block was entered before the transaction of the
+        # previous one committed, the updates are flushed when that one exits.
+        return
+
+    updates = _get_pending("suspended_updates")
+    deletes = _get_pending("suspended_deletes")
+    product_ids, deleted_ids = sorted(updates), set(deletes)
+    updates.clear()
+    deletes.clear()
+    metrics.indexing_queue_depth.set(0, queue="suspended")
+
+    document = get_product_document()()
+    if product_ids:
+        indexed_ids = set()
+
+        def iter_products():
+            queryset = document.get_queryset().filter(pk__in=product_ids)
+            for product in queryset.iterator(chunk_size=PARTIAL_UPDATE_CHUNK_SIZE):
+                indexed_ids.add(product.pk)
+                yield product
+
+        # The adaptive bulk indexer already sends concurrent requests.
+        document.update(
+            iter_products(), parallel=not ADAPTIVE_BULK, adaptive=ADAPTIVE_BULK
+        )
+        # Products that were saved but no longer exist (eg; because the import
+        # was rolled back) are removed as well.
+        deleted_ids.update(set(product_ids) - indexed_ids)
+
+    for chunk in chunked(sorted(deleted_ids), PARTIAL_UPDATE_CHUNK_SIZE):
+        document.delete_by_ids(chunk)
+
+
+class suspend_indexing(ContextDecorator):  # pylint: disable=invalid-name
+    """
+    Records the products that would be (re)indexed or deleted by the realtime
+    signal processor instead of sending a request per save, and indexes all of them
+    in bulk when the outermost block exits (or when the surrounding transaction
+    commits). Only affects the current thread.
+
+        with suspend_indexing():
+            for row in rows:
+                import_product(row)
+    """
+
+    def __enter__(self):
+        _state.suspended = getattr(_state, "suspended", 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.suspended -= 1
+        if not _state.suspended:
+            on_commit_once(flush_suspended_updates)
+        return False
+
+
+def schedule_percolation(product_ids):
+    """
+    Collects the ids of updated product documents, which are queued to be matched
+    against the saved searches (in the background) when the current transaction
+    commits.
+    """
+    _get_pending("pending_percolation").update(product_ids)
+    on_commit_once(flush_percolation)
+
+
+def flush_percolation():
+    # pylint: disable=import-outside-toplevel
+    from .saved_searches import percolation_queue
+
+    pending = _get_pending("pending_percolation")
+    product_ids = sorted(pending)
+    pending.clear()
+    if product_ids:
+        percolation_queue.add(product_ids)
+
+
+def mark_new_index(name):
+    _new_indices.add(name)
+
+
+def is_new_index(name):
+    return name in _new_indices
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from oscar.core.loading import get_class
+
+SyntheticCatalogue = get_class("django_oscar_es.benchmark", "SyntheticCatalogue")
+CatalogueBenchmark = get_class("django_oscar_es.benchmark", "CatalogueBenchmark")
+stub_connection = get_class("django_oscar_es.stub_transport", "stub_connection")
+refresh_product_elasticsearch_settings = get_class(
+    "django_oscar_es.cache", "refresh_product_elasticsearch_settings"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic catalogue and benchmarks document preparation, facet "
+        "loading, form construction and query building against an in-process stub "
+        "Elasticsearch. The generated catalogue is rolled back afterwards unless "
+        "--keep is passed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--variants", type=int, default=3)
+        parser.add_argument("--parent-ratio", type=float, default=0.2)
+        parser.add_argument("--attributes", type=int, default=8)
+        parser.add_argument("--options-per-attribute", type=int, default=12)
+        parser.add_argument("--root-categories", type=int, default=5)
+        parser.add_argument("--categories-per-root", type=int, default=10)
+        parser.add_argument("--facets", type=int, default=6)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--label", default="", help="A label (eg; a commit hash) for the results."
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON results to this file instead of stdout."
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the generated catalogue in the database.",
+        )
+
+    def handle(self, *args, **options):
+        with stub_connection(), transaction.atomic():
+            catalogue = SyntheticCatalogue(
+                products=options["products"],
+                variants=options["variants"],
+                parent_ratio=options["parent_ratio"],
+                attributes=options["attributes"],
+                options_per_attribute=options["options_per_attribute"],
+                root_categories=options["root_categories"],
+                categories_per_root=options["categories_per_root"],
+                facets=options["facets"],
+                seed=options["seed"],
+            ).generate()
+            results = CatalogueBenchmark(catalogue, repeat=options["repeat"]).run()
+            results["meta"]["label"] = options["label"]
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        # The cached settings may reference the generated (and now rolled back) facets.
+        refresh_product_elasticsearch_settings()
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
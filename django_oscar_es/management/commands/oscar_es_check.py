@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from oscar.core.loading import get_class
+
+ConsistencyChecker = get_class("django_oscar_es.consistency", "ConsistencyChecker")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the products in the database with the product index and lists "
+        "missing, stale and orphaned documents. With --repair only those are "
+        "reindexed or deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Reindex missing and stale products and delete orphaned documents.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=50,
+            help="The maximum number of ids to list per category.",
+        )
+
+    def handle(self, *args, **options):
+        checker = ConsistencyChecker(
+            chunk_size=options["chunk_size"], workers=options["workers"]
+        )
+
+        def on_progress(report, total_ranges):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"  {report.checked} products checked")
+
+        report = checker.run(callback=on_progress)
+
+        limit = options["limit"]
+        for name in ("missing", "stale", "orphaned"):
+            ids = sorted(getattr(report, name))
+            listed = ", ".join(str(pk) for pk in ids[:limit])
+            if len(ids) > limit:
+                listed += ", ..."
+            self.stdout.write(f"{name.capitalize()}: {len(ids)} {listed}".rstrip())
+
+        if not report:
+            self.stdout.write(
+                self.style.SUCCESS(f"All {report.checked} products are up to date.")
+            )
+        elif options["repair"]:
+            checker.repair(report)
+            self.stdout.write(self.style.SUCCESS("Repaired the index."))
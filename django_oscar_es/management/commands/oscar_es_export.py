@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar.core.loading import get_class
+
+export_products = get_class("django_oscar_es.export", "export_products")
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams the product documents from the index (instead of the database) "
+        "as JSON Lines or CSV, eg; to generate product feeds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+        parser.add_argument(
+            "--field",
+            action="append",
+            default=[],
+            dest="fields",
+            help="A (dotted) field to export, can be passed multiple times. Required "
+            "for CSV, JSON Lines exports the whole document by default.",
+        )
+        parser.add_argument("--output", help="Write to this file instead of stdout.")
+        parser.add_argument(
+            "--slices", type=int, default=4, help="The number of parallel readers."
+        )
+        parser.add_argument("--page-size", type=int, default=1000)
+        parser.add_argument(
+            "--public-only",
+            action="store_true",
+            help="Only export public products.",
+        )
+
+    def handle(self, *args, **options):
+        if options["format"] == "csv" and not options["fields"]:
+            raise CommandError("Pass the columns of the CSV export with --field.")
+
+        query = {"term": {"is_public": True}} if options["public_only"] else None
+        kwargs = {
+            "output_format": options["format"],
+            "fields": options["fields"] or None,
+            "query": query,
+            "slices": options["slices"],
+            "size": options["page_size"],
+        }
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as f:
+                count = export_products(f, **kwargs)
+            self.stderr.write(f"Exported {count} products to {options['output']}")
+        else:
+            count = export_products(sys.stdout, **kwargs)
+            self.stderr.write(f"Exported {count} products")
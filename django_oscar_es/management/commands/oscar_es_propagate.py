@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from oscar.core.loading import get_class
+
+check_propagation_tasks = get_class(
+    "django_oscar_es.propagation", "check_propagation_tasks"
+)
+run_pending_propagation_jobs = get_class(
+    "django_oscar_es.propagation", "run_pending_propagation_jobs"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the scheduled bulk propagation jobs, and stores the outcome of the "
+        "update_by_query tasks started to propagate renames. Run it periodically, "
+        "or with --wait from a worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wait",
+            action="store_true",
+            help="Keep polling until all update_by_query tasks are completed.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=5)
+
+    def handle(self, *args, **options):
+        for record in run_pending_propagation_jobs(
+            callback=lambda done, total: self.stdout.write(
+                f"  {done}/{total} documents updated"
+            )
+        ):
+            self.stdout.write(str(record))
+
+        while True:
+            running = check_propagation_tasks()
+            for record in running:
+                self.stdout.write(
+                    f"{record}: {record.updated}/{record.total} documents updated"
+                )
+            if not running or not options["wait"]:
+                break
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar.core.loading import get_class
+
+ResumableRebuild = get_class("django_oscar_es.rebuild", "ResumableRebuild")
+IndexGenerationError = get_class(
+    "django_oscar_es.generations", "IndexGenerationError"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the product index into a new index generation in primary key "
+        "ordered chunks, storing a checkpoint after every chunk. An interrupted "
+        "rebuild continues from its last completed chunk with --resume. Products "
+        "changed or deleted in the meantime are caught up before and right after "
+        "the alias is swapped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last unfinished rebuild instead of starting a new one.",
+        )
+        parser.add_argument(
+            "--delete-old",
+            action="store_true",
+            help="Delete the previous index after swapping the alias.",
+        )
+        parser.add_argument(
+            "--no-swap",
+            action="store_true",
+            help="Leave the alias untouched, eg; to inspect the new index first. "
+            "Swap it later with --resume.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options["resume"]:
+                rebuild = ResumableRebuild.resume()
+            else:
+                rebuild = ResumableRebuild.start(chunk_size=options["chunk_size"])
+        except IndexGenerationError as e:
+            raise CommandError(str(e)) from e
+
+        checkpoint = rebuild.checkpoint
+        self.stdout.write(
+            f"Rebuilding into {checkpoint.index_name}, starting after pk "
+            f"{checkpoint.last_pk}"
+        )
+
+        def on_progress(checkpoint, eta):
+            self.stdout.write(
+                f"  {checkpoint.indexed}/{checkpoint.total} products indexed, "
+                f"ETA {eta or '-'}"
+            )
+
+        rebuild.run(callback=on_progress)
+        rebuild.finish(
+            swap=not options["no_swap"],
+            delete_old=options["delete_old"],
+            callback=lambda done, total: self.stdout.write(
+                f"  {done}/{total} changed products indexed"
+            ),
+        )
+        if options["no_swap"]:
+            self.stdout.write(
+                f"Built {checkpoint.index_name}, the alias was not swapped. Run "
+                "with --resume to catch up and swap it."
+            )
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {checkpoint.index_name} ({checkpoint.total})")
+        )
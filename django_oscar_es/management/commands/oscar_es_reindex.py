@@ -0,0 +1,142 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from oscar.core.loading import get_class
+
+IndexGenerations = get_class("django_oscar_es.generations", "IndexGenerations")
+IndexGenerationError = get_class(
+    "django_oscar_es.generations", "IndexGenerationError"
+)
+refresh_fields_from_db = get_class(
+    "django_oscar_es.generations", "refresh_fields_from_db"
+)
+index_changed_since = get_class("django_oscar_es.generations", "index_changed_since")
+delete_missing_products = get_class(
+    "django_oscar_es.generations", "delete_missing_products"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a new generation of the product index with the current analysis "
+        "settings and mapping, copies the documents server side with _reindex and "
+        "swaps the alias. Products changed in the meantime are indexed into the new "
+        "index (and deleted products removed from it) before and right after the "
+        "swap. Use this when only the index definition changed; when prepared "
+        "values changed, pass the affected fields with --refresh-field or do a full "
+        "rebuild."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--slices",
+            default="auto",
+            help="Number of slices to parallelize the reindex with (default: auto).",
+        )
+        parser.add_argument(
+            "--requests-per-second",
+            type=float,
+            default=-1,
+            help="Throttle the reindex, -1 (the default) disables throttling.",
+        )
+        parser.add_argument(
+            "--refresh-field",
+            action="append",
+            default=[],
+            dest="refresh_fields",
+            help="Re-prepare this field from the database after copying, can be "
+            "passed multiple times.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=5)
+        parser.add_argument(
+            "--delete-old",
+            action="store_true",
+            help="Delete the previous index after swapping the alias.",
+        )
+        parser.add_argument(
+            "--no-swap",
+            action="store_true",
+            help="Leave the alias untouched, eg; to inspect the new index first.",
+        )
+
+    def handle(self, *args, **options):
+        generations = IndexGenerations()
+        slices = options["slices"]
+        if slices != "auto":
+            slices = int(slices)
+
+        try:
+            old_index = generations.get_live_index()
+        except IndexGenerationError as e:
+            raise CommandError(str(e)) from e
+        if old_index is None:
+            raise CommandError(
+                f"There is no index behind '{generations.alias}' to reindex from, "
+                "use `search_index --rebuild --use-alias` instead."
+            )
+
+        # Realtime updates keep going to the old index while copying.
+        started = timezone.now()
+        new_index = generations.create()
+        self.stdout.write(f"Reindexing {old_index} into {new_index}")
+
+        def on_progress(progress):
+            processed = progress["created"] + progress["updated"]
+            self.stdout.write(f"  {processed}/{progress['total']} documents copied")
+
+        try:
+            generations.reindex(
+                old_index,
+                new_index,
+                slices=slices,
+                requests_per_second=options["requests_per_second"],
+                poll_interval=options["poll_interval"],
+                callback=on_progress,
+            )
+            if options["refresh_fields"]:
+                self.stdout.write(
+                    "Refreshing %s from the database"
+                    % ", ".join(options["refresh_fields"])
+                )
+                refresh_fields_from_db(
+                    new_index,
+                    options["refresh_fields"],
+                    callback=lambda done, total: self.stdout.write(
+                        f"  {done}/{total} documents refreshed"
+                    ),
+                )
+            caught_up = timezone.now()
+            self.catch_up(new_index, started)
+            generations.finalize(new_index)
+        except Exception:
+            self.stderr.write(f"Reindexing failed, {new_index} is left for inspection.")
+            raise
+
+        if options["no_swap"]:
+            self.stdout.write(
+                f"Created {new_index}, the alias was not swapped. Products changed "
+                "from now on are only indexed into the live index."
+            )
+            return
+
+        generations.swap(new_index, delete_old=options["delete_old"])
+        # Changes made while catching up, until the swap, only reached the old index.
+        self.catch_up(new_index, caught_up)
+        self.stdout.write(
+            self.style.SUCCESS(f"'{generations.alias}' now points to {new_index}")
+        )
+
+    def catch_up(self, index_name, since):
+        count = index_changed_since(
+            index_name,
+            since,
+            callback=lambda done, total: self.stdout.write(
+                f"  {done}/{total} changed products indexed"
+            ),
+        )
+        if count:
+            self.stdout.write(f"Indexed {count} products changed since {since}")
+        # Realtime deletes only reached the old index.
+        deleted = delete_missing_products(index_name)
+        if deleted:
+            self.stdout.write(f"Deleted {deleted} removed products from {index_name}")
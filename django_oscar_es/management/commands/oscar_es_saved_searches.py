@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from oscar.core.loading import get_class
+
+create_saved_search_index = get_class(
+    "django_oscar_es.saved_searches", "create_saved_search_index"
+)
+index_all_saved_searches = get_class(
+    "django_oscar_es.saved_searches", "index_all_saved_searches"
+)
+
+
+class Command(BaseCommand):
+    help = "Indexes all active saved searches in the percolator index."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recreate the percolator index first, eg; after mapping changes.",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            create_saved_search_index()
+        count = index_all_saved_searches()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} saved searches."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from oscar.core.loading import get_class
+
+sync_attribute_mapping = get_class("django_oscar_es.schema", "sync_attribute_mapping")
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds the mapping for product attributes that don't exist in the live index "
+        "yet, and reports attributes whose type conflicts with the live mapping."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the differences, don't update the mapping.",
+        )
+
+    def handle(self, *args, **options):
+        diff = sync_attribute_mapping(dry_run=options["dry_run"])
+
+        if not diff:
+            self.stdout.write("The attributes mapping is up to date.")
+            return
+
+        for code, properties in diff.added.items():
+            self.stdout.write(
+                self.style.SUCCESS(f"Added '{code}' ({properties['type']})")
+                if not options["dry_run"]
+                else f"Would add '{code}' ({properties['type']})"
+            )
+
+        for code, (live_type, wanted_type) in diff.conflicts.items():
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Conflict for '{code}': mapped as '{live_type}', "
+                    f"should be '{wanted_type}'"
+                )
+            )
+        if diff.conflicts:
+            product_ids = diff.get_conflicting_product_ids()
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(product_ids)} products have a conflicting attribute and "
+                    "need to be reindexed into a new index."
+                )
+            )
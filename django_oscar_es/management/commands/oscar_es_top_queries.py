@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from oscar.core.loading import get_class
+
+get_top_queries = get_class("django_oscar_es.search_analytics", "get_top_queries")
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the most searched queries, one per line, eg; to warm caches with "
+        "or to find queries that need synonyms."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100)
+        parser.add_argument(
+            "--zero-results",
+            action="store_true",
+            help="Print the queries that most often found nothing instead.",
+        )
+
+    def handle(self, *args, **options):
+        for query in get_top_queries(
+            limit=options["limit"], zero_results=options["zero_results"]
+        ):
+            self.stdout.write(query)
@@ -0,0 +1,331 @@
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django.utils.module_loading import import_string
+
+from .settings import METRICS_CALLBACKS, METRICS_PREFIX
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+DEFAULT_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DEFAULT_LAG_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 21600, 86400)
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels_key, extra=()):
+    pairs = list(labels_key) + list(extra)
+    if not pairs:
+        return ""
+    formatted = ",".join(
+        '%s="%s"' % (key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return "{%s}" % formatted
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    metric_type = None
+
+    def __init__(self, registry, name, documentation=""):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _notify(self, value, labels):
+        self.registry.notify(self, value, labels)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        raise NotImplementedError
+
+    def to_prometheus_text(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, labels_key, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(labels_key)} {_format_value(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError(
+                "Counters can only be incremented by non-negative amounts."
+            )
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._notify(amount, labels)
+
+    def get(self, **labels):
+        return self._values.get(_labels_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_labels_key(labels)] = value
+        self._notify(value, labels)
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+            value = self._values[key]
+        self._notify(value, labels)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self._values.get(_labels_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self, registry, name, documentation="", buckets=DEFAULT_LATENCY_BUCKETS
+    ):
+        super().__init__(registry, name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0, 0)
+            )
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+        self._notify(value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get(self, **labels):
+        """
+        Returns a (count, sum) tuple for the given labels.
+        """
+        _, total, count = self._values.get(_labels_key(labels), (None, 0, 0))
+        return count, total
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for upper_bound, bucket_count in zip(self.buckets, counts):
+                    samples.append(
+                        (
+                            "_bucket",
+                            key + (("le", _format_value(upper_bound)),),
+                            bucket_count,
+                        )
+                    )
+                samples.append(("_sum", key, total))
+                samples.append(("_count", key, count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    A minimal, dependency free metrics registry. Metrics can be scraped in the
+    Prometheus text format through `to_prometheus_text` or pushed elsewhere by
+    registering a callback, which is called for every observation.
+    """
+
+    _instance = None
+    _metrics = {}
+    _callbacks = []
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def _get_or_create(self, metric_class, name, documentation, **kwargs):
+        name = f"{METRICS_PREFIX}{name}"
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = metric_class(self, name, documentation, **kwargs)
+            self._metrics[name] = metric
+        elif not isinstance(metric, metric_class):
+            raise ValueError(
+                f"A metric with the name '{name}' is already registered with a different type."
+            )
+        return metric
+
+    def counter(self, name, documentation=""):
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name, documentation=""):
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(self, name, documentation="", buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+    def get_metrics(self):
+        return self._metrics.values()
+
+    def get_metric(self, name):
+        return self._metrics.get(f"{METRICS_PREFIX}{name}")
+
+    def add_callback(self, callback):
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def notify(self, metric, value, labels):
+        for callback in self._callbacks:
+            try:
+                callback(metric.name, metric.metric_type, value, labels)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Metrics callback %r failed", callback)
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def to_prometheus_text(self):
+        return (
+            "\n".join(
+                metric.to_prometheus_text()
+                for _, metric in sorted(self._metrics.items())
+            )
+            + "\n"
+        )
+
+
+# Decorator to register a metrics callback
+def register_metrics_callback(func):
+    metrics_registry.add_callback(func)
+    return func
+
+
+metrics_registry = MetricsRegistry()
+
+for callback_path in METRICS_CALLBACKS:
+    metrics_registry.add_callback(import_string(callback_path))
+
+documents_prepared = metrics_registry.counter(
+    "documents_prepared_total", "Number of documents prepared for indexing."
+)
+prepare_field_seconds = metrics_registry.histogram(
+    "prepare_field_seconds", "Time spent in a single prepare_<field> method."
+)
+prepare_document_seconds = metrics_registry.histogram(
+    "prepare_document_seconds", "Time spent preparing a complete document."
+)
+index_lag_seconds = metrics_registry.histogram(
+    "index_lag_seconds",
+    "Seconds between a product's date_updated and it being prepared for indexing.",
+    buckets=DEFAULT_LAG_BUCKETS,
+)
+bulk_requests = metrics_registry.counter(
+    "bulk_requests_total", "Number of bulk calls made to Elasticsearch."
+)
+bulk_actions = metrics_registry.counter(
+    "bulk_actions_total", "Number of actions sent through the bulk API."
+)
+bulk_failures = metrics_registry.counter(
+    "bulk_failures_total", "Number of actions rejected by Elasticsearch."
+)
+bulk_rejections = metrics_registry.counter(
+    "bulk_rejections_total",
+    "Number of actions rejected with a 429 (es_rejected_execution_exception).",
+)
+bulk_retries = metrics_registry.counter(
+    "bulk_retries_total", "Number of actions that were retried."
+)
+bulk_size = metrics_registry.histogram(
+    "bulk_size_actions",
+    "Number of actions per bulk call.",
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+bulk_latency_seconds = metrics_registry.histogram(
+    "bulk_latency_seconds", "Wall time of a bulk call."
+)
+documents_skipped = metrics_registry.counter(
+    "documents_skipped_total",
+    "Number of documents not sent as their content hash didn't change.",
+)
+indexing_queue_depth = metrics_registry.gauge(
+    "indexing_queue_depth", "Number of products waiting to be (re)indexed."
+)
+circuit_breaker_state = metrics_registry.gauge(
+    "circuit_breaker_state",
+    "State of the search circuit breaker (0 = closed, 1 = half-open, 2 = open).",
+)
+degraded_responses = metrics_registry.counter(
+    "degraded_responses_total",
+    "Number of catalogue pages served without Elasticsearch.",
+)
+
+
+def record_bulk_errors(errors):
+    """
+    Records the item errors as returned by elasticsearch.helpers.bulk.
+    """
+    for error in errors:
+        for op_type, item in error.items():
+            bulk_failures.inc(op_type=op_type)
+            if item.get("status") == 429:
+                bulk_rejections.inc(op_type=op_type)
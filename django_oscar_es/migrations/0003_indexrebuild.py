@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_oscar_es", "0002_alter_productfacet_options_productfacet_order"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexRebuild",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index_name", models.CharField(max_length=255, unique=True)),
+                ("alias", models.CharField(max_length=255)),
+                ("chunk_size", models.PositiveIntegerField()),
+                ("last_pk", models.BigIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("indexed", models.PositiveIntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_oscar_es", "0003_indexrebuild"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productfacet",
+            name="lazy",
+            field=models.BooleanField(
+                default=False,
+                help_text="If checked, the values of this (term) facet are only fetched when the facet is expanded, instead of with every search.",
+            ),
+        ),
+    ]
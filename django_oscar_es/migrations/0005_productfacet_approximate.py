@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_oscar_es", "0004_productfacet_lazy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productfacet",
+            name="approximate",
+            field=models.BooleanField(
+                default=False,
+                help_text="If checked, the values of this facet are counted on a sample of the results, which is faster for broad searches. The counts are then approximate.",
+            ),
+        ),
+    ]
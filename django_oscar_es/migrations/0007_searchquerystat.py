@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_oscar_es", "0006_savedsearch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchQueryStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("query", models.CharField(max_length=255, unique=True)),
+                ("num_searches", models.PositiveIntegerField(default=0)),
+                ("num_zero_results", models.PositiveIntegerField(default=0)),
+                ("total_results", models.PositiveBigIntegerField(default=0)),
+                ("date_last_searched", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-num_searches"],
+            },
+        ),
+    ]
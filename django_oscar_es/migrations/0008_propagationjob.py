@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_oscar_es", "0007_searchquerystat"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PropagationJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("description", models.CharField(max_length=255)),
+                ("strategy", models.CharField(max_length=32)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("fields", models.JSONField(default=list)),
+                ("product_ids", models.JSONField(default=list)),
+                ("task_id", models.CharField(blank=True, max_length=255)),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("updated", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                ("date_completed", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-date_created"],
+            },
+        ),
+    ]
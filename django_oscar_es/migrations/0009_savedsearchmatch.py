@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_oscar_es", "0008_propagationjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SavedSearchMatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product_id", models.BigIntegerField(db_index=True)),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "saved_search",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="matches",
+                        to="django_oscar_es.savedsearch",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("saved_search", "product_id")},
+            },
+        ),
+    ]
@@ -3,16 +3,16 @@ import datetime
 
 from decimal import Decimal
 
+from django.conf import settings as django_settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 from oscar.core.loading import get_model
 
-from .settings import get_product_document
 from .formatter_registry import formatter_registry
+from .schema import get_facet_field_choices, get_search_field_choices
 
 Category = get_model("catalogue", "Category")
-ProductDocument = get_product_document()
 
 logger = logging.getLogger(__name__)
 
@@ -53,12 +53,7 @@ class ProductSearchField(models.Model):
         """
         Returns all text and keyword fields from the ProductDocument mapping.
         """
-        properties = ProductDocument._doc_type.mapping.to_dict()["properties"].items()
-        return [
-            (field, field)
-            for field, field_info in properties
-            if field_info["type"] in ["text", "keyword"]
-        ]
+        return get_search_field_choices()
 
 
 class ProductFacet(models.Model):
@@ -127,6 +122,18 @@ class ProductFacet(models.Model):
         default=0,
         help_text=_("The order in which this facet should be displayed."),
     )
+    lazy = models.BooleanField(
+        default=False,
+        help_text=_(
+            "If checked, the values of this (term) facet are only fetched when the facet is expanded, instead of with every search."
+        ),
+    )
+    approximate = models.BooleanField(
+        default=False,
+        help_text=_(
+            "If checked, the values of this facet are counted on a sample of the results, which is faster for broad searches. The counts are then approximate."
+        ),
+    )
 
     def get_formatter(self):
         if self.formatter:
@@ -148,43 +155,7 @@ class ProductFacet(models.Model):
 
     @classmethod
     def get_field_choices(cls):
-        field_choices = []
-        mapping = ProductDocument._doc_type.mapping.to_dict()["properties"]
-        for field_name, field_info in mapping.items():
-            field_type = field_info.get("type")
-            # Text fields can't be used for faceting, search for a keyword field instead.
-            if field_type == "text":
-                if "fields" in field_info:
-                    for sub_field_name, sub_field_info in field_info.get(
-                        "fields", []
-                    ).items():
-                        if sub_field_info["type"] == "keyword":
-                            field_choices.append(
-                                (
-                                    f"{field_name}.{sub_field_name}",
-                                    f"{field_name}.{sub_field_name}",
-                                )
-                            )
-                            break
-            elif field_type not in ["object", "nested"]:
-                field_choices.append((field_name, field_name))
-            else:
-                logger.warning(
-                    "Skipping field '%s' as for now we don't support object or nested fields (with attributes as exception)",
-                    field_name,
-                )
-
-            # We know the structure of attributes, so we can add those to the field choices.
-            if field_name == "attributes":
-                for attribute_code, attribute_info in field_info["properties"].items():
-                    if attribute_info["type"] == "text":
-                        facet_field = f"attributes.{attribute_code}.keyword"
-                    else:
-                        facet_field = f"attributes.{attribute_code}"
-
-                    field_choices.append((facet_field, facet_field))
-
-        return field_choices
+        return get_facet_field_choices()
 
     @classmethod
     def get_formatter_choices(cls):
@@ -317,3 +288,145 @@ class ProductFacetRangeOption(models.Model):
             return datetime.strptime(value, "%Y-%m-%d")
         else:
             raise ValueError(f"Unknown range type: {self.range_type}")
+
+
+class IndexRebuild(models.Model):
+    """
+    Checkpoint of a (resumable) rebuild into a new generation of an index. Products
+    are indexed in primary key order, so everything up to `last_pk` is done.
+    """
+
+    index_name = models.CharField(max_length=255, unique=True)
+    alias = models.CharField(max_length=255)
+    chunk_size = models.PositiveIntegerField()
+    last_pk = models.BigIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    indexed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        return f"{self.index_name} ({self.indexed}/{self.total})"
+
+
+class SavedSearch(models.Model):
+    """
+    A search a customer subscribed to. The filters of the search form are stored
+    as an Elasticsearch query, which is indexed as a percolator query so changed
+    products can be matched against all saved searches at once.
+    """
+
+    user = models.ForeignKey(
+        django_settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="saved_searches",
+    )
+    email = models.EmailField(blank=True)
+    name = models.CharField(max_length=255, blank=True)
+    # The querystring of the search page, to link back to the results.
+    query_string = models.TextField(blank=True)
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True
+    )
+    query = models.JSONField()
+    is_active = models.BooleanField(default=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_last_matched = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-date_created"]
+
+    def __str__(self):
+        return self.name or self.query_string or str(self.pk)
+
+
+class SavedSearchMatch(models.Model):
+    """
+    A product that currently matches a saved search, so a saved search is only
+    signalled for the products that newly match it.
+    """
+
+    saved_search = models.ForeignKey(
+        SavedSearch, on_delete=models.CASCADE, related_name="matches"
+    )
+    product_id = models.BigIntegerField(db_index=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [("saved_search", "product_id")]
+
+    def __str__(self):
+        return f"{self.saved_search_id}: {self.product_id}"
+
+
+class SearchQueryStat(models.Model):
+    """
+    The number of times a (normalized) query was searched, aggregated per process
+    by the search analytics recorder and flushed in batches.
+    """
+
+    query = models.CharField(max_length=255, unique=True)
+    num_searches = models.PositiveIntegerField(default=0)
+    num_zero_results = models.PositiveIntegerField(default=0)
+    # The sum of the number of results, to get the average.
+    total_results = models.PositiveBigIntegerField(default=0)
+    date_last_searched = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-num_searches"]
+
+    def __str__(self):
+        return self.query
+
+    @property
+    def average_results(self):
+        if not self.num_searches:
+            return 0
+        return self.total_results / self.num_searches
+
+
+class PropagationJob(models.Model):
+    """
+    A change propagated to the product documents. Bulk jobs are stored with the
+    affected product ids and run by the oscar_es_propagate management command,
+    update_by_query jobs run in Elasticsearch and store the id of their task.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _("Pending")),
+        (STATUS_RUNNING, _("Running")),
+        (STATUS_COMPLETED, _("Completed")),
+        (STATUS_FAILED, _("Failed")),
+    )
+
+    description = models.CharField(max_length=255)
+    strategy = models.CharField(max_length=32)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    # The fields to re-prepare and the products to update (bulk).
+    fields = models.JSONField(default=list)
+    product_ids = models.JSONField(default=list)
+    # The id of the Elasticsearch task (update_by_query).
+    task_id = models.CharField(max_length=255, blank=True)
+    total = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_completed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-date_created"]
+
+    def __str__(self):
+        return f"{self.description} ({self.status})"
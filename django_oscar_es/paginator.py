@@ -0,0 +1,105 @@
+import math
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+class TotalHitsPaginator(Paginator):
+    """
+    A paginator for searches with a capped track_total_hits. The count is taken
+    from the total hits of the executed search (so no separate count request is
+    sent), capped at track_total_hits. When there are more results than the cap,
+    the count is a lower bound (`is_lower_bound`) and only the pages up to the cap
+    can be reached.
+    """
+
+    def __init__(self, *args, faceted_search=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.faceted_search = faceted_search
+        self.page_results = None
+
+    @property
+    def max_results(self):
+        track_total_hits = getattr(self.faceted_search, "track_total_hits", None)
+        if track_total_hits is True or not track_total_hits:
+            return None
+        return track_total_hits
+
+    @property
+    def total_hits(self):
+        total_hits = getattr(self.faceted_search, "total_hits", None)
+        if total_hits is None and self.page_results is not None:
+            response = getattr(self.page_results, "_response", None)
+            total_hits = response.hits.total if response is not None else None
+        return total_hits
+
+    @property
+    def is_lower_bound(self):
+        total_hits = self.total_hits
+        return bool(total_hits is not None and total_hits.relation == "gte")
+
+    @cached_property
+    def count(self):
+        total_hits = self.total_hits
+        if total_hits is None:
+            return super().count
+        if self.max_results is not None:
+            return min(total_hits.value, self.max_results)
+        return total_hits.value
+
+    @cached_property
+    def num_pages(self):
+        num_pages = super().num_pages
+        if self.max_results is not None:
+            num_pages = min(num_pages, self.get_max_pages())
+        return num_pages
+
+    def get_max_pages(self):
+        return max(math.ceil(self.max_results / self.per_page), 1)
+
+    def page(self, number):
+        """
+        Executes the search of the page first, the count (and the number of pages)
+        come from its total hits.
+        """
+        try:
+            number = int(number)
+        except (TypeError, ValueError) as e:
+            raise PageNotAnInteger(_("That page number is not an integer")) from e
+        if number < 1:
+            raise EmptyPage(_("That page number is less than 1"))
+        if self.max_results is not None and number > self.get_max_pages():
+            # Pages beyond the cap are not searched at all.
+            raise EmptyPage(_("That page contains no results"))
+
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        self.page_results = self.object_list[bottom:top]
+        # Evaluating the page executes the search, which sets the total hits.
+        object_list = list(self.page_results)
+        number = self.validate_number(number)
+        return self._get_page(object_list, number, self)
+
+
+class CachedPageResults:
+    """
+    A sequence of `total` results of which only a single page, starting at
+    `offset`, is known. Lets a regular paginator render a cached page.
+    """
+
+    def __init__(self, products, total, offset):
+        self.products = products
+        self.total = total
+        self.offset = offset
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start = max((key.start or 0) - self.offset, 0)
+            stop = self.total if key.stop is None else key.stop
+            stop = max(stop - self.offset, 0)
+            return self.products[start:stop]
+        return self.products[key - self.offset]
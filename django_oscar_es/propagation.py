@@ -0,0 +1,318 @@
+import logging
+import time
+
+from elasticsearch import NotFoundError
+from elasticsearch_dsl import Q
+from elasticsearch_dsl.connections import connections
+
+from django.utils import timezone
+
+from oscar.core.loading import get_model
+
+from . import metrics
+from .settings import (
+    PROPAGATION_CHUNK_SIZE,
+    PROPAGATION_REQUESTS_PER_SECOND,
+    PROPAGATION_STRATEGY,
+    get_product_document,
+)
+from .tasks import get_task_progress, wait_for_task
+from .utils import chunked
+
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+ProductCategory = get_model("catalogue", "ProductCategory")
+PropagationJob = get_model("django_oscar_es", "PropagationJob")
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_UPDATE_BY_QUERY = "update_by_query"
+STRATEGY_BULK = "bulk"
+
+propagation_jobs = metrics.metrics_registry.counter(
+    "propagation_jobs_total", "Number of change propagation jobs started."
+)
+
+# Both scripts reset the content hash, as the document no longer matches it.
+RENAME_ATTRIBUTE_OPTION_SCRIPT = """
+ctx._source.content_hash = null;
+def value = ctx._source.attributes == null ? null : ctx._source.attributes[params.code];
+if (value instanceof List) {
+    for (int i = 0; i < value.size(); i++) {
+        if (value[i] == params.old_value) {
+            value[i] = params.new_value;
+        }
+    }
+} else if (value == params.old_value) {
+    ctx._source.attributes[params.code] = params.new_value;
+}
+"""
+
+UPDATE_CATEGORY_SCRIPT = """
+ctx._source.content_hash = null;
+if (ctx._source.categories != null) {
+    for (category in ctx._source.categories) {
+        if (category.id == params.id) {
+            for (entry in params.values.entrySet()) {
+                category[entry.getKey()] = entry.getValue();
+            }
+        }
+    }
+}
+"""
+
+
+class UpdateByQueryJob:
+    """
+    Runs a throttled update_by_query as a background task in Elasticsearch and
+    allows to follow its progress. The task id is stored on a PropagationJob, so
+    the oscar_es_propagate management command can check the result.
+    """
+
+    def __init__(self, query, script, params, description="", using="default"):
+        self.query = query
+        self.script = script
+        self.params = params
+        self.description = description
+        self.using = using
+        self.task_id = None
+        self.record = None
+
+    def get_client(self):
+        return connections.get_connection(self.using)
+
+    def get_index_name(self):
+        return get_product_document()._index._name
+
+    def start(self):
+        response = self.get_client().update_by_query(
+            index=self.get_index_name(),
+            query=self.query.to_dict(),
+            script={"source": self.script, "lang": "painless", "params": self.params},
+            conflicts="proceed",
+            refresh=True,
+            slices="auto",
+            requests_per_second=PROPAGATION_REQUESTS_PER_SECOND,
+            wait_for_completion=False,
+        )
+        self.task_id = response["task"]
+        self.record = PropagationJob.objects.create(
+            description=str(self)[:255],
+            strategy=STRATEGY_UPDATE_BY_QUERY,
+            status=PropagationJob.STATUS_RUNNING,
+            task_id=self.task_id,
+        )
+        propagation_jobs.inc(strategy=STRATEGY_UPDATE_BY_QUERY)
+        logger.info("Started update_by_query task %s: %s", self.task_id, self)
+        return self.task_id
+
+    def get_progress(self):
+        return get_task_progress(self.get_client(), self.task_id)
+
+    def wait(self, poll_interval=5, callback=None):
+        return wait_for_task(self.get_client(), self.task_id, poll_interval, callback)
+
+    def __str__(self):
+        return self.description or self.script
+
+
+class BulkPropagationJob:
+    """
+    Re-prepares only the given fields of the affected products and sends them as
+    partial updates, throttled to roughly PROPAGATION_REQUESTS_PER_SECOND documents.
+    As this takes a while, `schedule` stores the job, to be run by the
+    oscar_es_propagate management command instead of the request that saved the
+    change.
+    """
+
+    def __init__(self, product_ids, fields, description="", record=None):
+        self.product_ids = sorted(set(product_ids))
+        self.fields = fields
+        self.description = description
+        self.record = record
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record.product_ids, record.fields, record.description, record)
+
+    def schedule(self):
+        self.record = PropagationJob.objects.create(
+            description=str(self)[:255],
+            strategy=STRATEGY_BULK,
+            fields=self.fields,
+            product_ids=self.product_ids,
+            total=len(self.product_ids),
+        )
+        logger.info("Scheduled %s for %s products", self, len(self.product_ids))
+        return self.record
+
+    def start(self, callback=None):
+        propagation_jobs.inc(strategy=STRATEGY_BULK)
+        document = get_product_document()()
+        queryset = document.get_queryset().filter(pk__in=self.product_ids)
+        total = len(self.product_ids)
+        done = 0
+
+        for chunk in chunked(queryset.iterator(), PROPAGATION_CHUNK_SIZE):
+            started = time.monotonic()
+            document.partial_update(chunk, fields=self.fields)
+            done += len(chunk)
+            if self.record is not None:
+                self.record.updated = done
+                self.record.save(update_fields=["updated"])
+            if callback:
+                callback(done, total)
+            else:
+                logger.info("%s: %s/%s documents updated", self, done, total)
+
+            if PROPAGATION_REQUESTS_PER_SECOND > 0:
+                minimum_duration = len(chunk) / PROPAGATION_REQUESTS_PER_SECOND
+                elapsed = time.monotonic() - started
+                if elapsed < minimum_duration:
+                    time.sleep(minimum_duration - elapsed)
+        return done
+
+    def __str__(self):
+        return self.description or "Partial update of %s" % ", ".join(self.fields)
+
+
+def propagate_attribute_option_rename(option, old_value):
+    codes = set(
+        ProductAttribute.objects.filter(option_group_id=option.group_id).values_list(
+            "code", flat=True
+        )
+    )
+    if not codes:
+        return []
+
+    description = f"Rename attribute option '{old_value}' to '{option.option}'"
+    if PROPAGATION_STRATEGY == STRATEGY_BULK:
+        product_ids = set(
+            ProductAttributeValue.objects.filter(value_option=option).values_list(
+                "product_id", flat=True
+            )
+        ) | set(
+            ProductAttributeValue.objects.filter(
+                value_multi_option=option
+            ).values_list("product_id", flat=True)
+        )
+        job = BulkPropagationJob(product_ids, ["attributes"], description)
+        job.schedule()
+        return [job]
+
+    jobs = []
+    for code in sorted(codes):
+        job = UpdateByQueryJob(
+            query=Q("term", **{f"attributes.{code}": old_value}),
+            script=RENAME_ATTRIBUTE_OPTION_SCRIPT,
+            params={"code": code, "old_value": old_value, "new_value": option.option},
+            description=f"{description} ({code})",
+        )
+        job.start()
+        jobs.append(job)
+    return jobs
+
+
+def propagate_category_change(category, changed_fields):
+    values = {field: getattr(category, field) for field in changed_fields}
+    description = f"Update category {category.pk} ({', '.join(sorted(values))})"
+
+    if PROPAGATION_STRATEGY == STRATEGY_BULK:
+        product_ids = ProductCategory.objects.filter(category=category).values_list(
+            "product_id", flat=True
+        )
+        job = BulkPropagationJob(product_ids, ["categories"], description)
+        job.schedule()
+        return [job]
+
+    job = UpdateByQueryJob(
+        query=Q(
+            "nested", path="categories", query=Q("term", categories__id=category.pk)
+        ),
+        script=UPDATE_CATEGORY_SCRIPT,
+        params={"id": category.pk, "values": values},
+        description=description,
+    )
+    job.start()
+    return [job]
+
+
+def run_propagation(func, *args):
+    """
+    Runs a propagation function without letting failures bubble up, as these run
+    after the (already committed) save of an option or category.
+    """
+    try:
+        return func(*args)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Propagating a change to the index failed, a reindex of the affected "
+            "products is required."
+        )
+        return []
+
+
+def run_pending_propagation_jobs(callback=None):
+    """
+    Runs the scheduled bulk jobs, oldest first. A job is claimed by setting its
+    status, so concurrent runs don't pick up the same job.
+    """
+    done = []
+    pending = PropagationJob.objects.filter(
+        strategy=STRATEGY_BULK, status=PropagationJob.STATUS_PENDING
+    ).order_by("date_created")
+    for record in pending:
+        claimed = PropagationJob.objects.filter(
+            pk=record.pk, status=PropagationJob.STATUS_PENDING
+        ).update(status=PropagationJob.STATUS_RUNNING)
+        if not claimed:
+            continue
+        record.status = PropagationJob.STATUS_RUNNING
+        job = BulkPropagationJob.from_record(record)
+        try:
+            job.start(callback=callback)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("%s failed", job)
+            record.status = PropagationJob.STATUS_FAILED
+            record.error = str(e)
+        else:
+            record.status = PropagationJob.STATUS_COMPLETED
+        record.date_completed = timezone.now()
+        record.save(update_fields=["status", "error", "date_completed"])
+        done.append(record)
+    return done
+
+
+def check_propagation_tasks(using="default"):
+    """
+    Stores the progress and outcome of the running update_by_query tasks, and
+    returns the jobs that are still running.
+    """
+    client = connections.get_connection(using)
+    running = []
+    for record in PropagationJob.objects.filter(
+        strategy=STRATEGY_UPDATE_BY_QUERY, status=PropagationJob.STATUS_RUNNING
+    ):
+        try:
+            progress = get_task_progress(client, record.task_id)
+        except NotFoundError:
+            record.status = PropagationJob.STATUS_FAILED
+            record.error = f"Task {record.task_id} no longer exists"
+            record.date_completed = timezone.now()
+            record.save(update_fields=["status", "error", "date_completed"])
+            continue
+        record.total = progress["total"]
+        record.updated = progress["updated"]
+        if progress["completed"]:
+            if progress["error"] or progress["failures"]:
+                record.status = PropagationJob.STATUS_FAILED
+                record.error = str(progress["error"] or progress["failures"][:5])
+            else:
+                record.status = PropagationJob.STATUS_COMPLETED
+            record.date_completed = timezone.now()
+        else:
+            running.append(record)
+        record.save(
+            update_fields=["total", "updated", "status", "error", "date_completed"]
+        )
+    return running
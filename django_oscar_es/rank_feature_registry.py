@@ -0,0 +1,44 @@
+import inspect
+
+
+class RankFeatureRegistry:
+    _instance = None
+    _registry = {}
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def register(self, name, provider):
+        if name in self._registry:
+            raise ValueError(
+                f"A rank feature with the name '{name}' is already registered."
+            )
+        self._validate_provider_signature(provider)
+        self._registry[name] = provider
+
+    def _validate_provider_signature(self, provider):
+        sig = inspect.signature(provider)
+        if len(sig.parameters) != 1:
+            raise ValueError(
+                f"Rank feature provider {provider.__name__} must have exactly one parameter: product."
+            )
+
+    def get_providers(self):
+        return self._registry.items()
+
+    def get_provider(self, name):
+        return self._registry.get(name)
+
+
+# Decorator to register a rank feature provider
+def register_rank_feature(name):
+    def decorator(func):
+        rank_feature_registry.register(name, func)
+        return func
+
+    return decorator
+
+
+rank_feature_registry = RankFeatureRegistry()
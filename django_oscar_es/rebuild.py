@@ -0,0 +1,130 @@
+import logging
+import time
+
+from datetime import timedelta
+
+from django.utils import timezone
+
+from oscar.core.loading import get_model
+
+from .generations import (
+    IndexGenerationError,
+    IndexGenerations,
+    delete_missing_products,
+    index_changed_since,
+)
+from .settings import ADAPTIVE_BULK, get_product_document
+
+IndexRebuild = get_model("django_oscar_es", "IndexRebuild")
+
+logger = logging.getLogger(__name__)
+
+
+class ResumableRebuild:
+    """
+    Indexes all products in primary key ordered chunks into a new index generation
+    and stores a checkpoint after every chunk, so a rebuild that was interrupted
+    can continue from the last completed chunk.
+    """
+
+    def __init__(self, checkpoint, generations=None):
+        self.checkpoint = checkpoint
+        self.generations = generations or IndexGenerations()
+        self.document = get_product_document()()
+        self.document.target_index = checkpoint.index_name
+
+    @classmethod
+    def start(cls, chunk_size=1000):
+        generations = IndexGenerations()
+        # Fails early when the index isn't managed through an alias.
+        generations.get_live_indices()
+        checkpoint = IndexRebuild.objects.create(
+            index_name=generations.create(),
+            alias=generations.alias,
+            chunk_size=chunk_size,
+        )
+        return cls(checkpoint, generations)
+
+    @classmethod
+    def resume(cls):
+        generations = IndexGenerations()
+        checkpoint = IndexRebuild.objects.filter(
+            alias=generations.alias, completed_at__isnull=True
+        ).first()
+        if checkpoint is None:
+            raise IndexGenerationError("There is no unfinished rebuild to resume.")
+        if not generations.client.indices.exists(index=checkpoint.index_name):
+            raise IndexGenerationError(
+                f"The index {checkpoint.index_name} of the unfinished rebuild no "
+                "longer exists, start a new rebuild instead."
+            )
+        return cls(checkpoint, generations)
+
+    def get_queryset(self):
+        return self.document.get_queryset().order_by("pk")
+
+    def get_eta(self, indexed_this_run, elapsed):
+        remaining = self.checkpoint.total - self.checkpoint.indexed
+        if not indexed_this_run or remaining <= 0:
+            return None
+        return timedelta(seconds=int(remaining * elapsed / indexed_this_run))
+
+    def run(self, callback=None):
+        checkpoint = self.checkpoint
+        queryset = self.get_queryset()
+        checkpoint.total = checkpoint.indexed + queryset.filter(
+            pk__gt=checkpoint.last_pk
+        ).count()
+        checkpoint.save(update_fields=["total", "updated_at"])
+
+        started = time.monotonic()
+        indexed_this_run = 0
+        while True:
+            chunk = list(
+                queryset.filter(pk__gt=checkpoint.last_pk)[: checkpoint.chunk_size]
+            )
+            if not chunk:
+                break
+
+            self.document.update(chunk, refresh=False, adaptive=ADAPTIVE_BULK)
+
+            checkpoint.last_pk = chunk[-1].pk
+            checkpoint.indexed += len(chunk)
+            checkpoint.save(update_fields=["last_pk", "indexed", "updated_at"])
+
+            indexed_this_run += len(chunk)
+            eta = self.get_eta(indexed_this_run, time.monotonic() - started)
+            if callback:
+                callback(checkpoint, eta)
+            else:
+                logger.info("Rebuilding %s, ETA %s", checkpoint, eta or "-")
+
+        return checkpoint
+
+    def catch_up(self, since, callback=None):
+        """
+        Realtime updates go to the live index while rebuilding, so the products
+        changed since `since` are indexed again and deleted products are removed.
+        """
+        index_name = self.checkpoint.index_name
+        changed = index_changed_since(index_name, since, callback=callback)
+        deleted = delete_missing_products(index_name)
+        return changed, deleted
+
+    def finish(self, swap=True, delete_old=False, callback=None):
+        """
+        Catches up with the changes made during the rebuild and swaps the alias.
+        Without `swap` the rebuild isn't marked as completed, so resuming it later
+        catches up again and swaps the alias.
+        """
+        checkpoint = self.checkpoint
+        caught_up = timezone.now()
+        self.catch_up(checkpoint.started_at, callback=callback)
+        self.generations.finalize(checkpoint.index_name)
+        if not swap:
+            return
+        self.generations.swap(checkpoint.index_name, delete_old=delete_old)
+        # Changes made while catching up, until the swap, only reached the old index.
+        self.catch_up(caught_up, callback=callback)
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save(update_fields=["completed_at", "updated_at"])
@@ -0,0 +1,66 @@
+from django.utils.module_loading import import_string
+
+from oscar.core.loading import get_model
+
+from .settings import ROUTING_CLASS
+
+Category = get_model("catalogue", "Category")
+
+
+class RootCategoryRouting:
+    """
+    Routes products to a shard based on their root category, so category pages
+    only have to query a single shard. Products in multiple root categories are
+    routed by the first one (ordered by path), which means they will only show up
+    on category pages below that root category.
+    """
+
+    prefetch_related = ["categories", "parent__categories"]
+
+    def get_root_path(self, category):
+        return category.path[: Category.steplen]
+
+    def get_product_routing(self, product):
+        if product.is_child:
+            product = product.parent
+        root_paths = sorted(
+            self.get_root_path(category) for category in product.categories.all()
+        )
+        if root_paths:
+            return root_paths[0]
+        return None
+
+    def get_category_routing(self, category):
+        return self.get_root_path(category)
+
+
+_routing = None
+
+
+def get_routing():
+    """
+    Returns an instance of the configured routing class, or None if custom routing
+    is disabled.
+    """
+    global _routing  # pylint: disable=global-statement
+    if ROUTING_CLASS and _routing is None:
+        _routing = import_string(ROUTING_CLASS)()
+    return _routing
+
+
+def get_product_routing(product):
+    routing = get_routing()
+    if routing is None:
+        return None
+    return routing.get_product_routing(product)
+
+
+def get_category_routing(category):
+    routing = get_routing()
+    if routing is None:
+        return None
+    return routing.get_category_routing(category)
+
+
+def get_routing_prefetch_related():
+    return getattr(get_routing(), "prefetch_related", [])
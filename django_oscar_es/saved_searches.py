@@ -0,0 +1,381 @@
+import atexit
+import logging
+import threading
+
+from collections import defaultdict
+
+from elasticsearch import BadRequestError
+from elasticsearch_dsl import Q
+from elasticsearch_dsl.connections import connections
+
+from django.db import connection
+from django.utils import timezone
+
+from oscar.core.loading import get_class, get_model
+
+from . import metrics
+from .routing import get_product_routing, get_routing, get_routing_prefetch_related
+from .settings import (
+    PERCOLATE_CHUNK_SIZE,
+    SAVED_SEARCH_INDEX,
+    get_product_document,
+    get_product_index,
+)
+from .signals import saved_search_matched
+from .utils import chunked
+
+Product = get_model("catalogue", "Product")
+SavedSearch = get_model("django_oscar_es", "SavedSearch")
+SavedSearchMatch = get_model("django_oscar_es", "SavedSearchMatch")
+get_product_elasticsearch_settings = get_class(
+    "django_oscar_es.cache", "get_product_elasticsearch_settings"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_client(using="default"):
+    return connections.get_connection(using)
+
+
+def build_saved_search_query(form):
+    """
+    Normalizes a (valid) product search form into a single query, containing the
+    search query and all filters of the form.
+    """
+    filters = [Q("term", is_public=True)]
+    for name, field in form.fields.items():
+        if hasattr(field, "get_es_filter_query"):
+            filter_query = field.get_es_filter_query(form.cleaned_data.get(name))
+            if filter_query:
+                filters.append(filter_query)
+
+    if getattr(form, "category", None) is not None:
+        category_ids = form.category.get_descendants_and_self().values_list(
+            "pk", flat=True
+        )
+        filters.append(
+            Q(
+                "nested",
+                path="categories",
+                query=Q("terms", **{"categories.id": list(category_ids)}),
+            )
+        )
+
+    must = []
+    search_query = form.cleaned_data.get("q")
+    if search_query:
+        product_es_settings = get_product_elasticsearch_settings()
+        must.append(
+            Q(
+                "multi_match",
+                query=search_query,
+                fields=[
+                    f"{search_field.field}^{search_field.boost}"
+                    for search_field in product_es_settings.search_fields.all()
+                    if not search_field.disabled
+                ],
+            )
+        )
+    return Q("bool", must=must, filter=filters).to_dict()
+
+
+def save_search(form, query_string="", **kwargs):
+    return SavedSearch.objects.create(
+        query=build_saved_search_query(form),
+        query_string=query_string,
+        category=getattr(form, "category", None),
+        **kwargs,
+    )
+
+
+def create_saved_search_index(using="default"):
+    """
+    (Re)creates the percolator index. It has the analysis settings and mapping of
+    the product index, so the saved queries are parsed like product searches.
+    """
+    client = get_client(using)
+    if client.indices.exists(index=SAVED_SEARCH_INDEX):
+        client.indices.delete(index=SAVED_SEARCH_INDEX)
+    _create_saved_search_index(client)
+
+
+def ensure_saved_search_index(using="default"):
+    """
+    Creates the percolator index when it doesn't exist, as indexing a saved search
+    into a missing index would create it with a dynamic mapping, in which the
+    query isn't a percolator field.
+    """
+    client = get_client(using)
+    if client.indices.exists(index=SAVED_SEARCH_INDEX):
+        return
+    try:
+        _create_saved_search_index(client)
+    except BadRequestError as e:
+        # Created by another process in the meantime.
+        if e.error != "resource_already_exists_exception":
+            raise
+
+
+def _create_saved_search_index(client):
+    index_settings = get_product_index().to_dict().get("settings", {})
+    properties = get_product_document()._doc_type.mapping.to_dict()["properties"]
+    properties["query"] = {"type": "percolator"}
+    properties["saved_search_id"] = {"type": "integer"}
+    client.indices.create(
+        index=SAVED_SEARCH_INDEX,
+        settings=index_settings,
+        mappings={"properties": properties},
+    )
+
+
+def index_saved_search(saved_search, using="default"):
+    if not saved_search.is_active:
+        return delete_saved_search(saved_search.pk, using)
+    ensure_saved_search_index(using)
+    get_client(using).index(
+        index=SAVED_SEARCH_INDEX,
+        id=saved_search.pk,
+        document={"query": saved_search.query, "saved_search_id": saved_search.pk},
+    )
+    return None
+
+
+def delete_saved_search(saved_search_id, using="default"):
+    get_client(using).delete(
+        index=SAVED_SEARCH_INDEX, id=saved_search_id, ignore_status=404
+    )
+
+
+def index_all_saved_searches(using="default"):
+    ensure_saved_search_index(using)
+    saved_searches = SavedSearch.objects.filter(is_active=True).order_by("pk")
+    count = 0
+    for chunk in chunked(saved_searches.iterator(), 500):
+        operations = []
+        for saved_search in chunk:
+            operations.append({"index": {"_id": saved_search.pk}})
+            operations.append(
+                {"query": saved_search.query, "saved_search_id": saved_search.pk}
+            )
+        get_client(using).bulk(index=SAVED_SEARCH_INDEX, operations=operations)
+        count += len(chunk)
+    return count
+
+
+def percolate_documents(documents, using="default"):
+    """
+    Matches the given {product id: document source} against all saved searches,
+    with a single percolate query per PERCOLATE_CHUNK_SIZE documents. Returns
+    {saved search id: set of product ids}.
+    """
+    matches = defaultdict(set)
+    client = get_client(using)
+    for chunk in chunked(documents.items(), PERCOLATE_CHUNK_SIZE):
+        product_ids = [product_id for product_id, _ in chunk]
+        search_after = None
+        while True:
+            kwargs = {
+                "index": SAVED_SEARCH_INDEX,
+                "query": {
+                    "percolate": {
+                        "field": "query",
+                        "documents": [source for _, source in chunk],
+                    }
+                },
+                "source": ["saved_search_id"],
+                "sort": [{"saved_search_id": "asc"}],
+                "size": 1000,
+            }
+            if search_after is not None:
+                kwargs["search_after"] = search_after
+            hits = client.search(**kwargs)["hits"]["hits"]
+            for hit in hits:
+                saved_search_id = hit["_source"]["saved_search_id"]
+                for slot in hit["fields"]["_percolator_document_slot"]:
+                    matches[saved_search_id].add(product_ids[slot])
+            if len(hits) < 1000:
+                break
+            search_after = hits[-1]["sort"]
+    return matches
+
+
+def get_mget_docs(product_ids):
+    """
+    The documents to fetch for the given products, with their routing value when
+    custom routing is enabled, as a get by id only looks on the shard the id
+    routes to.
+    """
+    if get_routing() is None:
+        return [{"_id": str(pk)} for pk in product_ids]
+    products = (
+        Product.objects.filter(pk__in=product_ids)
+        .select_related("parent")
+        .prefetch_related(*get_routing_prefetch_related())
+    )
+    docs = []
+    for product in products:
+        doc = {"_id": str(product.pk)}
+        routing = get_product_routing(product)
+        if routing is not None:
+            doc["routing"] = routing
+        docs.append(doc)
+    return docs
+
+
+def get_new_matches(product_ids, matches):
+    """
+    Stores which of the given products match which saved searches, and returns
+    only the matches that weren't stored yet: {saved search id: set of product
+    ids}. Products that no longer match a saved search are forgotten, so they're
+    signalled again when they match again.
+    """
+    known = defaultdict(set)
+    for saved_search_id, product_id in SavedSearchMatch.objects.filter(
+        product_id__in=product_ids
+    ).values_list("saved_search_id", "product_id"):
+        known[saved_search_id].add(product_id)
+
+    new_matches = {}
+    for saved_search_id, matched_ids in matches.items():
+        new_ids = matched_ids - known[saved_search_id]
+        if new_ids:
+            new_matches[saved_search_id] = new_ids
+
+    for saved_search_id, known_ids in known.items():
+        unmatched_ids = known_ids - matches.get(saved_search_id, set())
+        if unmatched_ids:
+            SavedSearchMatch.objects.filter(
+                saved_search_id=saved_search_id, product_id__in=unmatched_ids
+            ).delete()
+
+    active_ids = set(
+        SavedSearch.objects.filter(pk__in=new_matches, is_active=True).values_list(
+            "pk", flat=True
+        )
+    )
+    SavedSearchMatch.objects.bulk_create(
+        [
+            SavedSearchMatch(saved_search_id=saved_search_id, product_id=product_id)
+            for saved_search_id, new_ids in new_matches.items()
+            if saved_search_id in active_ids
+            for product_id in new_ids
+        ],
+        ignore_conflicts=True,
+    )
+    return {
+        saved_search_id: new_ids
+        for saved_search_id, new_ids in new_matches.items()
+        if saved_search_id in active_ids
+    }
+
+
+def percolate_products(product_ids, using="default"):
+    """
+    Matches the indexed documents of the given products against the saved searches
+    and sends the saved_search_matched signal per saved search the products newly
+    match, so updates of products that already matched (eg; stock or price
+    changes) don't alert again.
+    """
+    document = get_product_document()
+    try:
+        docs = get_mget_docs(product_ids)
+        response = (
+            get_client(using).mget(index=document._index._name, docs=docs)
+            if docs
+            else {"docs": []}
+        )
+        documents = {
+            int(doc["_id"]): doc["_source"]
+            for doc in response["docs"]
+            if doc.get("found")
+        }
+        matches = percolate_documents(documents, using) if documents else {}
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Matching %s products to saved searches failed", len(product_ids)
+        )
+        return {}
+
+    new_matches = get_new_matches(product_ids, matches)
+    saved_searches = SavedSearch.objects.filter(pk__in=new_matches)
+    for saved_search in saved_searches:
+        saved_search_matched.send(
+            sender=SavedSearch,
+            saved_search=saved_search,
+            product_ids=sorted(new_matches[saved_search.pk]),
+        )
+    saved_searches.update(date_last_matched=timezone.now())
+    return new_matches
+
+
+class PercolationQueue:
+    """
+    Collects the ids of updated products and matches them against the saved
+    searches from a background thread, so the request that changed the products
+    doesn't wait on the mget and percolate queries. What's left is matched when
+    the process exits.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = set()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, product_ids):
+        with self.lock:
+            self.pending.update(product_ids)
+            metrics.indexing_queue_depth.set(len(self.pending), queue="percolation")
+        self.ensure_thread()
+        self.wakeup.set()
+
+    def ensure_thread(self):
+        # Threads don't survive a fork, so workers of a preforking server start
+        # their own.
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="percolation", daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Matching products to saved searches failed")
+            finally:
+                connection.close()
+
+    def flush(self):
+        """
+        Matches the pending products and returns their number. Waits for a batch
+        that is being matched by the background thread.
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, set()
+                metrics.indexing_queue_depth.set(0, queue="percolation")
+            if pending:
+                percolate_products(sorted(pending))
+            return len(pending)
+
+
+percolation_queue = PercolationQueue()
+
+
+def flush_on_exit():
+    try:
+        percolation_queue.flush()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Matching products to saved searches on exit failed")
+
+
+atexit.register(flush_on_exit)
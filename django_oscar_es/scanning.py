@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+
+from elasticsearch_dsl.connections import connections
+
+DEFAULT_KEEP_ALIVE = "5m"
+
+
+@contextmanager
+def point_in_time(index, keep_alive=DEFAULT_KEEP_ALIVE, using="default"):
+    """
+    Opens a point in time for the index and yields its id, the point in time is
+    closed again on exit. A point in time can be shared by multiple readers.
+    """
+    client = connections.get_connection(using)
+    pit_id = client.open_point_in_time(index=index, keep_alive=keep_alive)["id"]
+    try:
+        yield pit_id
+    finally:
+        client.close_point_in_time(id=pit_id)
+
+
+def scan_point_in_time(
+    pit_id,
+    sort,
+    query=None,
+    source=True,
+    size=1000,
+    keep_alive=DEFAULT_KEEP_ALIVE,
+    slice_id=None,
+    max_slices=None,
+    using="default",
+):
+    """
+    Yields all hits matching the query from the point in time, paginated with
+    search_after. `sort` has to end in a unique field (eg; the id of the product)
+    for the pagination to be complete. With `slice_id` and `max_slices` only a
+    single slice is read, so the slices can be read in parallel.
+    """
+    client = connections.get_connection(using)
+    search_after = None
+    while True:
+        kwargs = {
+            "size": size,
+            "sort": list(sort),
+            "source": source,
+            "track_total_hits": False,
+            "pit": {"id": pit_id, "keep_alive": keep_alive},
+        }
+        if query is not None:
+            kwargs["query"] = query
+        if search_after is not None:
+            kwargs["search_after"] = search_after
+        if max_slices and max_slices > 1:
+            kwargs["slice"] = {"id": slice_id, "max": max_slices}
+
+        response = client.search(**kwargs)
+        hits = response["hits"]["hits"]
+        if not hits:
+            return
+        yield from hits
+        if len(hits) < size:
+            return
+        search_after = hits[-1]["sort"]
+        # The id of the point in time can change between requests.
+        pit_id = response.get("pit_id", pit_id)
@@ -0,0 +1,301 @@
+import logging
+import threading
+import time
+
+from elasticsearch_dsl.connections import connections
+
+from django.core.cache import cache
+
+from oscar.core.loading import get_model
+
+from .es_fields import ProductAttributesField
+from .settings import (
+    MAPPING_VERSION_CHECK_INTERVAL,
+    SAVED_SEARCH_INDEX,
+    SAVED_SEARCHES,
+    get_product_document,
+)
+
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+
+logger = logging.getLogger(__name__)
+
+MAPPING_VERSION_CACHE_KEY = "product_mapping_version"
+ATTRIBUTE_PROPERTIES_CACHE_KEY = "product_attribute_properties"
+
+_lock = threading.Lock()
+# The mapping version the in process mapping and choices are up to date with.
+_local_mapping_version = None
+# When the shared version was last read (time.monotonic()), None forces a read.
+_mapping_version_checked_at = None
+_choices_cache = {}
+
+
+def get_mapping_version():
+    """
+    Returns the version of the product mapping, which is shared by all processes
+    through the cache.
+    """
+    version = cache.get(MAPPING_VERSION_CACHE_KEY)
+    if version is None:
+        # Start at a timestamp instead of 1, so a version that was evicted from
+        # the cache doesn't come back as a version a process has already seen.
+        cache.add(MAPPING_VERSION_CACHE_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(MAPPING_VERSION_CACHE_KEY)
+    return version
+
+
+def bump_mapping_version():
+    """
+    Must be called whenever the mapping of the product document changes, so every
+    process computes the memoized field choices again.
+    """
+    try:
+        cache.incr(MAPPING_VERSION_CACHE_KEY)
+    except ValueError:
+        # The version doesn't exist (anymore), starting a new one is a bump too.
+        get_mapping_version()
+
+
+def sync_mapping_version():
+    """
+    Updates the in process attributes mapping when the mapping version changed, eg;
+    because another process synced the mapping of a new attribute. The shared
+    version is read at most once per MAPPING_VERSION_CHECK_INTERVAL, as the field
+    choices are read for every facet and search field that is instantiated.
+    """
+    global _local_mapping_version  # pylint: disable=global-statement
+    global _mapping_version_checked_at  # pylint: disable=global-statement
+    now = time.monotonic()
+    if (
+        _local_mapping_version is not None
+        and _mapping_version_checked_at is not None
+        and now - _mapping_version_checked_at < MAPPING_VERSION_CHECK_INTERVAL
+    ):
+        return _local_mapping_version
+    version = get_mapping_version()
+    _mapping_version_checked_at = now
+    if version == _local_mapping_version:
+        return version
+    with _lock:
+        attributes_field = get_product_document()._doc_type.mapping["attributes"]
+        properties = cache.get(ATTRIBUTE_PROPERTIES_CACHE_KEY)
+        if properties is not None:
+            attributes_field.properties = properties
+        elif _local_mapping_version is not None:
+            attributes_field.properties = attributes_field.get_attributes_properties()
+        _choices_cache.clear()
+        _local_mapping_version = version
+    return version
+
+
+def expire_mapping_version_check():
+    """
+    Makes the next sync_mapping_version read the shared version, eg; right after
+    this process changed it.
+    """
+    global _mapping_version_checked_at  # pylint: disable=global-statement
+    _mapping_version_checked_at = None
+
+
+def get_mapping_properties():
+    return get_product_document()._doc_type.mapping.to_dict()["properties"]
+
+
+def memoize_per_mapping_version(func):
+    def wrapper():
+        key = (func.__name__, sync_mapping_version())
+        choices = _choices_cache.get(key)
+        if choices is None:
+            choices = tuple(func(get_mapping_properties()))
+            with _lock:
+                _choices_cache[key] = choices
+        return choices
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+@memoize_per_mapping_version
+def get_search_field_choices(properties):
+    """
+    Returns all text and keyword fields from the ProductDocument mapping.
+    """
+    return (
+        (field, field)
+        for field, field_info in properties.items()
+        if field_info.get("type") in ["text", "keyword"]
+    )
+
+
+@memoize_per_mapping_version
+def get_facet_field_choices(properties):
+    """
+    Returns all fields from the ProductDocument mapping that can be used for faceting.
+    """
+    field_choices = []
+    for field_name, field_info in properties.items():
+        field_type = field_info.get("type")
+        # Text fields can't be used for faceting, search for a keyword field instead.
+        if field_type == "text":
+            if "fields" in field_info:
+                for sub_field_name, sub_field_info in field_info.get(
+                    "fields", []
+                ).items():
+                    if sub_field_info["type"] == "keyword":
+                        field_choices.append(
+                            (
+                                f"{field_name}.{sub_field_name}",
+                                f"{field_name}.{sub_field_name}",
+                            )
+                        )
+                        break
+        elif field_type not in ["object", "nested"]:
+            field_choices.append((field_name, field_name))
+        else:
+            logger.warning(
+                "Skipping field '%s' as for now we don't support object or nested fields (with attributes as exception)",
+                field_name,
+            )
+
+        # We know the structure of attributes, so we can add those to the field choices.
+        if field_name == "attributes":
+            for attribute_code, attribute_info in field_info["properties"].items():
+                if attribute_info["type"] == "text":
+                    facet_field = f"attributes.{attribute_code}.keyword"
+                else:
+                    facet_field = f"attributes.{attribute_code}"
+
+                field_choices.append((facet_field, facet_field))
+
+    return field_choices
+
+
+class AttributeMappingDiff:
+    def __init__(self, added=None, conflicts=None):
+        # {attribute_code: {"type": ...}}
+        self.added = added or {}
+        # {attribute_code: (live_type, wanted_type)}
+        self.conflicts = conflicts or {}
+
+    def __bool__(self):
+        return bool(self.added or self.conflicts)
+
+    def get_conflicting_product_ids(self):
+        """
+        The products that have a value for a conflicting attribute, these have to be
+        reindexed (into a new index) once the mapping is fixed.
+        """
+        if not self.conflicts:
+            return []
+        return list(
+            ProductAttributeValue.objects.filter(attribute__code__in=self.conflicts)
+            .values_list("product_id", flat=True)
+            .distinct()
+        )
+
+
+def get_live_attribute_properties(using="default", index=None):
+    client = connections.get_connection(using)
+    response = client.indices.get_mapping(
+        index=index or get_product_document()._index._name
+    )
+
+    # The index name could be an alias for one or more indices.
+    properties = {}
+    for index_mapping in response.values():
+        attributes = (
+            index_mapping.get("mappings", {})
+            .get("properties", {})
+            .get("attributes", {})
+        )
+        properties.update(attributes.get("properties", {}))
+    return properties
+
+
+def diff_attribute_properties(wanted, live):
+    diff = AttributeMappingDiff()
+    for code, properties in wanted.items():
+        if code not in live:
+            diff.added[code] = properties
+        else:
+            live_type = live[code].get("type", "object")
+            if live_type != properties["type"]:
+                diff.conflicts[code] = (live_type, properties["type"])
+    return diff
+
+
+def refresh_attribute_properties(properties=None):
+    """
+    Updates the attributes mapping of the product document, which is otherwise
+    only determined once at import time, in this and (through the cache) the other
+    processes.
+    """
+    attributes_field = get_product_document()._doc_type.mapping["attributes"]
+    if properties is None:
+        properties = attributes_field.get_attributes_properties()
+    attributes_field.properties = properties
+    # Shared with the other processes, which pick it up on the next version check.
+    cache.set(ATTRIBUTE_PROPERTIES_CACHE_KEY, properties, timeout=None)
+    bump_mapping_version()
+    expire_mapping_version_check()
+    return properties
+
+
+def sync_saved_search_attribute_mapping(wanted, using="default"):
+    """
+    The percolator index has a copy of the product mapping, which needs the new
+    attributes as well to match saved searches that filter on them.
+    """
+    client = connections.get_connection(using)
+    if not SAVED_SEARCHES or not client.indices.exists(index=SAVED_SEARCH_INDEX):
+        return
+    live = get_live_attribute_properties(using, index=SAVED_SEARCH_INDEX)
+    added = diff_attribute_properties(wanted, live).added
+    if added:
+        client.indices.put_mapping(
+            index=SAVED_SEARCH_INDEX,
+            properties={"attributes": {"properties": added}},
+        )
+        logger.info(
+            "Added attributes to the saved search mapping: %s", ", ".join(added)
+        )
+
+
+def sync_attribute_mapping(dry_run=False, using="default"):
+    """
+    Pushes the mapping of product attributes that were added since the index was
+    created with put_mapping. Attributes that have a different type in the live
+    mapping can't be changed in place, these are reported as conflicts and require
+    a reindex of the products that have them.
+    """
+    wanted = ProductAttributesField().get_attributes_properties()
+    diff = diff_attribute_properties(wanted, get_live_attribute_properties(using))
+
+    if diff.added and not dry_run:
+        connections.get_connection(using).indices.put_mapping(
+            index=get_product_document()._index._name,
+            properties={"attributes": {"properties": diff.added}},
+        )
+        logger.info("Added attributes to the mapping: %s", ", ".join(diff.added))
+    if not dry_run:
+        sync_saved_search_attribute_mapping(wanted, using)
+
+    for code, (live_type, wanted_type) in diff.conflicts.items():
+        logger.warning(
+            "Attribute '%s' is mapped as '%s' but should be '%s', the products "
+            "with this attribute have to be reindexed into a new index.",
+            code,
+            live_type,
+            wanted_type,
+        )
+
+    if not dry_run:
+        # Conflicting attributes keep their live type, as that's what is indexed.
+        live_properties = dict(wanted)
+        for code, (live_type, _) in diff.conflicts.items():
+            live_properties[code] = {"type": live_type}
+        refresh_attribute_properties(live_properties)
+
+    return diff
@@ -0,0 +1,263 @@
+import atexit
+import logging
+import re
+import threading
+import time
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from oscar.core.loading import get_model
+
+from .settings import SEARCH_ANALYTICS_FLUSH_INTERVAL, SEARCH_ANALYTICS_MAX_BUFFER
+from .utils import chunked
+
+SearchQueryStat = get_model("django_oscar_es", "SearchQueryStat")
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Number of queries per upsert statement, which keeps the number of parameters
+# below the limits of the database backends.
+UPSERT_CHUNK_SIZE = 100
+
+UPSERT_COUNTERS = ("num_searches", "num_zero_results", "total_results")
+
+
+def normalize_query(query):
+    return WHITESPACE_RE.sub(" ", query or "").strip().lower()[:255]
+
+
+class QueryStats:
+    def __init__(self):
+        self.num_searches = 0
+        self.num_zero_results = 0
+        self.total_results = 0
+        self.date_last_searched = None
+
+    def add(self, num_results, date):
+        self.num_searches += 1
+        self.total_results += num_results
+        if not num_results:
+            self.num_zero_results += 1
+        self.date_last_searched = date
+
+    def merge(self, other):
+        self.num_searches += other.num_searches
+        self.num_zero_results += other.num_zero_results
+        self.total_results += other.total_results
+        dates = [
+            date
+            for date in (self.date_last_searched, other.date_last_searched)
+            if date is not None
+        ]
+        self.date_last_searched = max(dates) if dates else None
+
+
+class SearchAnalyticsRecorder:
+    """
+    Aggregates the searched queries in memory, and writes them to the database
+    from a background thread every `flush_interval` seconds, or as soon as
+    `max_buffer` distinct queries are buffered. Recording a search never touches
+    the database, so searching doesn't wait on analytics.
+    """
+
+    def __init__(
+        self,
+        flush_interval=SEARCH_ANALYTICS_FLUSH_INTERVAL,
+        max_buffer=SEARCH_ANALYTICS_MAX_BUFFER,
+    ):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.buffer = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def record(self, query, num_results):
+        query = normalize_query(query)
+        if not query:
+            return
+        with self.lock:
+            stats = self.buffer.get(query)
+            if stats is None:
+                stats = self.buffer[query] = QueryStats()
+            stats.add(num_results, timezone.now())
+            full = len(self.buffer) >= self.max_buffer
+        self.ensure_thread()
+        if full:
+            self.wakeup.set()
+
+    def ensure_thread(self):
+        # Threads don't survive a fork, so workers of a preforking server start
+        # their own.
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="search-analytics", daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Flushing the search analytics failed")
+            finally:
+                connection.close()
+
+    def flush(self):
+        """
+        Writes the buffered queries with a batch of upserts and returns the number
+        of queries written. When writing fails, the queries are put back into the
+        buffer, to be written with the next flush.
+        """
+        with self.lock:
+            buffer, self.buffer = self.buffer, {}
+        if not buffer:
+            return 0
+
+        started = time.monotonic()
+        try:
+            self.write(buffer)
+        except Exception:
+            self.restore(buffer)
+            raise
+        logger.debug(
+            "Flushed %s search queries in %.3fs",
+            len(buffer),
+            time.monotonic() - started,
+        )
+        return len(buffer)
+
+    def write(self, buffer):
+        with self.flush_lock, transaction.atomic():
+            if connection.vendor in ("postgresql", "sqlite", "mysql"):
+                rows = sorted(buffer.items())
+                for chunk in chunked(rows, UPSERT_CHUNK_SIZE):
+                    self.upsert(chunk)
+            else:
+                self.update_each(buffer)
+
+    def get_upsert_sql(self, num_rows):
+        quote = connection.ops.quote_name
+        table = quote(SearchQueryStat._meta.db_table)
+        columns = ["query", *UPSERT_COUNTERS, "date_last_searched"]
+        values = ", ".join(["(%s)" % ", ".join(["%s"] * len(columns))] * num_rows)
+        sql = "INSERT INTO %s (%s) VALUES %s" % (
+            table,
+            ", ".join(quote(column) for column in columns),
+            values,
+        )
+        if connection.vendor == "mysql":
+            assignments = [
+                f"{quote(column)} = {quote(column)} + VALUES({quote(column)})"
+                for column in UPSERT_COUNTERS
+            ]
+            assignments.append("{0} = VALUES({0})".format(quote("date_last_searched")))
+            return f"{sql} ON DUPLICATE KEY UPDATE {', '.join(assignments)}"
+        assignments = [
+            f"{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}"
+            for column in UPSERT_COUNTERS
+        ]
+        assignments.append("{0} = EXCLUDED.{0}".format(quote("date_last_searched")))
+        return (
+            f"{sql} ON CONFLICT ({quote('query')}) DO UPDATE SET "
+            f"{', '.join(assignments)}"
+        )
+
+    def upsert(self, rows):
+        """
+        Inserts or increments the stats of the given (query, stats) rows with a
+        single statement.
+        """
+        params = []
+        for query, stats in rows:
+            params += [
+                query,
+                stats.num_searches,
+                stats.num_zero_results,
+                stats.total_results,
+                connection.ops.adapt_datetimefield_value(stats.date_last_searched),
+            ]
+        with connection.cursor() as cursor:
+            cursor.execute(self.get_upsert_sql(len(rows)), params)
+
+    def update_each(self, buffer):
+        """
+        Creates the missing queries and updates them one by one, for databases
+        without an upsert statement.
+        """
+        SearchQueryStat.objects.bulk_create(
+            [SearchQueryStat(query=query) for query in buffer],
+            ignore_conflicts=True,
+        )
+        for query, stats in sorted(buffer.items()):
+            SearchQueryStat.objects.filter(query=query).update(
+                num_searches=F("num_searches") + stats.num_searches,
+                num_zero_results=F("num_zero_results") + stats.num_zero_results,
+                total_results=F("total_results") + stats.total_results,
+                date_last_searched=stats.date_last_searched,
+            )
+
+    def restore(self, buffer):
+        """
+        Puts the queries of a failed flush back into the buffer. At most
+        `max_buffer` queries are kept, the least recently searched queries are
+        dropped, so the buffer doesn't grow while the database is unavailable.
+        """
+        with self.lock:
+            for query, stats in buffer.items():
+                current = self.buffer.get(query)
+                if current is not None:
+                    stats.merge(current)
+                self.buffer[query] = stats
+            overflow = len(self.buffer) - self.max_buffer
+            if overflow > 0:
+                oldest = sorted(
+                    self.buffer, key=lambda query: self.buffer[query].date_last_searched
+                )[:overflow]
+                for query in oldest:
+                    del self.buffer[query]
+        if overflow > 0:
+            logger.warning("Dropped %s buffered search queries", overflow)
+
+
+search_analytics_recorder = SearchAnalyticsRecorder()
+
+
+def flush_on_exit():
+    try:
+        search_analytics_recorder.flush()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Flushing the search analytics on exit failed")
+
+
+atexit.register(flush_on_exit)
+
+
+def record_search(query, num_results):
+    search_analytics_recorder.record(query, num_results)
+
+
+def get_top_queries(limit=100, zero_results=False):
+    """
+    Returns the most searched queries, eg; to warm caches with. With
+    `zero_results`, returns the queries that most often found nothing.
+    """
+    queryset = SearchQueryStat.objects.all()
+    if zero_results:
+        queryset = queryset.filter(num_zero_results__gt=0).order_by(
+            "-num_zero_results"
+        )
+    else:
+        queryset = queryset.order_by("-num_searches")
+    return list(queryset.values_list("query", flat=True)[:limit])
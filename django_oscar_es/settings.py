@@ -14,6 +14,218 @@ PRODUCT_INDEX_MODULE = getattr(
     "django_oscar_es.index.product_index",
 )
 
+# Prefix used for all metrics exposed by django_oscar_es.metrics.
+METRICS_PREFIX = getattr(settings, "OSCAR_ELASTICSEARCH_METRICS_PREFIX", "oscar_es_")
+
+# Dotted paths to callables that receive every metric observation, eg; to push them
+# to statsd. They're called with (name, metric_type, value, labels).
+METRICS_CALLBACKS = getattr(settings, "OSCAR_ELASTICSEARCH_METRICS_CALLBACKS", [])
+
+# Use the in-memory Elasticsearch replacement (django_oscar_es.fake_backend) instead
+# of a real cluster. Meant for tests and local development only.
+FAKE_BACKEND = getattr(settings, "OSCAR_ELASTICSEARCH_FAKE_BACKEND", False)
+
+# When a stockrecord changes, only send the stock related fields (price,
+# num_in_stock, is_available) of the product (and its parent) to Elasticsearch.
+PARTIAL_STOCK_UPDATES = getattr(
+    settings, "OSCAR_ELASTICSEARCH_PARTIAL_STOCK_UPDATES", True
+)
+PARTIAL_UPDATE_CHUNK_SIZE = getattr(
+    settings, "OSCAR_ELASTICSEARCH_PARTIAL_UPDATE_CHUNK_SIZE", 500
+)
+
+# When an attribute option or category is renamed, update the denormalised values
+# in the index directly instead of re-preparing every affected product.
+PROPAGATE_RENAMES = getattr(settings, "OSCAR_ELASTICSEARCH_PROPAGATE_RENAMES", True)
+# Either "update_by_query" (handled server side by Elasticsearch) or "bulk" (partial
+# updates for the affected product ids only).
+PROPAGATION_STRATEGY = getattr(
+    settings, "OSCAR_ELASTICSEARCH_PROPAGATION_STRATEGY", "update_by_query"
+)
+# Throttle for the propagation jobs, in documents per second (-1 is unthrottled).
+PROPAGATION_REQUESTS_PER_SECOND = getattr(
+    settings, "OSCAR_ELASTICSEARCH_PROPAGATION_REQUESTS_PER_SECOND", 1000
+)
+PROPAGATION_CHUNK_SIZE = getattr(
+    settings, "OSCAR_ELASTICSEARCH_PROPAGATION_CHUNK_SIZE", 500
+)
+
+# Push the mapping of newly added product attributes to the live index right away.
+AUTO_SYNC_ATTRIBUTE_MAPPING = getattr(
+    settings, "OSCAR_ELASTICSEARCH_AUTO_SYNC_ATTRIBUTE_MAPPING", True
+)
+
+NUMBER_OF_SHARDS = getattr(settings, "OSCAR_ELASTICSEARCH_NUMBER_OF_SHARDS", 1)
+NUMBER_OF_REPLICAS = getattr(settings, "OSCAR_ELASTICSEARCH_NUMBER_OF_REPLICAS", 0)
+
+# Store a hash of every prepared document and don't send documents whose hash
+# matches the one already indexed. This costs an extra lookup per bulk call, so
+# it's meant for repeated full syncs of a mostly unchanged catalogue.
+SKIP_UNCHANGED_DOCUMENTS = getattr(
+    settings, "OSCAR_ELASTICSEARCH_SKIP_UNCHANGED_DOCUMENTS", False
+)
+# Number of documents to look up the stored hashes for with a single mget.
+CONTENT_HASH_LOOKUP_SIZE = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CONTENT_HASH_LOOKUP_SIZE", 500
+)
+
+# Send the bulk requests of large indexing runs (resumable rebuilds, the catch up
+# of a reindex, consistency repairs and suspended indexing flushes) sized by bytes
+# and adapted to the measured latency, retrying the items (or requests) that were
+# rejected. Batches are sent concurrently, so operations on the same document can
+# be reordered; realtime updates never use it.
+ADAPTIVE_BULK = getattr(settings, "OSCAR_ELASTICSEARCH_ADAPTIVE_BULK", False)
+BULK_INITIAL_BATCH_BYTES = getattr(
+    settings, "OSCAR_ELASTICSEARCH_BULK_INITIAL_BATCH_BYTES", 5 * 1024 * 1024
+)
+BULK_MIN_BATCH_BYTES = getattr(
+    settings, "OSCAR_ELASTICSEARCH_BULK_MIN_BATCH_BYTES", 512 * 1024
+)
+BULK_MAX_BATCH_BYTES = getattr(
+    settings, "OSCAR_ELASTICSEARCH_BULK_MAX_BATCH_BYTES", 20 * 1024 * 1024
+)
+# Requests that take longer than this (in seconds) shrink the batch size.
+BULK_TARGET_LATENCY = getattr(settings, "OSCAR_ELASTICSEARCH_BULK_TARGET_LATENCY", 2.0)
+BULK_MAX_IN_FLIGHT = getattr(settings, "OSCAR_ELASTICSEARCH_BULK_MAX_IN_FLIGHT", 2)
+BULK_MAX_RETRIES = getattr(settings, "OSCAR_ELASTICSEARCH_BULK_MAX_RETRIES", 8)
+BULK_INITIAL_BACKOFF = getattr(
+    settings, "OSCAR_ELASTICSEARCH_BULK_INITIAL_BACKOFF", 0.5
+)
+BULK_MAX_BACKOFF = getattr(settings, "OSCAR_ELASTICSEARCH_BULK_MAX_BACKOFF", 30)
+# Gzip the bodies of bulk requests.
+BULK_COMPRESS = getattr(settings, "OSCAR_ELASTICSEARCH_BULK_COMPRESS", False)
+
+# Collapse the variants of a parent product into a single result (the best matching
+# variant) in the catalogue views, facet counts are then counted per parent.
+COLLAPSE_VARIANTS = getattr(settings, "OSCAR_ELASTICSEARCH_COLLAPSE_VARIANTS", False)
+
+# Count the values of all facets on a sample of the results (per facet this can be
+# enabled in the dashboard). Up to this number of documents per shard are sampled,
+# counts of larger result sets are scaled up and approximate.
+APPROXIMATE_FACETS = getattr(settings, "OSCAR_ELASTICSEARCH_APPROXIMATE_FACETS", False)
+APPROXIMATE_FACETS_SHARD_SIZE = getattr(
+    settings, "OSCAR_ELASTICSEARCH_APPROXIMATE_FACETS_SHARD_SIZE", 10000
+)
+
+# Count the results exactly up to this number, larger totals are reported as a
+# lower bound ("more than 10000 results"), which allows the search to skip
+# documents that can't make it into the page. True counts every result.
+TRACK_TOTAL_HITS = getattr(settings, "OSCAR_ELASTICSEARCH_TRACK_TOTAL_HITS", 10000)
+
+# Boosts the relevance by rank features, eg; {"popularity": 2.0, "rating": 1.0}. The
+# value is the boost of a rank_feature query or a dict with its parameters, eg;
+# {"popularity": {"boost": 2.0, "log": {"scaling_factor": 1}}}.
+RANK_FEATURE_BOOSTS = getattr(settings, "OSCAR_ELASTICSEARCH_RANK_FEATURE_BOOSTS", {})
+
+# Match changed products against the saved searches, stored as percolator queries
+# in a separate index.
+SAVED_SEARCHES = getattr(settings, "OSCAR_ELASTICSEARCH_SAVED_SEARCHES", False)
+SAVED_SEARCH_INDEX = getattr(
+    settings, "OSCAR_ELASTICSEARCH_SAVED_SEARCH_INDEX", "products-saved-searches"
+)
+# The number of documents to percolate with a single search request.
+PERCOLATE_CHUNK_SIZE = getattr(
+    settings, "OSCAR_ELASTICSEARCH_PERCOLATE_CHUNK_SIZE", 100
+)
+
+# Timeout (in seconds) of the search requests of the catalogue views, None uses the
+# timeout of the client.
+SEARCH_REQUEST_TIMEOUT = getattr(
+    settings, "OSCAR_ELASTICSEARCH_SEARCH_REQUEST_TIMEOUT", None
+)
+
+# Stop searching when too many searches fail or are slow, and serve degraded
+# results (cached or from the database, without facets) until Elasticsearch
+# recovers.
+CIRCUIT_BREAKER = getattr(settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER", False)
+# The breaker opens when, within the window (in seconds) and after at least the
+# minimum number of calls, the rate of failed or slow calls reaches the threshold.
+CIRCUIT_BREAKER_WINDOW = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER_WINDOW", 30
+)
+CIRCUIT_BREAKER_MIN_CALLS = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER_MIN_CALLS", 20
+)
+CIRCUIT_BREAKER_ERROR_RATE = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER_ERROR_RATE", 0.5
+)
+CIRCUIT_BREAKER_SLOW_RATE = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER_SLOW_RATE", 0.8
+)
+# Calls that take longer than this (in seconds) count as slow.
+CIRCUIT_BREAKER_SLOW_CALL_DURATION = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER_SLOW_CALL_DURATION", 1.0
+)
+# Seconds to stay open, before letting probe calls through to check for recovery.
+CIRCUIT_BREAKER_OPEN_DURATION = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER_OPEN_DURATION", 30
+)
+# The number of probe calls that may run at the same time while half-open.
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = getattr(
+    settings, "OSCAR_ELASTICSEARCH_CIRCUIT_BREAKER_HALF_OPEN_PROBES", 1
+)
+# Seconds to keep the results of a page in the cache, to serve them while the
+# breaker is open.
+DEGRADED_CACHE_TIMEOUT = getattr(
+    settings, "OSCAR_ELASTICSEARCH_DEGRADED_CACHE_TIMEOUT", 300
+)
+# Seconds between refreshes of the cached results of a page, so the cache isn't
+# written on every search.
+DEGRADED_CACHE_REFRESH_INTERVAL = getattr(
+    settings, "OSCAR_ELASTICSEARCH_DEGRADED_CACHE_REFRESH_INTERVAL", 60
+)
+# Querystring parameters that don't change the results (eg; tracking), left out of
+# the key of the cached results. Names ending with * are prefixes.
+DEGRADED_CACHE_IGNORED_PARAMS = getattr(
+    settings,
+    "OSCAR_ELASTICSEARCH_DEGRADED_CACHE_IGNORED_PARAMS",
+    ["utm_*", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid"],
+)
+
+# Thresholds of the facet cost preview in the dashboard, facets above any of them
+# are flagged: the aggregation time in milliseconds, the number of distinct values
+# and the size of the facet in the response in bytes.
+FACET_COST_WARNING_MS = getattr(
+    settings, "OSCAR_ELASTICSEARCH_FACET_COST_WARNING_MS", 50
+)
+FACET_CARDINALITY_WARNING = getattr(
+    settings, "OSCAR_ELASTICSEARCH_FACET_CARDINALITY_WARNING", 1000
+)
+FACET_RESPONSE_SIZE_WARNING = getattr(
+    settings, "OSCAR_ELASTICSEARCH_FACET_RESPONSE_SIZE_WARNING", 20000
+)
+
+# Aggregate the search queries (and their number of results) per process and write
+# them to the database in batches, instead of sending Oscar's user_search signal
+# with every search.
+SEARCH_ANALYTICS = getattr(settings, "OSCAR_ELASTICSEARCH_SEARCH_ANALYTICS", False)
+# Flush the aggregated queries every this many seconds, or as soon as this many
+# distinct queries are buffered.
+SEARCH_ANALYTICS_FLUSH_INTERVAL = getattr(
+    settings, "OSCAR_ELASTICSEARCH_SEARCH_ANALYTICS_FLUSH_INTERVAL", 30
+)
+SEARCH_ANALYTICS_MAX_BUFFER = getattr(
+    settings, "OSCAR_ELASTICSEARCH_SEARCH_ANALYTICS_MAX_BUFFER", 1000
+)
+
+# Time every prepare_<field> method of the product document (the
+# prepare_field_seconds metric). This adds a timer per field of every prepared
+# document, so it's meant for profiling; the whole prepare is always timed.
+PREPARE_FIELD_METRICS = getattr(
+    settings, "OSCAR_ELASTICSEARCH_PREPARE_FIELD_METRICS", False
+)
+
+# Number of seconds a process trusts its mapping version before checking the
+# shared version in the cache again, 0 checks on every read of the field choices.
+MAPPING_VERSION_CHECK_INTERVAL = getattr(
+    settings, "OSCAR_ELASTICSEARCH_MAPPING_VERSION_CHECK_INTERVAL", 5
+)
+
+# Dotted path to a class that decides the custom routing of product documents (and
+# category queries), eg; "django_oscar_es.routing.RootCategoryRouting". Changing
+# this requires a rebuild of the index.
+ROUTING_CLASS = getattr(settings, "OSCAR_ELASTICSEARCH_ROUTING_CLASS", None)
+
 
 def get_product_document():
     module_path, class_name = PRODUCT_DOCUMENT_MODULE.rsplit(".", 1)
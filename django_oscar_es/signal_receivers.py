@@ -1,11 +1,50 @@
+import logging
+
+from functools import partial
+
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
+
+from oscar.core.loading import get_model
 
-from .models import ProductFacet, ProductSearchField
-from .cache import (
-    PRODUCT_ELASTICSEARCH_SETTINGS_CACHE_KEY,
-    get_product_elasticsearch_settings,
+from .models import (
+    ProductFacet,
+    ProductFacetDisabledCategory,
+    ProductFacetEnabledCategory,
+    ProductFacetRangeOption,
+    ProductSearchField,
+    SavedSearch,
+)
+from .cache import invalidate_product_elasticsearch_settings
+from .indexing import (
+    is_autosync_enabled,
+    schedule_routing_update,
+    schedule_stock_update,
+)
+from .propagation import (
+    propagate_attribute_option_rename,
+    propagate_category_change,
+    run_propagation,
 )
+from .schema import sync_attribute_mapping
+from .settings import (
+    AUTO_SYNC_ATTRIBUTE_MAPPING,
+    PARTIAL_STOCK_UPDATES,
+    PROPAGATE_RENAMES,
+    SAVED_SEARCHES,
+    get_product_document,
+)
+from .utils import on_commit_once
+
+AttributeOption = get_model("catalogue", "AttributeOption")
+Category = get_model("catalogue", "Category")
+Product = get_model("catalogue", "Product")
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductCategory = get_model("catalogue", "ProductCategory")
+StockRecord = get_model("partner", "StockRecord")
+
+logger = logging.getLogger(__name__)
 
 
 # pylint: disable=unused-argument
@@ -13,8 +52,145 @@ from .cache import (
 @receiver(post_delete, sender=ProductFacet)
 @receiver(post_save, sender=ProductSearchField)
 @receiver(post_delete, sender=ProductSearchField)
+@receiver(post_save, sender=ProductFacetRangeOption)
+@receiver(post_delete, sender=ProductFacetRangeOption)
+@receiver(m2m_changed, sender=ProductFacetEnabledCategory)
+@receiver(m2m_changed, sender=ProductFacetDisabledCategory)
 def refresh_product_elasticsearch_settings_cache(sender, instance, **kwargs):
-    from django.core.cache import cache
+    invalidate_product_elasticsearch_settings()
+
+
+# pylint: disable=unused-argument
+@receiver(post_save, sender=StockRecord)
+@receiver(post_delete, sender=StockRecord)
+def update_product_stock(sender, instance, **kwargs):
+    if not PARTIAL_STOCK_UPDATES or not is_autosync_enabled():
+        return
+    if get_product_document().django.ignore_signals:
+        return
+
+    product_ids = [instance.product_id]
+    try:
+        parent_id = instance.product.parent_id
+    except Product.DoesNotExist:
+        # The product itself is being deleted.
+        parent_id = None
+
+    # The stock of a parent is based on its children, so it has to be updated as well.
+    if parent_id:
+        product_ids.append(parent_id)
+    schedule_stock_update(product_ids)
+
+
+def should_propagate_renames():
+    return (
+        PROPAGATE_RENAMES
+        and is_autosync_enabled()
+        and not get_product_document().django.ignore_signals
+    )
+
+
+# pylint: disable=unused-argument
+@receiver(pre_save, sender=AttributeOption)
+def remember_previous_attribute_option(sender, instance, **kwargs):
+    if instance.pk and should_propagate_renames():
+        instance._previous_option = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("option", flat=True)
+            .first()
+        )
+
+
+# pylint: disable=unused-argument
+@receiver(post_save, sender=AttributeOption)
+def propagate_attribute_option(sender, instance, created, **kwargs):
+    previous_option = getattr(instance, "_previous_option", None)
+    if created or previous_option is None or previous_option == instance.option:
+        return
+    transaction.on_commit(
+        partial(
+            run_propagation,
+            propagate_attribute_option_rename,
+            instance,
+            previous_option,
+        )
+    )
+
+
+# pylint: disable=unused-argument
+@receiver(pre_save, sender=Category)
+def remember_previous_category(sender, instance, **kwargs):
+    if instance.pk and should_propagate_renames():
+        instance._previous_values = (
+            sender.objects.filter(pk=instance.pk).values("name", "description").first()
+        )
+
+
+# pylint: disable=unused-argument
+@receiver(post_save, sender=Category)
+def propagate_category(sender, instance, created, **kwargs):
+    previous_values = getattr(instance, "_previous_values", None)
+    if created or not previous_values:
+        return
+    changed_fields = [
+        field
+        for field, value in previous_values.items()
+        if getattr(instance, field) != value
+    ]
+    if changed_fields:
+        transaction.on_commit(
+            partial(
+                run_propagation, propagate_category_change, instance, changed_fields
+            )
+        )
+
+
+def sync_attribute_mapping_safely():
+    try:
+        sync_attribute_mapping()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Updating the attributes mapping failed, run the oscar_es_sync_mapping "
+            "management command to retry."
+        )
+
 
-    cache.delete(PRODUCT_ELASTICSEARCH_SETTINGS_CACHE_KEY)
-    get_product_elasticsearch_settings()
+# pylint: disable=unused-argument
+@receiver(post_save, sender=ProductAttribute)
+def update_attributes_mapping(sender, instance, **kwargs):
+    if AUTO_SYNC_ATTRIBUTE_MAPPING and is_autosync_enabled():
+        on_commit_once(sync_attribute_mapping_safely)
+
+
+# pylint: disable=unused-argument
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def update_product_routing(sender, instance, **kwargs):
+    if is_autosync_enabled() and not get_product_document().django.ignore_signals:
+        schedule_routing_update([instance.product_id])
+
+
+def sync_saved_search(saved_search_id):
+    # pylint: disable=import-outside-toplevel
+    from .saved_searches import delete_saved_search, index_saved_search
+
+    try:
+        saved_search = SavedSearch.objects.filter(pk=saved_search_id).first()
+        if saved_search is None:
+            delete_saved_search(saved_search_id)
+        else:
+            index_saved_search(saved_search)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Syncing saved search %s failed, run the oscar_es_saved_searches "
+            "management command with --rebuild to retry.",
+            saved_search_id,
+        )
+
+
+# pylint: disable=unused-argument
+@receiver(post_save, sender=SavedSearch)
+@receiver(post_delete, sender=SavedSearch)
+def update_saved_search(sender, instance, **kwargs):
+    if SAVED_SEARCHES:
+        transaction.on_commit(partial(sync_saved_search, instance.pk))
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent when changed products match a saved search, with the `saved_search` and the
+# `product_ids` that matched.
+saved_search_matched = Signal()
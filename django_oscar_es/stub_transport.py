@@ -0,0 +1,242 @@
+import gzip
+import json
+import re
+import time
+
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlsplit
+
+from elastic_transport import ApiResponseMeta, BaseNode, HttpHeaders, NodeApiResponse
+from elasticsearch import Elasticsearch
+from elasticsearch_dsl.connections import connections
+
+ES_VERSION = "8.13.0"
+
+
+class StubNode(BaseNode):
+    """
+    An in-process elastic_transport node that never touches the network. Every
+    request is answered with a canned, successful response, which makes it usable
+    for benchmarking the client side of indexing and searching.
+
+    Requests are routed to `handle_<name>` methods, subclasses can override those
+    to give back more meaningful responses. Usage:
+
+        Elasticsearch("http://stub:9200", node_class=StubNode)
+    """
+
+    routes = [
+        ("HEAD", r"^/$", "ping"),
+        ("GET", r"^/$", "info"),
+        ("POST", r"^/(?:(?P<index>[^/_][^/]*)/)?_bulk$", "bulk"),
+        ("PUT", r"^/(?:(?P<index>[^/_][^/]*)/)?_bulk$", "bulk"),
+        ("GET", r"^/(?:(?P<index>[^/_][^/]*)/)?_search$", "search"),
+        ("POST", r"^/(?:(?P<index>[^/_][^/]*)/)?_search$", "search"),
+        ("GET", r"^/(?:(?P<index>[^/_][^/]*)/)?_count$", "count"),
+        ("POST", r"^/(?:(?P<index>[^/_][^/]*)/)?_count$", "count"),
+        ("GET", r"^/(?:(?P<index>[^/_][^/]*)/)?_mget$", "mget"),
+        ("POST", r"^/(?:(?P<index>[^/_][^/]*)/)?_mget$", "mget"),
+        ("POST", r"^/(?P<index>[^/_][^/]*)/_refresh$", "refresh"),
+        ("GET", r"^/(?P<index>[^/_][^/]*)/_mapping$", "get_mapping"),
+        ("PUT", r"^/(?P<index>[^/_][^/]*)/_mapping$", "put_mapping"),
+        ("GET", r"^/(?P<index>[^/_][^/]*)/_doc/(?P<doc_id>[^/]+)$", "get_document"),
+        ("PUT", r"^/(?P<index>[^/_][^/]*)/_doc/(?P<doc_id>[^/]+)$", "index_document"),
+        ("POST", r"^/(?P<index>[^/_][^/]*)/_doc/(?P<doc_id>[^/]+)$", "index_document"),
+        (
+            "DELETE",
+            r"^/(?P<index>[^/_][^/]*)/_doc/(?P<doc_id>[^/]+)$",
+            "delete_document",
+        ),
+        (
+            "POST",
+            r"^/(?P<index>[^/_][^/]*)/_update/(?P<doc_id>[^/]+)$",
+            "update_document",
+        ),
+        ("POST", r"^/(?P<index>[^/_][^/]*)/_pit$", "open_point_in_time"),
+        ("DELETE", r"^/_pit$", "close_point_in_time"),
+        ("HEAD", r"^/(?P<index>[^/_][^/]*)$", "index_exists"),
+        ("PUT", r"^/(?P<index>[^/_][^/]*)$", "create_index"),
+        ("DELETE", r"^/(?P<index>[^/_][^/]*)$", "delete_index"),
+    ]
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.requests = []
+        self._compiled_routes = [
+            (method, re.compile(pattern), name) for method, pattern, name in self.routes
+        ]
+
+    def perform_request(
+        self, method, target, body=None, headers=None, request_timeout=None
+    ):
+        started = time.perf_counter()
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        payload = self.parse_body(body, headers or {})
+        self.requests.append((method, url.path, params, payload))
+
+        status, response = self.dispatch(method, url.path, params, payload)
+        raw = b"" if response is None else json.dumps(response).encode("utf-8")
+        meta = ApiResponseMeta(
+            status=status,
+            http_version="1.1",
+            headers=HttpHeaders(
+                {
+                    "content-type": "application/json",
+                    "x-elastic-product": "Elasticsearch",
+                }
+            ),
+            duration=time.perf_counter() - started,
+            node=self.config,
+        )
+        return NodeApiResponse(meta, raw)
+
+    def close(self):
+        pass
+
+    def parse_body(self, body, headers):
+        if not body:
+            return None
+        if (headers.get("content-encoding") or "").lower() == "gzip":
+            body = gzip.decompress(body)
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        if "ndjson" in (headers.get("content-type") or ""):
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        return json.loads(body)
+
+    def dispatch(self, method, path, params, payload):
+        for route_method, pattern, name in self._compiled_routes:
+            if route_method != method:
+                continue
+            match = pattern.match(path)
+            if match:
+                kwargs = {k: v for k, v in match.groupdict().items() if v is not None}
+                return getattr(self, f"handle_{name}")(params, payload, **kwargs)
+        return self.handle_default(method, path, params, payload)
+
+    def handle_default(self, method, path, params, payload):
+        return 200, {"acknowledged": True}
+
+    def handle_ping(self, params, payload):
+        return 200, None
+
+    def handle_info(self, params, payload):
+        return 200, {
+            "name": "stub",
+            "cluster_name": "stub",
+            "version": {"number": ES_VERSION, "build_flavor": "default"},
+            "tagline": "You Know, for Search",
+        }
+
+    def handle_bulk(self, params, payload, index=None):
+        items = []
+        for action, meta, _ in iter_bulk_operations(payload or [], index):
+            items.append(
+                {
+                    action: {
+                        "_index": meta.get("_index"),
+                        "_id": meta.get("_id"),
+                        "status": 201 if action in ("index", "create") else 200,
+                        "result": "created" if action != "delete" else "deleted",
+                    }
+                }
+            )
+        return 200, {"took": 0, "errors": False, "items": items}
+
+    def handle_search(self, params, payload, index=None):
+        return 200, {
+            "took": 0,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": 0, "relation": "eq"},
+                "max_score": None,
+                "hits": [],
+            },
+        }
+
+    def handle_count(self, params, payload, index=None):
+        return 200, {"count": 0}
+
+    def handle_mget(self, params, payload, index=None):
+        docs = (payload or {}).get("docs") or [
+            {"_id": _id} for _id in (payload or {}).get("ids", [])
+        ]
+        return 200, {
+            "docs": [
+                {"_index": doc.get("_index", index), "_id": doc["_id"], "found": False}
+                for doc in docs
+            ]
+        }
+
+    def handle_refresh(self, params, payload, index):
+        return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+    def handle_get_mapping(self, params, payload, index):
+        return 200, {index: {"mappings": {"properties": {}}}}
+
+    def handle_put_mapping(self, params, payload, index):
+        return 200, {"acknowledged": True}
+
+    def handle_get_document(self, params, payload, index, doc_id):
+        return 404, {"_index": index, "_id": doc_id, "found": False}
+
+    def handle_index_document(self, params, payload, index, doc_id):
+        return 201, {"_index": index, "_id": doc_id, "result": "created"}
+
+    def handle_update_document(self, params, payload, index, doc_id):
+        return 200, {"_index": index, "_id": doc_id, "result": "updated"}
+
+    def handle_delete_document(self, params, payload, index, doc_id):
+        return 200, {"_index": index, "_id": doc_id, "result": "deleted"}
+
+    def handle_open_point_in_time(self, params, payload, index):
+        return 200, {"id": "stub-point-in-time"}
+
+    def handle_close_point_in_time(self, params, payload):
+        return 200, {"succeeded": True, "num_freed": 1}
+
+    def handle_index_exists(self, params, payload, index):
+        return 404, None
+
+    def handle_create_index(self, params, payload, index):
+        return 200, {"acknowledged": True, "shards_acknowledged": True, "index": index}
+
+    def handle_delete_index(self, params, payload, index):
+        return 200, {"acknowledged": True}
+
+
+def iter_bulk_operations(lines, default_index=None):
+    """
+    Yields (action, meta, source) tuples for the parsed lines of a bulk body.
+    """
+    lines = iter(lines)
+    for line in lines:
+        action, meta = next(iter(line.items()))
+        meta = dict(meta)
+        meta.setdefault("_index", default_index)
+        source = None if action == "delete" else next(lines)
+        yield action, meta, source
+
+
+@contextmanager
+def stub_connection(node_class=StubNode, alias="default"):
+    """
+    Temporarily replaces the elasticsearch-dsl connection for `alias` with a client
+    that uses the given (in-process) node class.
+    """
+    try:
+        previous = connections.get_connection(alias)
+    except KeyError:
+        previous = None
+
+    client = Elasticsearch("http://stub:9200", node_class=node_class)
+    connections.add_connection(alias, client)
+    try:
+        yield client
+    finally:
+        if previous is not None:
+            connections.add_connection(alias, previous)
+        else:
+            connections.remove_connection(alias)
@@ -0,0 +1,43 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def get_task_progress(client, task_id):
+    """
+    Returns the progress of a (reindex, update_by_query, ...) task.
+    """
+    response = client.tasks.get(task_id=task_id)
+    status = response["task"]["status"]
+    return {
+        "completed": response["completed"],
+        "total": status.get("total", 0),
+        "created": status.get("created", 0),
+        "updated": status.get("updated", 0),
+        "deleted": status.get("deleted", 0),
+        "version_conflicts": status.get("version_conflicts", 0),
+        "failures": response.get("response", {}).get("failures", []),
+        "error": response.get("error"),
+    }
+
+
+def wait_for_task(client, task_id, poll_interval=5, callback=None):
+    """
+    Polls the task until it's completed, `callback` is called with the progress
+    after every poll.
+    """
+    while True:
+        progress = get_task_progress(client, task_id)
+        if callback:
+            callback(progress)
+        else:
+            logger.info(
+                "Task %s: %s/%s documents processed",
+                task_id,
+                progress["created"] + progress["updated"] + progress["deleted"],
+                progress["total"],
+            )
+        if progress["completed"]:
+            return progress
+        time.sleep(poll_interval)
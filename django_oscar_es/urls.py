@@ -5,6 +5,7 @@ from oscar.core.loading import get_class
 CatalogueView = get_class("django_oscar_es.views", "CatalogueView")
 ProductCategoryView = get_class("django_oscar_es.views", "ProductCategoryView")
 SearchView = get_class("django_oscar_es.views", "SearchView")
+FacetValuesView = get_class("django_oscar_es.views", "FacetValuesView")
 
 
 app_name = "django_oscar_es"
@@ -18,4 +19,9 @@ urlpatterns = [
         name="category",
     ),
     path("search/", SearchView.as_view(), name="search"),
+    path(
+        "catalogue/facets/<int:facet_pk>/",
+        FacetValuesView.as_view(),
+        name="facet-values",
+    ),
 ]
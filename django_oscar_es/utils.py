@@ -0,0 +1,40 @@
+import threading
+
+from django.db import transaction
+
+# The (database alias, func) of the on_commit_once callbacks that haven't run yet,
+# per thread (like the database connections).
+_pending = threading.local()
+
+
+def on_commit_once(func, using=None):
+    """
+    Like transaction.on_commit, but `func` runs only once when the current
+    transaction commits, no matter how often it's registered. Outside of a
+    transaction it runs right away.
+    """
+    key = (transaction.get_connection(using).alias, func)
+    if not hasattr(_pending, "keys"):
+        _pending.keys = set()
+    _pending.keys.add(key)
+
+    def run_once():
+        # The first callback of the transaction runs func, the others find it
+        # already done. A rolled back transaction leaves the key behind, which
+        # only means the next registration runs func.
+        if key in _pending.keys:
+            _pending.keys.discard(key)
+            func()
+
+    transaction.on_commit(run_once, using=using)
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,15 +1,33 @@
+import hashlib
 import logging
 
+from urllib.parse import urlencode
+
 from elasticsearch_dsl import Q
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils.functional import SimpleLazyObject
+from django.views import View
 
 from django_es_kit.views import ESFacetedSearchListView
 
 from oscar.core.loading import get_class, get_model
 from oscar.apps.search.signals import user_search
 
+from .settings import (
+    CIRCUIT_BREAKER,
+    DEGRADED_CACHE_IGNORED_PARAMS,
+    DEGRADED_CACHE_REFRESH_INTERVAL,
+    DEGRADED_CACHE_TIMEOUT,
+    SEARCH_ANALYTICS,
+)
+
+TotalHitsPaginator = get_class("django_oscar_es.paginator", "TotalHitsPaginator")
+CachedPageResults = get_class("django_oscar_es.paginator", "CachedPageResults")
 ProductFacetedSearchForm = get_class(
     "django_oscar_es.forms", "ProductFacetedSearchForm"
 )
@@ -17,6 +35,16 @@ CatalogueFacetedSearch = get_class(
     "django_oscar_es.faceted_search", "CatalogueFacetedSearch"
 )
 Category = get_model("catalogue", "Category")
+Product = get_model("catalogue", "Product")
+ProductFacet = get_model("django_oscar_es", "ProductFacet")
+metrics_registry = get_class("django_oscar_es.metrics", "metrics_registry")
+degraded_responses = get_class("django_oscar_es.metrics", "degraded_responses")
+CircuitOpenError = get_class("django_oscar_es.circuit_breaker", "CircuitOpenError")
+search_circuit_breaker = get_class(
+    "django_oscar_es.circuit_breaker", "search_circuit_breaker"
+)
+get_category_routing = get_class("django_oscar_es.routing", "get_category_routing")
+record_search = get_class("django_oscar_es.search_analytics", "record_search")
 
 logger = logging.getLogger(__name__)
 
@@ -26,10 +54,158 @@ class BaseCatalogueView(ESFacetedSearchListView):
     faceted_search_class = CatalogueFacetedSearch
     paginate_by = settings.OSCAR_PRODUCTS_PER_PAGE
     context_object_name = "products"
+    paginator_class = TotalHitsPaginator
+
+    # Collapse variants into a single result, None uses the setting of the
+    # faceted search class.
+    collapse_variants = None
+    # Count all facets on a sample of the results, None uses the setting of the
+    # faceted search class.
+    approximate_facets = None
+    # Count the results exactly up to this number, None uses the setting of the
+    # faceted search class.
+    track_total_hits = None
+    # The CircuitBreaker the searches are executed through, None disables it.
+    circuit_breaker = search_circuit_breaker if CIRCUIT_BREAKER else None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.faceted_search = None
 
     def get_search_query(self):
         return self.request.GET.get("q", "")
 
+    def get_faceted_search(self):
+        faceted_search = super().get_faceted_search()
+        if self.collapse_variants is not None:
+            faceted_search.collapse_variants = self.collapse_variants
+        if self.approximate_facets is not None:
+            faceted_search.approximate_facets = self.approximate_facets
+        if self.track_total_hits is not None:
+            faceted_search.track_total_hits = self.track_total_hits
+        if self.circuit_breaker is not None:
+            faceted_search.circuit_breaker = self.circuit_breaker
+        self.faceted_search = faceted_search
+        return faceted_search
+
+    def get_paginator(self, *args, **kwargs):
+        return super().get_paginator(
+            *args, faceted_search=self.faceted_search, **kwargs
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Evaluated when rendering, after the search is executed.
+        context["approximate_facet_names"] = SimpleLazyObject(
+            lambda: self.faceted_search.get_approximate_facet_names()
+            if self.faceted_search
+            else []
+        )
+        if self.circuit_breaker is not None and context.get("page_obj") is not None:
+            self.cache_results(context["page_obj"])
+        return context
+
+    def get(self, request, *args, **kwargs):
+        if self.circuit_breaker is None:
+            return super().get(request, *args, **kwargs)
+        try:
+            response = super().get(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                # Render right away, so a search executed while rendering falls
+                # back to the degraded response as well.
+                response.render()
+            return response
+        except CircuitOpenError:
+            pass
+        except self.circuit_breaker.failure_exceptions as e:
+            if not self.circuit_breaker.is_failure(e):
+                # Eg; a bad request, which is a bug that shouldn't be hidden.
+                raise
+            logger.exception("Searching failed, serving a degraded response")
+        return self.get_degraded_response()
+
+    def is_ignored_param(self, name):
+        return any(
+            name.startswith(ignored[:-1]) if ignored.endswith("*") else name == ignored
+            for ignored in DEGRADED_CACHE_IGNORED_PARAMS
+        )
+
+    def get_degraded_cache_key(self):
+        """
+        The key of the cached results of the url. The parameters are sorted and
+        the ones that don't change the results are left out, so the same search
+        shares a key.
+        """
+        querystring = urlencode(
+            sorted(
+                (name, value)
+                for name, values in self.request.GET.lists()
+                if not self.is_ignored_param(name)
+                for value in values
+            )
+        )
+        url = f"{self.request.path}?{querystring}"
+        return "django_oscar_es:degraded:%s" % hashlib.md5(url.encode()).hexdigest()
+
+    def cache_results(self, page):
+        """
+        Caches the product ids of the page, to serve them while the circuit breaker
+        is open. The cached results are refreshed at most once per
+        DEGRADED_CACHE_REFRESH_INTERVAL.
+        """
+        cache_key = self.get_degraded_cache_key()
+        refreshed_key = f"{cache_key}:refreshed"
+        if not cache.add(refreshed_key, True, DEGRADED_CACHE_REFRESH_INTERVAL):
+            return
+        cache.set(
+            cache_key,
+            {
+                "ids": [product.pk for product in page.object_list],
+                "total": page.paginator.count,
+                "offset": (page.number - 1) * page.paginator.per_page,
+            },
+            DEGRADED_CACHE_TIMEOUT,
+        )
+
+    def get_degraded_queryset(self):
+        """
+        A cheap database listing, used when there are no cached results.
+        """
+        return Product.objects.browsable().order_by("-date_created")
+
+    def get_degraded_results(self):
+        cached = cache.get(self.get_degraded_cache_key())
+        if cached is None:
+            return self.get_degraded_queryset()
+        products = Product.objects.base_queryset().in_bulk(cached["ids"])
+        return CachedPageResults(
+            [products[pk] for pk in cached["ids"] if pk in products],
+            cached["total"],
+            cached["offset"],
+        )
+
+    def get_degraded_context_data(self, **kwargs):
+        paginator = Paginator(self.get_degraded_results(), self.paginate_by)
+        page = paginator.get_page(self.request.GET.get(self.page_kwarg))
+        context = {
+            "view": self,
+            "degraded": True,
+            "paginator": paginator,
+            "page_obj": page,
+            "is_paginated": page.has_other_pages(),
+            "object_list": page.object_list,
+            self.context_object_name: page.object_list,
+        }
+        context.update(kwargs)
+        return context
+
+    def get_degraded_response(self):
+        """
+        Renders the page without Elasticsearch, and so without facets.
+        """
+        degraded_responses.inc(view=self.__class__.__name__)
+        return self.render_to_response(self.get_degraded_context_data())
+
 
 class CatalogueView(BaseCatalogueView):
     """
@@ -62,6 +238,7 @@ class ProductCategoryView(BaseCatalogueView):
                 query=Q("terms", **{"categories.id": list(category_ids)}),
             )
         )
+        faceted_search.routing = get_category_routing(self.get_category())
         return faceted_search
 
     def get_form_kwargs(self):
@@ -77,6 +254,17 @@ class ProductCategoryView(BaseCatalogueView):
         context["category"] = self.get_category()
         return context
 
+    def get_degraded_queryset(self):
+        return (
+            super()
+            .get_degraded_queryset()
+            .filter(categories__in=self.get_category().get_descendants_and_self())
+            .distinct()
+        )
+
+    def get_degraded_context_data(self, **kwargs):
+        return super().get_degraded_context_data(category=self.get_category(), **kwargs)
+
 
 class SearchView(BaseCatalogueView):
     """
@@ -84,14 +272,18 @@ class SearchView(BaseCatalogueView):
     """
 
     template_name = "django_oscar_es/results.html"
+    # Record the searches with the buffered search analytics recorder, instead of
+    # sending Oscar's user_search signal.
+    search_analytics = SEARCH_ANALYTICS
 
     def dispatch(self, request, *args, **kwargs):
-        user_search.send(
-            sender=self,
-            session=self.request.session,
-            user=self.request.user,
-            query=self.get_search_query(),
-        )
+        if not self.search_analytics:
+            user_search.send(
+                sender=self,
+                session=self.request.session,
+                user=self.request.user,
+                query=self.get_search_query(),
+            )
 
         return super().dispatch(request, *args, **kwargs)
 
@@ -99,4 +291,133 @@ class SearchView(BaseCatalogueView):
         context = super().get_context_data(**kwargs)
         # for some reason oscar named the page obj different in the search view lol
         context["page"] = context["page_obj"]
+        if self.search_analytics and self.should_record_search(context):
+            record_search(self.get_search_query(), context["paginator"].count)
         return context
+
+    def should_record_search(self, context):
+        # Paging through the results or narrowing them down with a facet isn't a
+        # new search.
+        page = context.get("page_obj")
+        if context.get("paginator") is None or page is None or page.number != 1:
+            return False
+        return self.faceted_search is None or not self.faceted_search.has_filters()
+
+    def get_degraded_queryset(self):
+        if self.get_search_query():
+            # Searching the database (eg; on the title) would scan the whole
+            # product table right when the site is under pressure, so only the
+            # cached results are served.
+            return Product.objects.none()
+        return super().get_degraded_queryset()
+
+    def get_degraded_context_data(self, **kwargs):
+        context = super().get_degraded_context_data(**kwargs)
+        context["page"] = context["page_obj"]
+        return context
+
+
+class FacetValuesView(ProductCategoryView):
+    """
+    Returns the values of a single (lazy) facet as JSON, for the same query and
+    filters as the page it's shown on. The category is passed as `category` in the
+    querystring.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.db_facet = None
+
+    def get_db_facet(self):
+        if not self.db_facet:
+            self.db_facet = get_object_or_404(
+                ProductFacet,
+                pk=self.kwargs["facet_pk"],
+                facet_type=ProductFacet.FACET_TYPE_TERM,
+            )
+        return self.db_facet
+
+    def get_category(self):
+        if not self.category and self.request.GET.get("category"):
+            try:
+                category_pk = int(self.request.GET["category"])
+            except ValueError:
+                raise Http404("Invalid category")
+            self.category = get_object_or_404(Category, pk=category_pk)
+        return self.category
+
+    def get_faceted_search(self):
+        if self.get_category() is None:
+            faceted_search = BaseCatalogueView.get_faceted_search(self)
+        else:
+            faceted_search = super().get_faceted_search()
+        # Only aggregate the requested facet, the selected values of the other
+        # facets are already applied as filters.
+        field = self.get_db_facet().field
+        faceted_search.facets = {
+            name: facet
+            for name, facet in faceted_search.facets.items()
+            if name == field
+        }
+        return faceted_search
+
+    def get_form_kwargs(self):
+        return {"category": self.get_category(), "facet": self.get_db_facet()}
+
+    def get(self, request, *args, **kwargs):
+        db_facet = self.get_db_facet()
+        failure_exceptions = (
+            self.circuit_breaker.failure_exceptions if self.circuit_breaker else ()
+        )
+        try:
+            response = self.get_faceted_search()[0:0].execute()
+        except CircuitOpenError:
+            return self.get_degraded_facet_response(db_facet)
+        except failure_exceptions as e:
+            if not self.circuit_breaker.is_failure(e):
+                raise
+            logger.exception("Fetching the facet values failed")
+            return self.get_degraded_facet_response(db_facet)
+        formatter = db_facet.get_formatter()
+
+        values = []
+        for value, count, selected in response.facets[db_facet.field]:
+            values.append(
+                {
+                    "value": value,
+                    "label": formatter(request, value, count)
+                    if formatter
+                    else f"{value} ({count})",
+                    "count": count,
+                    "selected": selected,
+                }
+            )
+        return JsonResponse(
+            {
+                "field": db_facet.field,
+                "label": str(db_facet.label),
+                "values": values,
+                "approximate": db_facet.field
+                in self.faceted_search.get_approximate_facet_names(),
+            }
+        )
+
+    def get_degraded_facet_response(self, db_facet):
+        degraded_responses.inc(view=self.__class__.__name__)
+        return JsonResponse(
+            {"field": db_facet.field, "values": [], "degraded": True}, status=503
+        )
+
+
+class MetricsView(View):
+    """
+    Exposes the indexing metrics in the Prometheus text format. This view is not
+    included in the urls on purpose, hook it up behind whatever protection your
+    scraper setup requires.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            metrics_registry.to_prometheus_text(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
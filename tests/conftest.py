@@ -0,0 +1,23 @@
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from django_oscar_es.fake_backend import store
+
+
+@pytest.fixture(autouse=True)
+def fake_elasticsearch():
+    store.reset()
+    yield store
+    store.reset()
+
+
+@pytest.fixture
+def es_requests():
+    """
+    The (method, path, params, payload) of every request sent to the in-memory
+    backend during the test.
+    """
+    (node,) = connections.get_connection().transport.node_pool.all()
+    node.requests.clear()
+    return node.requests
@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+
+import pytest
+
+from elasticsearch import ApiError, ConnectionError
+
+from django_oscar_es.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(
+        "test",
+        window=10,
+        min_calls=4,
+        error_rate=0.5,
+        slow_rate=0.5,
+        slow_call_duration=1,
+        open_duration=30,
+        half_open_probes=1,
+        clock=clock,
+    )
+
+
+def succeed():
+    return "ok"
+
+
+def fail():
+    raise ConnectionError("Connection refused")
+
+
+def call(breaker, func):
+    try:
+        return breaker.call(func)
+    except (ApiError, ConnectionError):
+        return None
+
+
+def test_opens_on_the_error_rate(breaker):
+    for func in (succeed, fail, succeed):
+        call(breaker, func)
+    # Not enough calls yet.
+    assert breaker.state == CLOSED
+
+    call(breaker, fail)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(succeed)
+
+
+def test_calls_outside_the_window_dont_count(breaker, clock):
+    call(breaker, fail)
+    call(breaker, fail)
+    clock.now = 11
+
+    for func in (succeed, succeed, fail):
+        call(breaker, func)
+
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_the_slow_rate(breaker, clock):
+    def slow():
+        clock.now += 2
+        return "ok"
+
+    for func in (succeed, slow, succeed, slow):
+        assert breaker.call(func) == "ok"
+
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe(breaker, clock):
+    for _ in range(4):
+        call(breaker, fail)
+    assert breaker.state == OPEN
+
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    # A failed probe opens the breaker again.
+    call(breaker, fail)
+    assert breaker.state == OPEN
+
+    clock.now += 30
+    probes = []
+
+    def probe():
+        # Only a single probe is let through at a time.
+        with pytest.raises(CircuitOpenError):
+            breaker.call(succeed)
+        probes.append(breaker.state)
+        return "ok"
+
+    assert breaker.call(probe) == "ok"
+    assert probes == [HALF_OPEN]
+    assert breaker.state == CLOSED
+
+
+def test_bad_requests_dont_count(breaker):
+    def bad_request():
+        raise ApiError("parsing_exception", SimpleNamespace(status=400), {})
+
+    for _ in range(4):
+        call(breaker, bad_request)
+
+    assert breaker.state == CLOSED
+    assert not breaker.calls
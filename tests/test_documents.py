@@ -0,0 +1,122 @@
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from oscar.core.loading import get_model
+
+from django_oscar_es import documents, indexing, routing
+from django_oscar_es.settings import get_product_document
+
+pytestmark = pytest.mark.django_db
+
+Category = get_model("catalogue", "Category")
+Product = get_model("catalogue", "Product")
+ProductCategory = get_model("catalogue", "ProductCategory")
+ProductClass = get_model("catalogue", "ProductClass")
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+
+
+@pytest.fixture
+def root_category_routing(monkeypatch):
+    monkeypatch.setattr(routing, "_routing", routing.RootCategoryRouting())
+
+
+@pytest.fixture
+def skip_unchanged(monkeypatch):
+    monkeypatch.setattr(documents, "SKIP_UNCHANGED_DOCUMENTS", True)
+    monkeypatch.setattr(indexing, "_new_indices", set())
+
+
+def test_deleting_a_routed_product_deletes_it_by_id(
+    root_category_routing, es_requests
+):
+    product = Product.objects.create(
+        product_class=ProductClass.objects.create(name="Shoes"), title="Red shoe"
+    )
+    ProductCategory.objects.create(
+        product=product, category=Category.add_root(name="Shoes")
+    )
+    document = get_product_document()()
+    document.update(product, refresh=True)
+    index_name = document._index._name
+    client = connections.get_connection()
+    assert client.count(index=index_name)["count"] == 1
+
+    es_requests.clear()
+    product.delete()
+
+    # The categories (and so the routing value) are gone by the time the
+    # document is deleted.
+    paths = [path for _, path, _, _ in es_requests]
+    assert f"/{index_name}/_delete_by_query" in paths
+    assert not [path for path in paths if path.endswith("_bulk")]
+    assert client.count(index=index_name)["count"] == 0
+
+
+def test_stock_updated_is_annotated(django_assert_num_queries):
+    parent = Product.objects.create(
+        product_class=ProductClass.objects.create(name="Shoes"),
+        title="Shoe",
+        structure=Product.PARENT,
+    )
+    child = Product.objects.create(parent=parent, structure=Product.CHILD)
+    stockrecord = StockRecord.objects.create(
+        product=child,
+        partner=Partner.objects.create(name="Warehouse"),
+        partner_sku="shoe-42",
+    )
+
+    document = get_product_document()()
+    parent = document.get_queryset().get(pk=parent.pk)
+    with django_assert_num_queries(0):
+        assert document.prepare_stock_updated(parent) == stockrecord.date_updated
+
+
+def get_paths(es_requests):
+    return [path.rsplit("/", 1)[-1] for _, path, _, _ in es_requests]
+
+
+def test_unchanged_documents_are_skipped(skip_unchanged, es_requests):
+    product = Product.objects.create(
+        product_class=ProductClass.objects.create(name="Shoes"), title="Red shoe"
+    )
+    document = get_product_document()()
+    document.update(product, refresh=True)
+
+    es_requests.clear()
+    document.update(product, refresh=True)
+    assert get_paths(es_requests) == ["_mget"]
+
+    es_requests.clear()
+    product.title = "Blue shoe"
+    document.update(product, refresh=True)
+    assert get_paths(es_requests) == ["_mget", "_bulk"]
+
+
+def test_content_hash_table_replaces_the_lookup(skip_unchanged, es_requests):
+    product = Product.objects.create(
+        product_class=ProductClass.objects.create(name="Shoes"), title="Red shoe"
+    )
+    document = get_product_document()()
+    document.content_hash_table = {}
+
+    es_requests.clear()
+    document.update(product, refresh=True)
+    document.update(product, refresh=True)
+
+    assert get_paths(es_requests) == ["_bulk"]
+    assert list(document.content_hash_table) == [str(product.pk)]
+
+
+def test_new_generations_arent_compared(skip_unchanged, es_requests):
+    product = Product.objects.create(
+        product_class=ProductClass.objects.create(name="Shoes"), title="Red shoe"
+    )
+    document = get_product_document()()
+    document.target_index = "products-new"
+
+    es_requests.clear()
+    document.update(product, refresh=True)
+
+    assert get_paths(es_requests) == ["_bulk"]
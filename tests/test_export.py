@@ -0,0 +1,70 @@
+import csv
+import io
+
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from django_oscar_es import export
+from django_oscar_es.export import JsonLinesWriter, ProductExporter, export_products
+from django_oscar_es.settings import get_product_document
+
+
+@pytest.fixture
+def products():
+    client = connections.get_connection()
+    index = get_product_document()._index._name
+    for i in range(25):
+        client.index(
+            index=index,
+            id=str(i),
+            document={"id": i, "title": f"Shoe {i}", "is_public": i % 5 != 0},
+        )
+    client.indices.refresh(index=index)
+
+
+def test_sliced_export_reads_every_document_once(products):
+    # A buffer smaller than a page makes the readers wait for the consumer.
+    sources = list(ProductExporter(slices=3, size=4, buffer_size=2))
+
+    assert sorted(source["id"] for source in sources) == list(range(25))
+
+
+def test_csv_export_of_the_matching_products(products):
+    stream = io.StringIO()
+
+    count = export_products(
+        stream,
+        output_format="csv",
+        fields=["id", "title"],
+        query={"term": {"is_public": True}},
+        slices=2,
+        size=3,
+    )
+
+    assert count == 20
+    header, *rows = csv.reader(io.StringIO(stream.getvalue()))
+    assert header == ["id", "title"]
+    assert sorted(int(row[0]) for row in rows) == [i for i in range(25) if i % 5]
+    assert ["1", "Shoe 1"] in rows
+
+
+def test_json_lines_projection_of_dotted_fields():
+    stream = io.StringIO()
+
+    JsonLinesWriter(stream, ["id", "attributes.colour", "price"]).write(
+        {"id": 1, "title": "Shoe", "attributes": {"colour": "red"}}
+    )
+
+    assert stream.getvalue() == '{"id":1,"attributes.colour":"red","price":null}\n'
+
+
+def test_a_failing_reader_stops_the_export(products, monkeypatch):
+    def scan_point_in_time(pit_id, slice_id, **kwargs):
+        yield {"_source": {"id": slice_id}}
+        raise RuntimeError("Search failed")
+
+    monkeypatch.setattr(export, "scan_point_in_time", scan_point_in_time)
+
+    with pytest.raises(RuntimeError):
+        list(ProductExporter(slices=2, buffer_size=1))
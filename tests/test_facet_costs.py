@@ -0,0 +1,62 @@
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from oscar.core.loading import get_model
+
+from django_oscar_es import facet_costs
+from django_oscar_es.facet_costs import FacetCostPreview
+from django_oscar_es.settings import get_product_document
+
+pytestmark = pytest.mark.django_db
+
+ProductFacet = get_model("django_oscar_es", "ProductFacet")
+ProductFacetRangeOption = get_model("django_oscar_es", "ProductFacetRangeOption")
+
+
+@pytest.fixture
+def products():
+    client = connections.get_connection()
+    index = get_product_document()._index._name
+    for i in range(10):
+        client.index(
+            index=index,
+            id=str(i),
+            document={
+                "id": i,
+                "is_public": i != 9,
+                "upc": f"upc-{i}",
+                "colour": "red" if i % 2 else "blue",
+                "price": i * 10,
+            },
+        )
+    client.indices.refresh(index=index)
+
+
+def test_preview_of_pending_facets(products, monkeypatch):
+    monkeypatch.setattr(facet_costs, "FACET_CARDINALITY_WARNING", 5)
+    # The facets aren't saved, like the pending facets of the dashboard form.
+    upc = ProductFacet(field="upc", size=20)
+    colour = ProductFacet(field="colour", approximate=True)
+    price = ProductFacet(field="price", facet_type=ProductFacet.FACET_TYPE_RANGE)
+    range_options = [
+        ProductFacetRangeOption(facet=price, label="Cheap", to_value="50"),
+        ProductFacetRangeOption(facet=price, label="Expensive", from_value="50"),
+    ]
+
+    costs = FacetCostPreview().run([(upc, []), (colour, []), (price, range_options)])
+
+    costs = {cost.name: cost for cost in costs}
+    assert (costs["upc"].cardinality, costs["upc"].buckets) == (9, 9)
+    assert costs["upc"].warnings == ["cardinality"]
+    # The buckets of a sampled facet are counted as well.
+    assert (costs["colour"].cardinality, costs["colour"].buckets) == (2, 2)
+    assert costs["colour"].warnings == []
+    assert (costs["price"].cardinality, costs["price"].buckets) == (None, 2)
+    for cost in costs.values():
+        assert cost.time_ms >= 0
+        assert cost.response_size > 0
+
+
+def test_preview_without_facets():
+    assert FacetCostPreview().run([]) == []
@@ -0,0 +1,132 @@
+import pytest
+
+from elasticsearch_dsl import TermsFacet
+from elasticsearch_dsl.connections import connections
+
+from django.core.cache import cache
+
+from oscar.core.loading import get_model
+
+from django_oscar_es.faceted_search import CatalogueFacetedSearch, SampledFacet
+from django_oscar_es.settings import get_product_document
+
+pytestmark = pytest.mark.django_db
+
+ProductElasticsearchSettings = get_model(
+    "django_oscar_es", "ProductElasticsearchSettings"
+)
+ProductFacet = get_model("django_oscar_es", "ProductFacet")
+
+
+@pytest.fixture
+def index_documents():
+    client = connections.get_connection()
+    index_name = get_product_document()._index._name
+
+    def index(*documents):
+        for document in documents:
+            client.index(index=index_name, id=str(document["id"]), document=document)
+        client.indices.refresh(index=index_name)
+
+    return index
+
+
+class PopularityFacetedSearch(CatalogueFacetedSearch):
+    rank_feature_boosts = {"popularity": 2.0}
+
+
+class CollapsingFacetedSearch(CatalogueFacetedSearch):
+    collapse_variants = True
+    track_total_hits = True
+
+
+@pytest.fixture
+def colours(index_documents):
+    index_documents(
+        *[
+            {"id": i, "is_public": True, "colour": "red" if i % 2 else "blue"}
+            for i in range(10)
+        ]
+    )
+
+
+def get_ids(response):
+    return [int(hit.meta.id) for hit in response]
+
+
+def test_rank_features_only_boost_the_listing(index_documents):
+    index_documents(
+        {"id": 1, "group_id": 1, "is_public": True, "rank_features": {}},
+        {
+            "id": 2,
+            "group_id": 2,
+            "is_public": True,
+            "rank_features": {"popularity": 10.0},
+        },
+        {"id": 3, "group_id": 3, "is_public": False, "rank_features": {}},
+    )
+
+    response = PopularityFacetedSearch({}).execute()
+
+    # The product without the feature is still listed, after the popular one.
+    assert get_ids(response) == [2, 1]
+
+
+def test_collapsed_results_are_counted_per_group(index_documents):
+    index_documents(
+        {"id": 1, "group_id": 1, "is_public": True, "colour": "red"},
+        {"id": 2, "group_id": 1, "is_public": True, "colour": "blue"},
+        {"id": 3, "group_id": 1, "is_public": True, "colour": "red"},
+        {"id": 4, "group_id": 4, "is_public": True, "colour": "red"},
+        {"id": 5, "group_id": 5, "is_public": True, "colour": "blue"},
+    )
+    colour = TermsFacet(field="colour")
+    faceted_search = CollapsingFacetedSearch(
+        {"colour": colour}, filters={"colour": ["red"]}
+    )
+
+    response = faceted_search.execute()
+
+    assert response.hits.total.value == 3
+    # The paginator counts the groups matching the selected colour.
+    assert faceted_search.total_hits.value == 2
+    assert faceted_search.total_hits.relation == "eq"
+    counts = {key: count for key, count, _ in response.facets.colour}
+    assert counts == {"red": 2, "blue": 2}
+    # The shared facet isn't changed.
+    assert colour._metric is None
+
+
+@pytest.mark.parametrize(
+    "shard_size,approximate_facet_names", [(4, ["colour"]), (20, [])]
+)
+def test_sampled_facet_counts_are_scaled_up(
+    colours, shard_size, approximate_facet_names
+):
+    faceted_search = CatalogueFacetedSearch(
+        {"colour": SampledFacet(TermsFacet(field="colour"), shard_size=shard_size)}
+    )
+
+    response = faceted_search.execute()
+
+    # Either 2 of each colour in a sample of 4 scaled up to the 10 results, or the
+    # exact counts when the sample holds every result.
+    counts = {key: count for key, count, _ in response.facets.colour}
+    assert counts == {"red": 5, "blue": 5}
+    assert faceted_search.get_approximate_facet_names() == approximate_facet_names
+
+
+def test_facets_marked_as_approximate_are_sampled(colours):
+    cache.clear()
+    ProductFacet.objects.create(
+        settings=ProductElasticsearchSettings.load(), field="colour", approximate=True
+    )
+    faceted_search = CatalogueFacetedSearch(
+        {"colour": TermsFacet(field="colour"), "size": TermsFacet(field="size")}
+    )
+
+    faceted_search.execute()
+
+    assert isinstance(faceted_search.facets["colour"], SampledFacet)
+    assert not isinstance(faceted_search.facets["size"], SampledFacet)
+    cache.clear()
@@ -0,0 +1,221 @@
+import pytest
+
+from elasticsearch import NotFoundError
+from elasticsearch_dsl.connections import connections
+
+from django_oscar_es.propagation import (
+    RENAME_ATTRIBUTE_OPTION_SCRIPT,
+    UPDATE_CATEGORY_SCRIPT,
+)
+from django_oscar_es.scanning import point_in_time, scan_point_in_time
+from django_oscar_es.tasks import get_task_progress
+
+INDEX = "fake-backend-test"
+
+
+@pytest.fixture
+def client():
+    return connections.get_connection()
+
+
+@pytest.fixture
+def products(client):
+    for i in range(10):
+        client.index(
+            index=INDEX,
+            id=str(i),
+            document={
+                "id": i,
+                "group_id": i // 3,
+                "title": f"shoe {i}",
+                "rank_features": {"popularity": i + 1},
+            },
+        )
+    client.indices.refresh(index=INDEX)
+
+
+def get_ids(response):
+    return [hit["_id"] for hit in response["hits"]["hits"]]
+
+
+def test_collapse_keeps_the_best_hit_per_group(client, products):
+    response = client.search(
+        index=INDEX,
+        sort=[{"id": "desc"}],
+        collapse={
+            "field": "group_id",
+            "inner_hits": {"name": "best_variant", "size": 1},
+        },
+    )
+
+    assert get_ids(response) == ["9", "8", "5", "2"]
+    # The total still counts every document, not the groups.
+    assert response["hits"]["total"]["value"] == 10
+    hit = response["hits"]["hits"][1]
+    assert hit["fields"] == {"group_id": [2]}
+    assert hit["inner_hits"]["best_variant"]["hits"]["total"]["value"] == 3
+
+
+def test_rank_feature_boosts_the_score(client, products):
+    response = client.search(
+        index=INDEX,
+        query={
+            "bool": {
+                "must": [{"match": {"title": "shoe"}}],
+                "should": [
+                    {"rank_feature": {"field": "rank_features.popularity", "boost": 2}}
+                ],
+            }
+        },
+        size=3,
+    )
+
+    assert get_ids(response) == ["9", "8", "7"]
+
+
+def test_sliced_scan_of_a_point_in_time(client, products):
+    ids = []
+    with point_in_time(INDEX) as pit_id:
+        # Documents indexed after opening the point in time aren't visible.
+        client.index(index=INDEX, id="10", document={"id": 10}, refresh=True)
+        for slice_id in range(3):
+            ids += [
+                hit["_id"]
+                for hit in scan_point_in_time(
+                    pit_id,
+                    sort=[{"id": "asc"}],
+                    size=2,
+                    slice_id=slice_id,
+                    max_slices=3,
+                )
+            ]
+
+    assert sorted(ids, key=int) == [str(i) for i in range(10)]
+    with pytest.raises(NotFoundError):
+        client.search(pit={"id": pit_id})
+
+
+def test_search_after(client, products):
+    response = client.search(index=INDEX, sort=[{"id": "asc"}], size=4)
+    assert response["hits"]["hits"][-1]["sort"] == [3]
+
+    response = client.search(
+        index=INDEX, sort=[{"id": "asc"}], size=4, search_after=[3]
+    )
+    assert get_ids(response) == ["4", "5", "6", "7"]
+
+
+def test_percolate_reports_the_matching_slots(client):
+    for pk, colour in ((1, "red"), (2, "blue")):
+        client.index(
+            index="saved-searches",
+            id=str(pk),
+            document={"query": {"term": {"colour": colour}}, "saved_search_id": pk},
+            refresh=True,
+        )
+
+    response = client.search(
+        index="saved-searches",
+        query={
+            "percolate": {
+                "field": "query",
+                "documents": [
+                    {"colour": "blue"},
+                    {"colour": "red"},
+                    {"colour": "blue"},
+                ],
+            }
+        },
+        sort=[{"saved_search_id": "asc"}],
+    )
+
+    assert [
+        (hit["_source"]["saved_search_id"], hit["fields"]["_percolator_document_slot"])
+        for hit in response["hits"]["hits"]
+    ] == [(1, [1]), (2, [0, 2])]
+
+
+def test_sampler_aggregation(client, products):
+    response = client.search(
+        index=INDEX,
+        size=0,
+        aggs={
+            "sample": {
+                "sampler": {"shard_size": 4},
+                "aggs": {"groups": {"terms": {"field": "group_id"}}},
+            }
+        },
+    )
+
+    sample = response["aggregations"]["sample"]
+    assert sample["doc_count"] == 4
+    assert sum(bucket["doc_count"] for bucket in sample["groups"]["buckets"]) == 4
+
+
+def test_delete_by_query(client, products):
+    response = client.delete_by_query(
+        index=INDEX, query={"ids": {"values": ["1", "2"]}}, conflicts="proceed"
+    )
+
+    assert response["deleted"] == 2
+    assert client.count(index=INDEX)["count"] == 8
+
+
+def test_update_by_query_runs_the_propagation_scripts(client):
+    client.index(
+        index=INDEX,
+        id="1",
+        document={
+            "attributes": {"colour": ["red", "blue"]},
+            "categories": [{"id": 1, "name": "Shoes"}],
+            "content_hash": "abc",
+        },
+        refresh=True,
+    )
+
+    client.update_by_query(
+        index=INDEX,
+        query={"term": {"attributes.colour": "red"}},
+        script={
+            "source": RENAME_ATTRIBUTE_OPTION_SCRIPT,
+            "params": {"code": "colour", "old_value": "red", "new_value": "crimson"},
+        },
+    )
+    client.update_by_query(
+        index=INDEX,
+        script={
+            "source": UPDATE_CATEGORY_SCRIPT,
+            "params": {"id": 1, "values": {"name": "Boots"}},
+        },
+    )
+
+    source = client.get(index=INDEX, id="1")["_source"]
+    assert source["attributes"] == {"colour": ["crimson", "blue"]}
+    assert source["categories"] == [{"id": 1, "name": "Boots"}]
+    assert source["content_hash"] is None
+
+
+def test_reindex_task_and_alias_swap(client, products):
+    client.indices.create(index="products-2")
+    client.indices.update_aliases(
+        actions=[{"add": {"index": INDEX, "alias": "products"}}]
+    )
+
+    response = client.reindex(
+        source={"index": INDEX},
+        dest={"index": "products-2"},
+        wait_for_completion=False,
+    )
+    progress = get_task_progress(client, response["task"])
+    assert progress["completed"]
+    assert progress["created"] == 10
+
+    client.indices.update_aliases(
+        actions=[
+            {"add": {"index": "products-2", "alias": "products"}},
+            {"remove": {"index": INDEX, "alias": "products"}},
+        ]
+    )
+    assert client.indices.exists_alias(name="products")
+    assert list(client.indices.get_alias(name="products")) == ["products-2"]
+    assert client.count(index="products")["count"] == 10
@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from oscar.core.loading import get_model
+
+from django_oscar_es.indexing import is_indexing_suspended, suspend_indexing
+from django_oscar_es.settings import get_product_document
+
+pytestmark = pytest.mark.django_db
+
+Partner = get_model("partner", "Partner")
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+StockRecord = get_model("partner", "StockRecord")
+
+
+@pytest.fixture
+def document():
+    return get_product_document()()
+
+
+@pytest.fixture
+def product(document):
+    product = Product.objects.create(
+        product_class=ProductClass.objects.create(name="Shoes"),
+        title="Red shoe",
+        upc="red",
+        is_public=True,
+    )
+    document.update(product, refresh=True)
+    return product
+
+
+def create_stockrecord(product, num_in_stock=5):
+    return StockRecord.objects.create(
+        product=product,
+        partner=Partner.objects.create(name="Warehouse"),
+        partner_sku=product.upc,
+        price=Decimal("10.00"),
+        num_in_stock=num_in_stock,
+    )
+
+
+def get_source(document, product):
+    client = connections.get_connection()
+    return client.get(index=document._index._name, id=str(product.pk))["_source"]
+
+
+def get_bulk_payloads(es_requests):
+    return [payload for _, path, _, payload in es_requests if path.endswith("/_bulk")]
+
+
+def test_stockrecord_changes_send_a_partial_update(
+    document, product, es_requests, django_capture_on_commit_callbacks
+):
+    es_requests.clear()
+    with django_capture_on_commit_callbacks(execute=True):
+        stockrecord = create_stockrecord(product)
+        # Changes within a transaction are sent at once.
+        stockrecord.num_in_stock = 4
+        stockrecord.save()
+
+    (payload,) = get_bulk_payloads(es_requests)
+    action, update = payload
+    assert action["update"]["_id"] == str(product.pk)
+    assert set(update["doc"]) == set(document.stock_fields)
+    source = get_source(document, product)
+    assert source["title"] == "Red shoe"
+    assert source["num_in_stock"] == 4
+    assert source["is_available"]
+
+
+def test_stock_update_of_a_missing_document_indexes_it(
+    document, product, es_requests, django_capture_on_commit_callbacks
+):
+    client = connections.get_connection()
+    client.delete(index=document._index._name, id=str(product.pk), refresh=True)
+    es_requests.clear()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        create_stockrecord(product)
+
+    partial, full = get_bulk_payloads(es_requests)
+    assert "update" in partial[0]
+    assert "index" in full[0]
+    source = get_source(document, product)
+    assert source["title"] == "Red shoe"
+    assert source["num_in_stock"] == 5
+
+
+def test_suspend_indexing_indexes_in_bulk_when_the_outer_block_exits(
+    document, es_requests, django_capture_on_commit_callbacks
+):
+    product_class = ProductClass.objects.create(name="Shoes")
+    old = Product.objects.create(product_class=product_class, title="Old shoe")
+    document.update(old, refresh=True)
+    es_requests.clear()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with suspend_indexing():
+            with suspend_indexing():
+                red = Product.objects.create(
+                    product_class=product_class, title="Red shoe"
+                )
+            # Leaving a nested block doesn't flush anything.
+            assert is_indexing_suspended()
+            blue = Product.objects.create(
+                product_class=product_class, title="Blue shoe"
+            )
+            red.title = "Crimson shoe"
+            red.save()
+            old.delete()
+        # Nothing is sent before the transaction commits.
+        assert not es_requests
+
+    assert len(get_bulk_payloads(es_requests)) == 1
+    assert not is_indexing_suspended()
+    client = connections.get_connection()
+    index = document._index._name
+    assert client.count(index=index)["count"] == 2
+    assert get_source(document, red)["title"] == "Crimson shoe"
+    assert get_source(document, blue)["title"] == "Blue shoe"
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.connections import connections
+
+from django.core.paginator import EmptyPage
+
+from django_oscar_es.paginator import TotalHitsPaginator
+
+INDEX = "paginator-test"
+
+
+@pytest.fixture
+def documents():
+    client = connections.get_connection()
+    for i in range(12):
+        client.index(index=INDEX, id=str(i), document={"number": i})
+    client.indices.refresh(index=INDEX)
+
+
+def get_paginator(track_total_hits, per_page=2):
+    search = Search(index=INDEX).extra(track_total_hits=track_total_hits)
+    faceted_search = SimpleNamespace(
+        track_total_hits=track_total_hits, total_hits=None
+    )
+    return TotalHitsPaginator(search, per_page, faceted_search=faceted_search)
+
+
+def test_count_comes_from_the_page_search(documents, es_requests):
+    paginator = get_paginator(track_total_hits=5)
+    page = paginator.page(2)
+
+    assert len(page.object_list) == 2
+    assert paginator.count == 5
+    assert paginator.is_lower_bound
+    assert paginator.num_pages == 3
+    assert [path for _, path, _, _ in es_requests] == [f"/{INDEX}/_search"]
+
+
+def test_exact_count_below_the_cap(documents, es_requests):
+    paginator = get_paginator(track_total_hits=100)
+    paginator.page(1)
+
+    assert paginator.count == 12
+    assert not paginator.is_lower_bound
+    assert paginator.num_pages == 6
+    assert not [path for _, path, _, _ in es_requests if path.endswith("_count")]
+
+
+def test_pages_beyond_the_cap_are_not_searched(documents, es_requests):
+    paginator = get_paginator(track_total_hits=5)
+
+    with pytest.raises(EmptyPage):
+        paginator.page(4)
+    assert es_requests == []
@@ -0,0 +1,91 @@
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from oscar.core.loading import get_model
+
+from django_oscar_es import propagation
+from django_oscar_es.settings import get_product_document
+
+pytestmark = pytest.mark.django_db
+
+AttributeOption = get_model("catalogue", "AttributeOption")
+AttributeOptionGroup = get_model("catalogue", "AttributeOptionGroup")
+Category = get_model("catalogue", "Category")
+Product = get_model("catalogue", "Product")
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+ProductCategory = get_model("catalogue", "ProductCategory")
+ProductClass = get_model("catalogue", "ProductClass")
+PropagationJob = get_model("django_oscar_es", "PropagationJob")
+
+
+@pytest.fixture
+def catalogue():
+    product_class = ProductClass.objects.create(name="Shoes")
+    group = AttributeOptionGroup.objects.create(name="Colours")
+    red = AttributeOption.objects.create(group=group, option="red")
+    colour = ProductAttribute.objects.create(
+        product_class=product_class,
+        name="Colour",
+        code="colour",
+        type=ProductAttribute.OPTION,
+        option_group=group,
+    )
+    category = Category.add_root(name="Shoes")
+    product = Product.objects.create(product_class=product_class, title="Red shoe")
+    ProductAttributeValue.objects.create(
+        attribute=colour, product=product, value_option=red
+    )
+    ProductCategory.objects.create(product=product, category=category)
+    get_product_document()().update(product, refresh=True)
+    return {"product": product, "red": red, "category": category}
+
+
+def get_source(product):
+    client = connections.get_connection()
+    index = get_product_document()._index._name
+    return client.get(index=index, id=str(product.pk))["_source"]
+
+
+def test_option_rename_runs_an_update_by_query_task(
+    catalogue, django_capture_on_commit_callbacks
+):
+    red = catalogue["red"]
+    with django_capture_on_commit_callbacks(execute=True):
+        red.option = "crimson"
+        red.save()
+
+    (job,) = PropagationJob.objects.all()
+    assert job.strategy == propagation.STRATEGY_UPDATE_BY_QUERY
+    assert job.status == PropagationJob.STATUS_RUNNING
+    assert get_source(catalogue["product"])["attributes"] == {"colour": "crimson"}
+
+    assert propagation.check_propagation_tasks() == []
+    job.refresh_from_db()
+    assert job.status == PropagationJob.STATUS_COMPLETED
+    assert job.updated == 1
+
+
+def test_category_rename_is_scheduled_as_a_bulk_job(
+    catalogue, monkeypatch, django_capture_on_commit_callbacks
+):
+    monkeypatch.setattr(propagation, "PROPAGATION_STRATEGY", propagation.STRATEGY_BULK)
+    monkeypatch.setattr(propagation, "PROPAGATION_REQUESTS_PER_SECOND", 0)
+    category = catalogue["category"]
+    with django_capture_on_commit_callbacks(execute=True):
+        category.name = "Sneakers"
+        category.save()
+
+    # The request only schedules the job.
+    (job,) = PropagationJob.objects.all()
+    assert job.status == PropagationJob.STATUS_PENDING
+    product = catalogue["product"]
+    assert job.product_ids == [product.pk]
+    assert get_source(product)["categories"][0]["name"] == "Shoes"
+
+    assert propagation.run_pending_propagation_jobs() == [job]
+    job.refresh_from_db()
+    assert job.status == PropagationJob.STATUS_COMPLETED
+    assert job.updated == 1
+    assert get_source(product)["categories"][0]["name"] == "Sneakers"
@@ -0,0 +1,61 @@
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from django_oscar_es.models import SavedSearch
+from django_oscar_es.saved_searches import index_saved_search, percolate_products
+from django_oscar_es.settings import SAVED_SEARCH_INDEX, get_product_document
+from django_oscar_es.signals import saved_search_matched
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def client():
+    return connections.get_connection()
+
+
+@pytest.fixture
+def matched():
+    signalled = []
+
+    def receiver(sender, saved_search, product_ids, **kwargs):
+        signalled.append((saved_search.pk, product_ids))
+
+    saved_search_matched.connect(receiver)
+    yield signalled
+    saved_search_matched.disconnect(receiver)
+
+
+def test_saved_search_index_is_created_with_the_percolator_mapping(client):
+    index_saved_search(SavedSearch.objects.create(query={"match_all": {}}))
+
+    mapping = client.indices.get_mapping(index=SAVED_SEARCH_INDEX)
+    properties = mapping[SAVED_SEARCH_INDEX]["mappings"]["properties"]
+    assert properties["query"] == {"type": "percolator"}
+
+
+def test_only_new_matches_are_signalled(client, matched):
+    saved_search = SavedSearch.objects.create(
+        query={"bool": {"filter": [{"term": {"upc": "red"}}]}}
+    )
+    index_saved_search(saved_search)
+    client.indices.refresh(index=SAVED_SEARCH_INDEX)
+    index_name = get_product_document()._index._name
+
+    def index_product(upc):
+        client.index(
+            index=index_name, id="1", document={"id": 1, "upc": upc}, refresh=True
+        )
+
+    index_product("red")
+    percolate_products([1])
+    # Eg; a stock update of a product that already matched.
+    percolate_products([1])
+    assert matched == [(saved_search.pk, [1])]
+
+    index_product("blue")
+    percolate_products([1])
+    index_product("red")
+    percolate_products([1])
+    assert matched == [(saved_search.pk, [1]), (saved_search.pk, [1])]
@@ -0,0 +1,89 @@
+import pytest
+
+from elasticsearch_dsl.connections import connections
+
+from django.core.cache import cache
+
+from oscar.core.loading import get_model
+
+from django_oscar_es import schema
+from django_oscar_es.settings import get_product_document
+
+pytestmark = pytest.mark.django_db
+
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductClass = get_model("catalogue", "ProductClass")
+
+
+@pytest.fixture
+def attributes_field():
+    attributes_field = get_product_document()._doc_type.mapping["attributes"]
+    properties = attributes_field.properties
+    yield attributes_field
+    attributes_field.properties = properties
+    cache.delete(schema.ATTRIBUTE_PROPERTIES_CACHE_KEY)
+    schema.bump_mapping_version()
+    schema.expire_mapping_version_check()
+
+
+def test_mapping_version_is_read_once_per_interval(monkeypatch):
+    monkeypatch.setattr(schema, "MAPPING_VERSION_CHECK_INTERVAL", 60)
+    schema.expire_mapping_version_check()
+    version = schema.sync_mapping_version()
+
+    reads = []
+    monkeypatch.setattr(
+        schema, "get_mapping_version", lambda: reads.append(True) or version
+    )
+    schema.get_search_field_choices()
+    schema.get_facet_field_choices()
+    assert reads == []
+
+    # A change made by this process is picked up right away.
+    schema.refresh_attribute_properties()
+    schema.sync_mapping_version()
+    assert reads == [True]
+    cache.delete(schema.ATTRIBUTE_PROPERTIES_CACHE_KEY)
+
+
+def test_new_attributes_are_added_to_the_mapping(
+    attributes_field, django_capture_on_commit_callbacks
+):
+    index = get_product_document()._index._name
+    client = connections.get_connection()
+    client.indices.create(
+        index=index,
+        mappings={
+            "properties": {"attributes": {"properties": {"size": {"type": "keyword"}}}}
+        },
+    )
+    product_class = ProductClass.objects.create(name="Shoes")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for code, attribute_type in (
+            ("colour", ProductAttribute.TEXT),
+            ("size", ProductAttribute.INTEGER),
+        ):
+            ProductAttribute.objects.create(
+                product_class=product_class,
+                name=code,
+                code=code,
+                type=attribute_type,
+            )
+
+    # The attribute that is already mapped with another type is left alone.
+    assert schema.get_live_attribute_properties() == {
+        "colour": {"type": "keyword"},
+        "size": {"type": "keyword"},
+    }
+    assert attributes_field.properties == {
+        "colour": {"type": "keyword"},
+        "size": {"type": "keyword"},
+    }
+    choices = schema.get_facet_field_choices()
+    assert ("attributes.colour", "attributes.colour") in choices
+
+    diff = schema.sync_attribute_mapping(dry_run=True)
+    assert not diff.added
+    assert diff.conflicts == {"size": ("keyword", "integer")}
+    assert diff.get_conflicting_product_ids() == []
@@ -0,0 +1,65 @@
+import pytest
+
+from oscar.core.loading import get_model
+
+from django_oscar_es.search_analytics import SearchAnalyticsRecorder
+
+SearchQueryStat = get_model("django_oscar_es", "SearchQueryStat")
+
+
+class FailingRecorder(SearchAnalyticsRecorder):
+    def ensure_thread(self):
+        pass
+
+    def write(self, buffer):
+        # A search recorded while the write is in progress.
+        self.record("Shoes", 0)
+        raise RuntimeError("Database unavailable")
+
+
+def test_failed_flush_keeps_the_buffered_queries():
+    recorder = FailingRecorder()
+    recorder.record("shoes", 3)
+    recorder.record("boots", 1)
+
+    with pytest.raises(RuntimeError):
+        recorder.flush()
+
+    assert sorted(recorder.buffer) == ["boots", "shoes"]
+    shoes = recorder.buffer["shoes"]
+    assert shoes.num_searches == 2
+    assert shoes.num_zero_results == 1
+    assert shoes.total_results == 3
+
+
+def test_failed_flushes_keep_at_most_max_buffer_queries():
+    recorder = FailingRecorder(max_buffer=2)
+    recorder.record("shoes", 3)
+    recorder.record("boots", 1)
+    recorder.record("sandals", 2)
+
+    with pytest.raises(RuntimeError):
+        recorder.flush()
+
+    # The least recently searched query is dropped.
+    assert sorted(recorder.buffer) == ["sandals", "shoes"]
+
+
+@pytest.mark.django_db
+def test_write_increments_the_existing_stats():
+    SearchQueryStat.objects.create(
+        query="shoes", num_searches=2, num_zero_results=1, total_results=5
+    )
+    recorder = SearchAnalyticsRecorder()
+    recorder.ensure_thread = lambda: None
+    recorder.record("Shoes", 3)
+    recorder.record("boots", 0)
+
+    recorder.flush()
+
+    stats = {stat.query: stat for stat in SearchQueryStat.objects.all()}
+    assert sorted(stats) == ["boots", "shoes"]
+    assert stats["shoes"].num_searches == 3
+    assert stats["shoes"].num_zero_results == 1
+    assert stats["shoes"].total_results == 8
+    assert stats["boots"].num_zero_results == 1
@@ -0,0 +1,40 @@
+import pytest
+
+from django.db import transaction
+
+from django_oscar_es.utils import on_commit_once
+
+pytestmark = pytest.mark.django_db
+
+
+def test_on_commit_once_runs_once_per_transaction(
+    django_capture_on_commit_callbacks,
+):
+    calls = []
+
+    def func():
+        calls.append(1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for _ in range(3):
+            on_commit_once(func)
+    assert calls == [1]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        on_commit_once(func)
+    assert calls == [1, 1]
+
+
+def test_on_commit_once_after_a_rollback(django_capture_on_commit_callbacks):
+    calls = []
+
+    def func():
+        calls.append(1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(RuntimeError), transaction.atomic():
+            on_commit_once(func)
+            raise RuntimeError
+        on_commit_once(func)
+
+    assert calls == [1]
@@ -0,0 +1,175 @@
+import pytest
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from oscar.core.loading import get_model
+
+from django_oscar_es import views
+from django_oscar_es.circuit_breaker import CircuitBreaker
+from django_oscar_es.settings import get_product_document
+
+pytestmark = pytest.mark.django_db
+
+Category = get_model("catalogue", "Category")
+Product = get_model("catalogue", "Product")
+ProductCategory = get_model("catalogue", "ProductCategory")
+ProductClass = get_model("catalogue", "ProductClass")
+ProductElasticsearchSettings = get_model(
+    "django_oscar_es", "ProductElasticsearchSettings"
+)
+ProductFacet = get_model("django_oscar_es", "ProductFacet")
+ProductFacetRangeOption = get_model("django_oscar_es", "ProductFacetRangeOption")
+ProductSearchField = get_model("django_oscar_es", "ProductSearchField")
+
+
+@pytest.fixture
+def catalogue():
+    cache.clear()
+    es_settings = ProductElasticsearchSettings.load()
+    ProductSearchField.objects.create(settings=es_settings, field="title")
+    ProductFacet.objects.create(settings=es_settings, field="upc", label="UPC")
+
+    product_class = ProductClass.objects.create(name="Shoes")
+    shoes = Category.add_root(name="Shoes")
+    boots = Category.add_root(name="Boots")
+    products = {}
+    for upc, title, category in (
+        ("red", "Red shoe", shoes),
+        ("blue", "Blue shoe", shoes),
+        ("brown", "Brown boot", boots),
+    ):
+        product = Product.objects.create(
+            product_class=product_class, title=title, upc=upc, is_public=True
+        )
+        ProductCategory.objects.create(product=product, category=category)
+        products[upc] = product
+
+    document = get_product_document()()
+    document.update(Product.objects.all(), refresh=True)
+    yield {"products": products, "shoes": shoes, "boots": boots}
+    cache.clear()
+
+
+@pytest.fixture
+def circuit_breaker(monkeypatch):
+    breaker = CircuitBreaker("test", min_calls=1)
+    monkeypatch.setattr(views.BaseCatalogueView, "circuit_breaker", breaker)
+    return breaker
+
+
+def get_ids(response):
+    return sorted(product.id for product in response.context["products"])
+
+
+def test_catalogue_lists_all_products(client, catalogue):
+    response = client.get(reverse("django_oscar_es:catalogue-root"))
+
+    assert response.status_code == 200
+    assert get_ids(response) == sorted(
+        product.pk for product in catalogue["products"].values()
+    )
+
+
+def test_category_lists_the_products_of_the_category(client, catalogue):
+    category = catalogue["shoes"]
+    response = client.get(
+        reverse(
+            "django_oscar_es:category",
+            kwargs={"category_slug": category.full_slug, "pk": category.pk},
+        )
+    )
+
+    assert response.status_code == 200
+    assert response.context["category"] == category
+    products = catalogue["products"]
+    assert get_ids(response) == sorted([products["red"].pk, products["blue"].pk])
+
+
+def test_search_with_a_selected_facet(client, catalogue):
+    response = client.get(reverse("django_oscar_es:search"), {"q": "shoe"})
+    products = catalogue["products"]
+    assert get_ids(response) == sorted([products["red"].pk, products["blue"].pk])
+
+    response = client.get(
+        reverse("django_oscar_es:search"), {"q": "shoe", "upc": "red"}
+    )
+
+    assert response.status_code == 200
+    assert get_ids(response) == [products["red"].pk]
+    assert response.context["paginator"].count == 1
+
+
+def test_search_records_only_new_searches(client, catalogue, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(views.SearchView, "search_analytics", True)
+    monkeypatch.setattr(
+        views, "record_search", lambda query, count: recorded.append((query, count))
+    )
+    url = reverse("django_oscar_es:search")
+
+    client.get(url, {"q": "shoe"})
+    client.get(url, {"q": "shoe", "upc": "red"})
+
+    assert recorded == [("shoe", 2)]
+
+
+def test_degraded_response_serves_the_cached_results(
+    client, catalogue, circuit_breaker, es_requests
+):
+    products = catalogue["products"]
+    url = reverse("django_oscar_es:search")
+    response = client.get(url, {"q": "shoe", "utm_source": "newsletter"})
+    assert not response.context.get("degraded")
+
+    circuit_breaker.record(0, failed=True)
+    es_requests.clear()
+    response = client.get(url, {"utm_medium": "email", "q": "shoe"})
+
+    assert response.status_code == 200
+    assert response.context["degraded"]
+    assert get_ids(response) == sorted([products["red"].pk, products["blue"].pk])
+    assert not es_requests
+
+    # Nothing is cached for this search, and it isn't searched in the database.
+    response = client.get(url, {"q": "boot"})
+    assert response.context["degraded"]
+    assert get_ids(response) == []
+
+
+def test_facet_values_only_aggregates_the_facet(client, catalogue, es_requests):
+    es_settings = ProductElasticsearchSettings.load()
+    price = ProductFacet.objects.create(
+        settings=es_settings, field="price", facet_type=ProductFacet.FACET_TYPE_RANGE
+    )
+    ProductFacetRangeOption.objects.create(
+        facet=price, label="Up to 100", from_value="0", to_value="100"
+    )
+    upc = ProductFacet.objects.get(field="upc")
+    es_requests.clear()
+
+    response = client.get(
+        reverse("django_oscar_es:facet-values", kwargs={"facet_pk": upc.pk}),
+        {"q": "shoe", "category": catalogue["shoes"].pk},
+    )
+
+    assert response.status_code == 200
+    assert sorted(value["value"] for value in response.json()["values"]) == [
+        "blue",
+        "red",
+    ]
+    (payload,) = [
+        payload for _, path, _, payload in es_requests if path.endswith("/_search")
+    ]
+    assert list(payload["aggs"]) == ["_filter_upc"]
+
+
+def test_facet_values_with_an_invalid_category(client, catalogue):
+    upc = ProductFacet.objects.get(field="upc")
+
+    response = client.get(
+        reverse("django_oscar_es:facet-values", kwargs={"facet_pk": upc.pk}),
+        {"category": "shoes"},
+    )
+
+    assert response.status_code == 404